@@ -0,0 +1,33 @@
+"""Entity content trigram index
+
+Revision ID: 2d1f6f5a8b3c
+Revises: b939aa2120fa
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2d1f6f5a8b3c'
+down_revision = 'b939aa2120fa'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade():
+    # Trigram index allows substring LIKE search and similarity ranking of entity content without
+    # sequential scans of the entity table.
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Entity table is large, so the index is built concurrently to keep it writable meanwhile, which
+    # can't be done inside the migration transaction.
+    op.execute("COMMIT")
+    op.create_index('entity_content_trgm_idx', 'entity', ['content'],
+                    postgresql_using='gin',
+                    postgresql_ops={'content': 'gin_trgm_ops'},
+                    postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('entity_content_trgm_idx', table_name='entity')
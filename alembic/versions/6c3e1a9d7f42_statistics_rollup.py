@@ -0,0 +1,45 @@
+"""Statistics rollup
+
+Revision ID: 6c3e1a9d7f42
+Revises: 2d1f6f5a8b3c
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6c3e1a9d7f42'
+down_revision = '2d1f6f5a8b3c'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from lingvodoc.models import SLBigInteger
+
+
+def upgrade():
+    # Rollup is filled lazily on statistics requests and by the backfill script
+    # (backfill_statistics_rollup).
+    op.create_table('statisticsrollup',
+                    sa.Column('id', SLBigInteger(), nullable=False),
+                    sa.Column('perspective_client_id', SLBigInteger(), nullable=False),
+                    sa.Column('perspective_object_id', SLBigInteger(), nullable=False),
+                    sa.Column('field_client_id', SLBigInteger(), nullable=True),
+                    sa.Column('field_object_id', SLBigInteger(), nullable=True),
+                    sa.Column('client_id', SLBigInteger(), nullable=False),
+                    sa.Column('day', SLBigInteger(), nullable=False),
+                    sa.Column('published', sa.Boolean(), nullable=True),
+                    sa.Column('count', SLBigInteger(), nullable=False),
+                    sa.PrimaryKeyConstraint('id'))
+    op.create_index('statisticsrollup_perspective_day_idx', 'statisticsrollup',
+                    ['perspective_client_id', 'perspective_object_id', 'day'])
+    op.create_table('statisticsrollupperspective',
+                    sa.Column('perspective_client_id', SLBigInteger(), nullable=False),
+                    sa.Column('perspective_object_id', SLBigInteger(), nullable=False),
+                    sa.PrimaryKeyConstraint('perspective_client_id', 'perspective_object_id'))
+
+
+def downgrade():
+    op.drop_table('statisticsrollupperspective')
+    op.drop_index('statisticsrollup_perspective_day_idx', table_name='statisticsrollup')
+    op.drop_table('statisticsrollup')
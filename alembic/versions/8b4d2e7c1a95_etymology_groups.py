@@ -0,0 +1,37 @@
+"""Etymology groups
+
+Revision ID: 8b4d2e7c1a95
+Revises: 6c3e1a9d7f42
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8b4d2e7c1a95'
+down_revision = '6c3e1a9d7f42'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from lingvodoc.models import SLBigInteger
+
+
+def upgrade():
+    # Groups are materialized lazily on connected words lookups and when lexical entries are grouped.
+    op.create_table('etymologygroup',
+                    sa.Column('field_client_id', SLBigInteger(), nullable=False),
+                    sa.Column('field_object_id', SLBigInteger(), nullable=False),
+                    sa.Column('entry_client_id', SLBigInteger(), nullable=False),
+                    sa.Column('entry_object_id', SLBigInteger(), nullable=False),
+                    sa.Column('group_client_id', SLBigInteger(), nullable=False),
+                    sa.Column('group_object_id', SLBigInteger(), nullable=False),
+                    sa.PrimaryKeyConstraint('field_client_id', 'field_object_id',
+                                            'entry_client_id', 'entry_object_id'))
+    op.create_index('etymologygroup_group_idx', 'etymologygroup',
+                    ['field_client_id', 'field_object_id', 'group_client_id', 'group_object_id'])
+
+
+def downgrade():
+    op.drop_index('etymologygroup_group_idx', table_name='etymologygroup')
+    op.drop_table('etymologygroup')
@@ -5,12 +5,15 @@ from configparser import (
 )
 
 from sqlalchemy import engine_from_config
+from sqlalchemy.exc import SQLAlchemyError
+import transaction
 from pyramid.authentication import AuthTktAuthenticationPolicy
 from pyramid.authorization import ACLAuthorizationPolicy
 
 from .models import (
     DBSession,
     Base,
+    TranslationGist
 )
 from lingvodoc.cache.caching import (
     initialize_cache
@@ -104,6 +107,7 @@ def configure_routes(config):
     config.add_route(name='all_toc', pattern='/sync/toc')
     config.add_route(name='diff_server', pattern='/sync/difference/server')
     config.add_route(name='diff_group_server', pattern='/sync/difference/server/group')
+    config.add_route(name='diff_summary_server', pattern='/sync/difference/server/summary')
     config.add_route(name='diff_desk', pattern='/sync/difference')
     config.add_route(name='basic_sync_server', pattern='/sync/basic/server')
     config.add_route(name='delete_sync_server', pattern='/sync/delete/server')
@@ -519,6 +523,18 @@ def configure_routes(config):
                              '/perspective/{perspective_client_id}/{perspective_object_id}/published_count',
                      factory='lingvodoc.models.PerspectivePublishAcl')
 
+    # streaming newline-delimited JSON export of lexical entries, resumable by the id of the last
+    # received entry
+    config.add_route(name='lexical_entries_all_stream',
+                     pattern='/dictionary/{dictionary_client_id}/{dictionary_object_id}'
+                             '/perspective/{perspective_client_id}/{perspective_object_id}/all_stream',
+                     factory='lingvodoc.models.LexicalEntriesEntitiesAcl')
+
+    config.add_route(name='lexical_entries_published_stream',
+                     pattern='/dictionary/{dictionary_client_id}/{dictionary_object_id}'
+                             '/perspective/{perspective_client_id}/{perspective_object_id}/published_stream',
+                     factory='lingvodoc.models.PerspectivePublishAcl')
+
     config.add_route(name='lexical_entries_not_accepted_count',
                      pattern='/dictionary/{dictionary_client_id}/{dictionary_object_id}'
                              '/perspective/{perspective_client_id}/{perspective_object_id}/not_accepted_count')
@@ -644,6 +660,15 @@ def configure_routes(config):
         pattern = '/merge/suggestions/{perspective_client_id}/{perspective_object_id}',
         factory = 'lingvodoc.models.LexicalEntriesEntitiesAcl')
 
+    # API #POST
+    #
+    # Launches background merge suggestions task, parameters are the same as of 'merge_suggestions'
+    # route. Merge suggestions are saved as a JSON file with a link in the task status.
+    #
+    config.add_route(name = 'merge_suggestions_async',
+        pattern = '/merge/suggestions_async/{perspective_client_id}/{perspective_object_id}',
+        factory = 'lingvodoc.models.LexicalEntriesEntitiesAcl')
+
     # API #POST
     # {'group_list': <group_list>, 'publish_any': bool}
     #
@@ -843,6 +868,13 @@ def main(global_config, **settings):
         initialize_cache(cache_kwargs)
         settings['cache_kwargs'] = cache_kwargs
 
+    # Populating registry of service translation gists, so that requests do not have to look them up.
+    try:
+        with transaction.manager:
+            TranslationGist.get_service_gists()
+    except SQLAlchemyError:
+        log.warn("Failed to load service translation gists; they will be loaded on first use")
+
     config = Configurator(settings=settings)
 
 
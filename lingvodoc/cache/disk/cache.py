@@ -0,0 +1,53 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from lingvodoc.cache.api.cache import ICache
+
+
+class DiskCache(ICache):
+    """
+    Durable cache storing each value as a pickle file in a directory, survives flushes of the Redis cache.
+
+    Values are written to a temporary file and then renamed, so the cache can be safely shared by multiple
+    processes.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: path of the directory holding cached values
+        :return:
+        """
+        self.directory = directory
+
+    def path(self, key):
+        key_hash = hashlib.sha224(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key_hash[:2], key_hash)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as value_file:
+                return pickle.load(value_file)
+
+        # Missing or damaged values are treated as absent.
+
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        value_path = self.path(key)
+        value_directory = os.path.dirname(value_path)
+
+        os.makedirs(value_directory, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=value_directory, delete=False) as value_file:
+            pickle.dump(value, value_file, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(value_file.name, value_path)
+
+    def rem(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
@@ -53,6 +53,7 @@ from zope.sqlalchemy import ZopeTransactionExtension
 from passlib.hash import bcrypt
 
 import datetime
+import itertools
 
 import json
 
@@ -64,6 +65,10 @@ import logging
 
 import uuid
 
+import transaction
+
+import lingvodoc.cache.caching as caching
+
 from time import sleep
 
 RUSSIAN_LOCALE = 1
@@ -92,7 +97,7 @@ def bi_c(element, compiler, **kw):
 categories = {0: 'lingvodoc.ispras.ru/dictionary',
               1: 'lingvodoc.ispras.ru/corpora'}
 
-from collections import deque
+from collections import defaultdict, deque
 
 
 def entity_content(xx, publish, root, delete_self=False):
@@ -446,6 +451,121 @@ class TranslationGist(CompositeIdMixin, Base, TableNameMixin, CreatedAtMixin, Ma
             return "Translation missing for your locale and fallback locale"
             # TODO: continue iterating to get any translation
 
+    # Ids of service gists (dictionary and perspective states, data types, field names etc.) by their
+    # English content are kept in a registry, which is loaded with a single query, shared through the
+    # cache and versioned in the same way as perspective state sets.
+
+    service_version_key = 'service_gist_version'
+    service_gist_dict = {}
+
+    @classmethod
+    def get_service_version(cls):
+        cache = caching.CACHE
+        version = cache.get(cls.service_version_key) if cache else None
+        if version is None:
+            # Without a shared version the registry of this process stays valid until its invalidation.
+            version = cls.service_gist_dict.get('version') or str(uuid.uuid4())
+            if cache:
+                cache.set(cls.service_version_key, version)
+        return version
+
+    @classmethod
+    def query_service_gists(cls):
+        gist_dict = dict()
+        for content, client_id, object_id in DBSession.query(
+                TranslationAtom.content, TranslationGist.client_id, TranslationGist.object_id).join(
+                TranslationAtom).filter(
+                TranslationAtom.locale_id == 2,
+                TranslationGist.type == 'Service').order_by(TranslationAtom.client_id).all():
+            gist_dict.setdefault(content, (client_id, object_id))
+        return gist_dict
+
+    @classmethod
+    def get_service_gists(cls):
+        """
+        Gets dictionary of (client_id, object_id) ids of service gists by their English content.
+        """
+        cache = caching.CACHE
+        version = cls.get_service_version()
+        if cls.service_gist_dict.get('version') == version:
+            return cls.service_gist_dict['gists']
+        key = 'service_gists:%s' % version
+        gist_dict = cache.get(key) if cache else None
+        if gist_dict is None:
+            gist_dict = cls.query_service_gists()
+            if cache:
+                cache.set(key, gist_dict)
+        cls.service_gist_dict = {'version': version, 'gists': gist_dict}
+        return gist_dict
+
+    @classmethod
+    def get_service_gist_id(cls, content):
+        """
+        Gets (client_id, object_id) id of a service gist by its English content, e.g. 'Published'.
+        """
+        gist_id = cls.get_service_gists().get(content)
+        if gist_id is None:
+            # Gist could have been created after the registry was loaded.
+            gist_id = cls.query_service_gists().get(content)
+            if gist_id is None:
+                raise KeyError("Something wrong with the base", "No result")
+            cls.invalidate_service()
+        return gist_id
+
+    @classmethod
+    def invalidate_service(cls):
+        """
+        Invalidates registry of service gists, immediately and after the current transaction is committed.
+        """
+        def bump_version(*args):
+            cls.service_gist_dict = {}
+            if caching.CACHE:
+                caching.CACHE.set(cls.service_version_key, str(uuid.uuid4()))
+        bump_version()
+        transaction.get().addAfterCommitHook(bump_version)
+
+    @classmethod
+    def get_translations(cls, gist_id_list, locale_id):
+        """
+        Gets translations of multiple gists, given by (client_id, object_id) ids, with the same locale
+        fallback as get_translation, in at most two queries.
+        """
+        main_locale = int(locale_id) if str(locale_id).isdigit() else None
+        fallback_locale = ENGLISH_LOCALE if main_locale != ENGLISH_LOCALE else RUSSIAN_LOCALE
+
+        gist_id_set = set(gist_id_list)
+        if not gist_id_set:
+            return {}
+
+        locale_dict = defaultdict(dict)
+        for client_id, object_id, locale, content in DBSession.query(
+                TranslationAtom.parent_client_id, TranslationAtom.parent_object_id,
+                TranslationAtom.locale_id, TranslationAtom.content).filter(
+                tuple_(TranslationAtom.parent_client_id, TranslationAtom.parent_object_id).in_(gist_id_set),
+                TranslationAtom.locale_id.in_([main_locale, fallback_locale])).all():
+            locale_dict[(client_id, object_id)][locale] = content
+
+        translation_dict = dict()
+        for gist_id in gist_id_set:
+            translations = locale_dict.get(gist_id, {})
+            if translations.get(main_locale) is not None:
+                translation_dict[gist_id] = translations[main_locale]
+            elif translations.get(fallback_locale) is not None:
+                translation_dict[gist_id] = translations[fallback_locale]
+
+        missing_id_set = gist_id_set - set(translation_dict)
+        if missing_id_set:
+            translated_id_set = set(DBSession.query(
+                TranslationAtom.parent_client_id, TranslationAtom.parent_object_id).filter(
+                tuple_(TranslationAtom.parent_client_id, TranslationAtom.parent_object_id).in_(
+                    missing_id_set)).distinct().all())
+            for gist_id in missing_id_set:
+                translation_dict[gist_id] = (
+                    "Translation missing for your locale and fallback locale" if gist_id in translated_id_set else
+                    "Translation missing for all locales")
+
+        return translation_dict
+
 
 class TranslationAtom(CompositeIdMixin, Base, TableNameMixin, RelationshipMixin, CreatedAtMixin, MarkedForDeletionMixin,
                       AdditionalMetadataMixin):
@@ -536,8 +656,61 @@ class DictionaryPerspective(CompositeIdMixin,
     import_source = Column(UnicodeText)
     import_hash = Column(UnicodeText)
 
+    # Sets of deleted and hidden perspectives are shared through the cache under the current perspective
+    # state version, which is changed each time perspective or dictionary deletion or state changes are
+    # committed; each process additionally keeps the sets of the last seen version.
+
+    state_version_key = 'perspective_state_version'
+    state_set_dict = {}
+
+    @classmethod
+    def get_state_version(cls):
+        cache = caching.CACHE
+        version = cache.get(cls.state_version_key) if cache else None
+        if version is None:
+            version = str(uuid.uuid4())
+            if cache:
+                cache.set(cls.state_version_key, version)
+        return version
+
+    @classmethod
+    def get_state_set(cls, name, query_func):
+        cache = caching.CACHE
+        version = cls.get_state_version() if cache else None
+        if version is not None and cls.state_set_dict.get(name, (None, None))[0] == version:
+            return cls.state_set_dict[name][1]
+        key = 'perspective_state:%s:%s' % (name, version)
+        state_set = cache.get(key) if cache else None
+        if state_set is None:
+            state_set = query_func()
+            if cache:
+                cache.set(key, state_set)
+        if version is not None:
+            cls.state_set_dict[name] = (version, state_set)
+        return state_set
+
+    @classmethod
+    def invalidate_state(cls):
+        """
+        Invalidates cached sets of deleted and hidden perspectives, immediately and after the current
+        transaction is committed, so that sets cached in between with uncommitted data are discarded too.
+        """
+        def bump_version(*args):
+            if caching.CACHE:
+                caching.CACHE.set(cls.state_version_key, str(uuid.uuid4()))
+        bump_version()
+        transaction.get().addAfterCommitHook(bump_version)
+
     @classmethod
     def get_deleted(cls):
+        return cls.get_state_set('deleted', cls.query_deleted)
+
+    @classmethod
+    def get_hidden(cls):
+        return cls.get_state_set('hidden', cls.query_hidden)
+
+    @classmethod
+    def query_deleted(cls):
         deleted = DBSession.query(DictionaryPerspective.client_id,
                                   DictionaryPerspective.object_id).join(Dictionary).filter(or_(
             Dictionary.marked_for_deletion == True,
@@ -549,12 +722,8 @@ class DictionaryPerspective(CompositeIdMixin,
         return deleted_set
 
     @classmethod
-    def get_hidden(cls):
-        gist = DBSession.query(TranslationGist.client_id,
-                               TranslationGist.object_id).join(TranslationAtom) \
-            .filter(TranslationAtom.content == 'Hidden', TranslationGist.type == 'Service',
-                    TranslationAtom.locale_id == 2).first()
-        gist_client_id, gist_object_id = (gist.client_id, gist.object_id)
+    def query_hidden(cls):
+        gist_client_id, gist_object_id = TranslationGist.get_service_gist_id('Hidden')
         hidden = DBSession.query(DictionaryPerspective.client_id,
                                  DictionaryPerspective.object_id).join(Dictionary).filter(
             or_(and_(Dictionary.state_translation_gist_client_id == gist_client_id,
@@ -746,27 +915,29 @@ class LexicalEntry(CompositeIdMixin,
         else:
             pub_filter = " WHERE cte_expr.marked_for_deletion = False"
 
-        temp_table_name = 'lexical_entries_temp_table' + str(uuid.uuid4()).replace("-", "")
-
-        DBSession.execute(
-            '''create TEMPORARY TABLE %s (traversal_lexical_order INTEGER, client_id BIGINT, object_id BIGINT) on COMMIT DROP;''' % temp_table_name)
-
-        DBSession.execute(
-            '''insert into %s (traversal_lexical_order, client_id, object_id) values (:traversal_lexical_order, :client_id, :object_id);''' % temp_table_name,
-            ls)
+        # Lexical entries are passed as arrays and unnested into a CTE, so that we wouldn't have to create and
+        # fill a separate temporary table on each call.
 
         result = DBSession.execute(text('''
-        WITH RECURSIVE cte_expr AS
+        WITH RECURSIVE lexical_entry_list AS
+        (SELECT * FROM unnest(
+            CAST(:traversal_lexical_order AS INTEGER[]),
+            CAST(:client_id AS BIGINT[]),
+            CAST(:object_id AS BIGINT[]))
+          AS lexical_entry_list (traversal_lexical_order, client_id, object_id)
+        ),
+
+        cte_expr AS
         (SELECT
            entity.*,
-           %s.traversal_lexical_order                                  AS traversal_lexical_order,
+           lexical_entry_list.traversal_lexical_order                                          AS traversal_lexical_order,
            1                                                                                   AS tree_level,
             row_number() over(partition by traversal_lexical_order order by Entity.created_at) as tree_numbering_scheme
          FROM entity
-           INNER JOIN %s
+           INNER JOIN lexical_entry_list
              ON
-               entity.parent_client_id = %s.client_id
-               AND entity.parent_object_id = %s.object_id
+               entity.parent_client_id = lexical_entry_list.client_id
+               AND entity.parent_object_id = lexical_entry_list.object_id
 
          UNION ALL
          SELECT
@@ -815,9 +986,13 @@ class LexicalEntry(CompositeIdMixin,
                data_type_atom_fallback.locale_id = 1
           %s
         ORDER BY traversal_lexical_order, tree_numbering_scheme, tree_level;
-        ''' % (temp_table_name, temp_table_name, temp_table_name, temp_table_name, pub_filter)), {'locale': locale_id})
+        ''' % pub_filter), {
+            'locale': locale_id,
+            'traversal_lexical_order': [i['traversal_lexical_order'] for i in ls],
+            'client_id': [i['client_id'] for i in ls],
+            'object_id': [i['object_id'] for i in ls]})
 
-        entries = result.fetchall()
+        rubbish = {'traversal_lexical_order', 'tree_level', 'tree_numbering_scheme'}
 
         def remove_keys(obj, rubbish):
             if isinstance(obj, dict):
@@ -831,7 +1006,28 @@ class LexicalEntry(CompositeIdMixin,
                        if item not in rubbish]
             return obj
 
+        # Grouping entities by their lexical entries in a single pass over the ordered query results, only
+        # additional metadata has to be cleaned up recursively.
+
+        entity_dict = defaultdict(list)
+
+        for i in result:
+            dictionary_form = {
+                key: value
+                for key, value in i.items()
+                if key not in rubbish and value is not None}
+            dictionary_form['created_at'] = int(i['created_at'].timestamp())
+            dictionary_form['level'] = 'entity'
+            dictionary_form['contains'] = []
+            if not dictionary_form.get('locale_id'):
+                dictionary_form['locale_id'] = 0
+            if 'additional_metadata' in dictionary_form:
+                dictionary_form['additional_metadata'] = remove_keys(dictionary_form['additional_metadata'], rubbish)
+            entity_dict[(i['parent_client_id'], i['parent_object_id'])].append(
+                (i['tree_numbering_scheme'], dictionary_form))
+
         lexical_list = []
+        contains_dict = {}
         for k in filtered_lexes:
             a = []
             entry = {
@@ -842,37 +1038,36 @@ class LexicalEntry(CompositeIdMixin,
                 'parent_object_id': k[4],
                 'contains': a,
                 'marked_for_deletion': k[5],
-                'additional_metadata': k[6],
+                'additional_metadata': remove_keys(k[6], rubbish),
                 'came_from': k[7],
                 'level': 'lexicalentry',
                 'published': False
             }
 
-            prev_nodegroup = -1
-            for i in entries:
-                if i['parent_client_id'] != k[1] or i['parent_object_id'] != k[2]:
-                    continue
-                cur_nodegroup = i['tree_numbering_scheme'] if prev_nodegroup != i[
-                    'tree_numbering_scheme'] else prev_nodegroup
-                dictionary_form = dict(i)
-                dictionary_form['created_at'] = int(i['created_at'].timestamp())
-                dictionary_form['level'] = 'entity'
-                dictionary_form['contains'] = []
-                if not dictionary_form.get('locale_id'):
-                    dictionary_form['locale_id'] = 0
-                if cur_nodegroup != prev_nodegroup:
-                    prev_dictionary_form = dictionary_form
-                else:
-                    prev_dictionary_form['contains'].append(dictionary_form)
-                    continue
-                a.append(dictionary_form)
-                prev_nodegroup = cur_nodegroup
+            # Entity lists of repeated lexical entries are assembled only once.
+
+            if (k[1], k[2]) in contains_dict:
+                entry['contains'] = contains_dict[(k[1], k[2])]
+
+            else:
+                prev_nodegroup = -1
+                for cur_nodegroup, dictionary_form in entity_dict[(k[1], k[2])]:
+                    if cur_nodegroup != prev_nodegroup:
+                        prev_dictionary_form = dictionary_form
+                    else:
+                        prev_dictionary_form['contains'].append(dictionary_form)
+                        continue
+                    a.append(dictionary_form)
+                    prev_nodegroup = cur_nodegroup
+                contains_dict[(k[1], k[2])] = a
+
             # TODO: published filtering
             # TODO: locale fallback
-            lexical_list.append(entry)
-        lexical_list = remove_keys(lexical_list, ['traversal_lexical_order', 'tree_level', 'tree_numbering_scheme'])
+            lexical_list.append({
+                key: value
+                for key, value in entry.items()
+                if value is not None})
         log.debug(lexical_list)
-        DBSession.execute('''drop TABLE %s''' % temp_table_name)
 
         return lexical_list
 
@@ -1101,6 +1296,186 @@ class UserRequest(IdMixin, Base, TableNameMixin, CreatedAtMixin, AdditionalMetad
     message = Column(String(1000))
 
 
+
+class StatisticsRollup(IdMixin, Base, TableNameMixin):
+    """
+    Precomputed user participation statistics, counts of lexical entries and entities of perspectives by
+    field, original client, day and publishing status, see lingvodoc.utils.statistics.
+
+    Days are counted from the Unix epoch. Counts of lexical entries have no field and publishing status.
+    """
+    __table_args__ = (Index('statisticsrollup_perspective_day_idx',
+                            'perspective_client_id', 'perspective_object_id', 'day'),)
+    perspective_client_id = Column(SLBigInteger(), nullable=False)
+    perspective_object_id = Column(SLBigInteger(), nullable=False)
+    field_client_id = Column(SLBigInteger())
+    field_object_id = Column(SLBigInteger())
+    client_id = Column(SLBigInteger(), nullable=False)
+    day = Column(SLBigInteger(), nullable=False)
+    published = Column(Boolean)
+    count = Column(SLBigInteger(), nullable=False)
+
+
+class StatisticsRollupPerspective(Base, TableNameMixin):
+    """
+    Perspectives with up to date statistics rollup.
+    """
+    perspective_client_id = Column(SLBigInteger(), primary_key=True)
+    perspective_object_id = Column(SLBigInteger(), primary_key=True)
+
+
+def invalidate_statistics_rollup(session, instance_list):
+    """
+    Marks statistics rollup of perspectives with changes of lexical entries, entities, publishing status or
+    perspective fields from a list of instances as out of date.
+
+    Instances flushed by the session are processed automatically, instances saved bypassing flush, e.g. via
+    bulk_save_objects(), must be passed explicitly.
+    """
+    perspective_id_set = set()
+    entry_id_set = set()
+    entity_id_set = set()
+    for instance in instance_list:
+        if isinstance(instance, (LexicalEntry, DictionaryPerspectiveToField)):
+            perspective_id_set.add((instance.parent_client_id, instance.parent_object_id))
+        elif isinstance(instance, Entity):
+            entry_id_set.add((instance.parent_client_id, instance.parent_object_id))
+        elif isinstance(instance, PublishingEntity):
+            entity_id_set.add((instance.client_id, instance.object_id))
+    # Without any perspectives with up to date rollup there is nothing to mark, and checking it is cheaper than
+    # finding perspectives of changed entities.
+    if not (perspective_id_set or entry_id_set or entity_id_set) or \
+            session.query(StatisticsRollupPerspective.perspective_client_id).first() is None:
+        return
+    if entity_id_set:
+        entry_id_set.update(session.query(Entity.parent_client_id, Entity.parent_object_id).filter(
+            tuple_(Entity.client_id, Entity.object_id).in_(entity_id_set)).distinct())
+    entry_id_set.discard((None, None))
+    if entry_id_set:
+        perspective_id_set.update(session.query(
+            LexicalEntry.parent_client_id, LexicalEntry.parent_object_id).filter(
+            tuple_(LexicalEntry.client_id, LexicalEntry.object_id).in_(entry_id_set)).distinct())
+    perspective_id_set.discard((None, None))
+    if not perspective_id_set:
+        return
+    marked_id_list = session.query(
+        StatisticsRollupPerspective.perspective_client_id,
+        StatisticsRollupPerspective.perspective_object_id).filter(tuple_(
+        StatisticsRollupPerspective.perspective_client_id,
+        StatisticsRollupPerspective.perspective_object_id).in_(perspective_id_set)).all()
+    if marked_id_list:
+        session.query(StatisticsRollupPerspective).filter(tuple_(
+            StatisticsRollupPerspective.perspective_client_id,
+            StatisticsRollupPerspective.perspective_object_id).in_(marked_id_list)).delete(
+            synchronize_session=False)
+
+
+def invalidate_flushed_statistics_rollup(session, flush_context):
+    """
+    Marks statistics rollup of perspectives with flushed changes as out of date.
+    """
+    invalidate_statistics_rollup(session, itertools.chain(session.new, session.dirty, session.deleted))
+
+
+event.listen(DBSession, 'after_flush', invalidate_flushed_statistics_rollup)
+
+
+class EtymologyGroup(Base, TableNameMixin):
+    """
+    Materialized etymology groups: for each grouping field, lexical entries connected by grouping tags of the
+    field share a group, identified by the id of one of its lexical entries, see lingvodoc.utils.etymology.
+
+    Groups are materialized as a whole and lazily, lexical entries of groups which were not materialized yet
+    or were invalidated have no rows.
+    """
+    __table_args__ = (Index('etymologygroup_group_idx',
+                            'field_client_id', 'field_object_id', 'group_client_id', 'group_object_id'),)
+    field_client_id = Column(SLBigInteger(), primary_key=True)
+    field_object_id = Column(SLBigInteger(), primary_key=True)
+    entry_client_id = Column(SLBigInteger(), primary_key=True)
+    entry_object_id = Column(SLBigInteger(), primary_key=True)
+    group_client_id = Column(SLBigInteger(), nullable=False)
+    group_object_id = Column(SLBigInteger(), nullable=False)
+
+
+# Whether fields are grouping tag fields, by field ids; data types of fields do not change, so the dictionary
+# is filled lazily and an entry is dropped only when its field is flushed, see invalidate_etymology_groups.
+
+grouping_field_dict = {}
+
+
+def grouping_field_ids(session, field_id_set):
+    """
+    Gets the subset of grouping tag fields of a set of field ids, querying only fields not yet known.
+    """
+    unknown_id_list = [field_id for field_id in field_id_set if field_id not in grouping_field_dict]
+    if unknown_id_list:
+        grouping_id_set = set(session.query(Field.client_id, Field.object_id).join(TranslationAtom, and_(
+            TranslationAtom.parent_client_id == Field.data_type_translation_gist_client_id,
+            TranslationAtom.parent_object_id == Field.data_type_translation_gist_object_id)).filter(
+            TranslationAtom.locale_id == 2,
+            TranslationAtom.content == 'Grouping Tag',
+            tuple_(Field.client_id, Field.object_id).in_(unknown_id_list)))
+        for field_id in unknown_id_list:
+            grouping_field_dict[field_id] = field_id in grouping_id_set
+    return set(field_id for field_id in field_id_set if grouping_field_dict[field_id])
+
+
+def invalidate_etymology_groups(session, instance_list):
+    """
+    Removes materialized etymology groups affected by changes of entities from a list of instances: groups
+    of their lexical entries and groups having tags with the same content, so that these groups are
+    materialized anew on the next lookup.
+
+    Entities flushed by the session are processed automatically, entities saved bypassing flush, e.g. via
+    bulk_save_objects(), must be passed explicitly, otherwise affected groups would remain out of date.
+    """
+    entry_id_set = set()
+    content_set = set()
+    for instance in instance_list:
+        if isinstance(instance, Field):
+            grouping_field_dict.pop((instance.client_id, instance.object_id), None)
+        elif isinstance(instance, Entity) and instance.field_client_id is not None:
+            field_id = (instance.field_client_id, instance.field_object_id)
+            entry_id_set.add(field_id + (instance.parent_client_id, instance.parent_object_id))
+            if instance.content is not None:
+                content_set.add(field_id + (instance.content,))
+    field_id_set = grouping_field_ids(session, set(entry_id[:2] for entry_id in entry_id_set))
+    if not field_id_set:
+        return
+    group_id_set = set(session.query(
+        EtymologyGroup.field_client_id, EtymologyGroup.field_object_id,
+        EtymologyGroup.group_client_id, EtymologyGroup.group_object_id).filter(tuple_(
+        EtymologyGroup.field_client_id, EtymologyGroup.field_object_id,
+        EtymologyGroup.entry_client_id, EtymologyGroup.entry_object_id).in_(
+        [entry_id for entry_id in entry_id_set if entry_id[:2] in field_id_set])))
+    content_list = [content for content in content_set if content[:2] in field_id_set]
+    if content_list:
+        group_id_set.update(session.query(
+            EtymologyGroup.field_client_id, EtymologyGroup.field_object_id,
+            EtymologyGroup.group_client_id, EtymologyGroup.group_object_id).join(Entity, and_(
+            Entity.parent_client_id == EtymologyGroup.entry_client_id,
+            Entity.parent_object_id == EtymologyGroup.entry_object_id,
+            Entity.field_client_id == EtymologyGroup.field_client_id,
+            Entity.field_object_id == EtymologyGroup.field_object_id)).filter(
+            tuple_(Entity.field_client_id, Entity.field_object_id, Entity.content).in_(content_list)))
+    if group_id_set:
+        session.query(EtymologyGroup).filter(tuple_(
+            EtymologyGroup.field_client_id, EtymologyGroup.field_object_id,
+            EtymologyGroup.group_client_id, EtymologyGroup.group_object_id).in_(group_id_set)).delete(
+            synchronize_session=False)
+
+
+def invalidate_flushed_etymology_groups(session, flush_context):
+    """
+    Removes materialized etymology groups affected by flushed changes of entities.
+    """
+    invalidate_etymology_groups(session, itertools.chain(session.new, session.dirty, session.deleted))
+
+
+event.listen(DBSession, 'after_flush', invalidate_flushed_etymology_groups)
+
+
 def acl_by_groups(object_id, client_id, subject):
     acls = []  # DANGER if acls do not work -- uncomment string below
     # acls += [(Allow, Everyone, ALL_PERMISSIONS)]
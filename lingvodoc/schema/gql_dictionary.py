@@ -619,6 +619,7 @@ class UpdateDictionaryStatus(graphene.Mutation):
         if dbdictionary and not dbdictionary.marked_for_deletion:
             dbdictionary.state_translation_gist_client_id = state_translation_gist_client_id
             dbdictionary.state_translation_gist_object_id = state_translation_gist_object_id
+            dbDictionaryPerspective.invalidate_state()
             atom = DBSession.query(dbTranslationAtom).filter_by(parent_client_id=state_translation_gist_client_id,
                                                               parent_object_id=state_translation_gist_object_id,
                                                               locale_id=info.context.get('locale_id')).first()
@@ -755,6 +756,7 @@ class DeleteDictionary(graphene.Mutation):
         if not dbdictionary_obj or dbdictionary_obj.marked_for_deletion:
             raise ResponseError(message="Error: No such dictionary in the system")
         del_object(dbdictionary_obj)
+        dbDictionaryPerspective.invalidate_state()
         dictionary = Dictionary(id=[dbdictionary_obj.client_id, dbdictionary_obj.object_id])
         dictionary.dbObject = dbdictionary_obj
         return DeleteDictionary(dictionary=dictionary, triumph=True)
@@ -77,6 +77,7 @@ class DictionaryPerspective(graphene.ObjectType):
         id
         statistic(starting_time: 0, ending_time: 1506812557)
         entities(mode: "all"){id parent_id published accepted}
+        entities(mode: "all", first: 100, after: [78, 6], order_by_field: [66, 10]){id parent_id content}
         lexical_entries(ids: [[78,6], [78,8]]){id}
 
       }
@@ -90,7 +91,8 @@ class DictionaryPerspective(graphene.ObjectType):
 
     tree = graphene.List(CommonFieldsComposite, )  # TODO: check it
     fields = graphene.List(DictionaryPerspectiveToField)
-    entities = graphene.List(Entity, mode=graphene.String())
+    entities = graphene.List(Entity, mode=graphene.String(), first=graphene.Int(), after=LingvodocID(),
+                             order_by_field=LingvodocID())
     lexical_entries = graphene.List(LexicalEntry, ids = graphene.List(LingvodocID))
     authors = graphene.List('lingvodoc.schema.gql_user.User')
     # stats = graphene.String() # ?
@@ -166,7 +168,12 @@ class DictionaryPerspective(graphene.ObjectType):
 
     #@acl_check_by_id('view', 'approve_entities')
     @fetch_object()  # TODO: two lists
-    def resolve_entities(self, info, mode=None):
+    def resolve_entities(self, info, mode=None, first=None, after=None, order_by_field=None):
+        """
+        Entities are returned for lexical entries of the perspective ordered either by their ids or, if
+        order_by_field is specified, by contents of their entities of this field. Results can be paginated by
+        the number of lexical entries and by the id of the last lexical entry of the previous page.
+        """
         result = list()
         request = info.context.get('request')
         if mode == 'all':
@@ -183,6 +190,41 @@ class DictionaryPerspective(graphene.ObjectType):
         # dbPersp = DBSession.query(dbPerspective).filter_by(client_id=self.id[0], object_id=self.id[1]).one()
         lexes = DBSession.query(dbLexicalEntry).filter_by(parent=self.dbObject)
 
+        if order_by_field:
+            # Ordering contents are aggregated only over entities of this perspective's lexical entries.
+            order_content = DBSession.query(
+                dbEntity.parent_client_id,
+                dbEntity.parent_object_id,
+                func.min(dbEntity.content).label('content')).join(dbLexicalEntry, and_(
+                dbLexicalEntry.client_id == dbEntity.parent_client_id,
+                dbLexicalEntry.object_id == dbEntity.parent_object_id)).filter(
+                dbLexicalEntry.parent_client_id == self.dbObject.client_id,
+                dbLexicalEntry.parent_object_id == self.dbObject.object_id,
+                dbEntity.field_client_id == order_by_field[0],
+                dbEntity.field_object_id == order_by_field[1],
+                dbEntity.marked_for_deletion == False).group_by(
+                dbEntity.parent_client_id, dbEntity.parent_object_id).subquery()
+            lexes = lexes.outerjoin(order_content, and_(
+                order_content.c.parent_client_id == dbLexicalEntry.client_id,
+                order_content.c.parent_object_id == dbLexicalEntry.object_id))
+
+            # Lexical entries without entities of the ordering field go last.
+            order_key = (order_content.c.content.is_(None), func.coalesce(order_content.c.content, ''),
+                         dbLexicalEntry.client_id, dbLexicalEntry.object_id)
+        else:
+            order_key = (dbLexicalEntry.client_id, dbLexicalEntry.object_id)
+
+        # Keyset pagination, continuing right after the order key of the given lexical entry.
+        if after:
+            after_key = lexes.filter(dbLexicalEntry.client_id == after[0],
+                                     dbLexicalEntry.object_id == after[1]).with_entities(*order_key).first()
+            if after_key is None:
+                raise ResponseError(message="No such lexical entry in the perspective")
+            lexes = lexes.filter(tuple_(*order_key) > tuple_(*after_key))
+        lexes = lexes.order_by(*order_key)
+        if first:
+            lexes = lexes.limit(first)
+
         lexes_composite_list = [(lex.created_at,
                                  lex.client_id, lex.object_id, lex.parent_client_id, lex.parent_object_id,
                                  lex.marked_for_deletion, lex.additional_metadata,
@@ -480,6 +522,7 @@ class UpdatePerspectiveStatus(graphene.Mutation):
         if dbperspective and not dbperspective.marked_for_deletion:
             dbperspective.state_translation_gist_client_id = state_translation_gist_client_id
             dbperspective.state_translation_gist_object_id = state_translation_gist_object_id
+            dbPerspective.invalidate_state()
             atom = DBSession.query(dbTranslationAtom).filter_by(parent_client_id=state_translation_gist_client_id,
                                                               parent_object_id=state_translation_gist_object_id,
                                                               locale_id=info.context.get('locale_id')).first()
@@ -688,6 +731,7 @@ class DeleteDictionaryPerspective(graphene.Mutation):
             raise ResponseError(message="No such perspective in the system")
 
         del_object(dbperspective)
+        dbPerspective.invalidate_state()
 
         perspective = DictionaryPerspective(id=[dbperspective.client_id, dbperspective.object_id])
         perspective.dbObject = dbperspective
@@ -19,8 +19,9 @@ from lingvodoc.models import (
     Field as dbField,
     Group as dbGroup,
     BaseGroup as dbBaseGroup,
-    PublishingEntity as dbPublishingEntity
-
+    PublishingEntity as dbPublishingEntity,
+    invalidate_etymology_groups,
+    invalidate_statistics_rollup
 )
 from lingvodoc.schema.gql_holders import (
     CompositeIdHolder,
@@ -382,4 +383,6 @@ class BulkCreateEntity(graphene.Mutation):
 
         DBSession.bulk_save_objects(dbentities_list)
         DBSession.flush()
+        invalidate_etymology_groups(DBSession, dbentities_list)
+        invalidate_statistics_rollup(DBSession, dbentities_list)
         return BulkCreateEntity(triumph=True)
\ No newline at end of file
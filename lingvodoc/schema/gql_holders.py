@@ -6,6 +6,10 @@ from graphql.language import ast
 from graphene.types import Scalar
 from graphene.types.json import JSONString as JSONtype
 from graphene.types.generic import GenericScalar
+from promise import Promise
+from promise.dataloader import DataLoader
+from sqlalchemy import tuple_
+from sqlalchemy.orm.exc import NoResultFound
 from lingvodoc.models import (
     ObjectTOC,
     DBSession,
@@ -213,6 +217,33 @@ def del_object(tmp_object):
     tmp_objecttoc.marked_for_deletion = True
 
 
+class ObjectLoader(DataLoader):
+    """
+    Request-scoped loader of DB objects of a single type, collects ids requested during an execution
+    tick and fetches them with a single query.
+    Ids are either integers (example: 1) or (client_id, object_id) tuples (example: (2, 3)).
+    """
+
+    def __init__(self, db_type):
+        super().__init__()
+        self.db_type = db_type
+
+    def batch_load_fn(self, key_list):
+        if type(key_list[0]) is int:
+            object_dict = {
+                db_object.id: db_object
+                for db_object in DBSession.query(self.db_type).filter(
+                    self.db_type.id.in_(key_list))}
+        else:
+            object_dict = {
+                (db_object.client_id, db_object.object_id): db_object
+                for db_object in DBSession.query(self.db_type).filter(
+                    tuple_(self.db_type.client_id, self.db_type.object_id).in_(key_list))}
+        return Promise.resolve([
+            object_dict.get(key) or NoResultFound('No row was found for %s %s' % (self.db_type.__name__, key))
+            for key in key_list])
+
+
 def fetch_object(attrib_name=None, ACLSubject=None, ACLKey=None):
     """
     This magic decorator, which the resolve_* functions have, sets the dbObject atribute
@@ -225,6 +256,9 @@ def fetch_object(attrib_name=None, ACLSubject=None, ACLKey=None):
     @fetch_object("marked_for_deletion")
     def resolve_marked_for_deletion(self, args, context, info):
         ...
+
+    If the context provides object loaders (see Context.object_loader), objects are fetched in batches
+    and the function is called when its object is loaded.
     """
     def dec(func):
         def wrapper(*args, **kwargs):
@@ -236,20 +270,30 @@ def fetch_object(attrib_name=None, ACLSubject=None, ACLKey=None):
             if ACLSubject and ACLKey == 'id':
                 context.acl_check('view', ACLSubject, cls.id)
 
+            def resolve(db_object=None):
+                if db_object is not None:
+                    cls.dbObject = db_object
+                if ACLSubject and '_' in ACLKey:
+                    context.acl_check('view', ACLSubject,
+                                      [getattr(cls.dbObject, ACLKey.replace('_', '_client_')),
+                                       getattr(cls.dbObject, ACLKey.replace('_', '_object_'))])
+                return func(*args, **kwargs)
+
             if not cls.dbObject:
+                object_loader = getattr(context, 'object_loader', None)
                 if type(cls.id) is int:
                     # example: (id: 1)
                     id = cls.id
+                    if object_loader:
+                        return object_loader(cls.dbType).load(id).then(resolve)
                     cls.dbObject = DBSession.query(cls.dbType).filter_by(id=id).one()
                 elif type(cls.id) is list:
                     # example: (id: [2,3])
+                    if object_loader:
+                        return object_loader(cls.dbType).load(tuple(cls.id)).then(resolve)
                     cls.dbObject = DBSession.query(cls.dbType).filter_by(client_id=cls.id[0],
                                                                          object_id=cls.id[1]).one()
-            if ACLSubject and '_' in ACLKey:
-                context.acl_check('view', ACLSubject,
-                                  [getattr(cls.dbObject, ACLKey.replace('_', '_client_')),
-                                   getattr(cls.dbObject, ACLKey.replace('_', '_object_'))])
-            return func(*args, **kwargs)
+            return resolve()
 
         return wrapper
 
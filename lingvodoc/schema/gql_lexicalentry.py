@@ -25,7 +25,8 @@ from lingvodoc.models import (
     Group as dbGroup,
     LexicalEntry as dbLexicalEntry,
     User as dbUser,
-    ObjectTOC as dbObjectTOC
+    ObjectTOC as dbObjectTOC,
+    invalidate_statistics_rollup
 )
 from lingvodoc.schema.gql_entity import Entity
 from lingvodoc.views.v2.utils import check_client_id
@@ -215,4 +216,5 @@ class BulkCreateLexicalEntry(graphene.Mutation):
 
         DBSession.bulk_save_objects(lexentries_list)
         DBSession.flush()
+        invalidate_statistics_rollup(DBSession, lexentries_list)
         return BulkCreateLexicalEntry(triumph=True)
\ No newline at end of file
@@ -120,6 +120,8 @@ class CreateTranslationAtom(graphene.Mutation):
                                                   content=content)
             DBSession.add(dbtranslationatom)
             DBSession.flush()
+            if parent.type == 'Service':
+                dbTranslationGist.invalidate_service()
             if not object_id:
                 basegroups = []
                 basegroups += [DBSession.query(dbBaseGroup).filter_by(name="Can edit translationatom").first()]
@@ -214,6 +216,8 @@ class UpdateTranslationAtom(graphene.Mutation):
                 dbtranslationatom.content = content
             if locale:
                 dbtranslationatom.locale_id = locale
+            if dbtranslationatom.parent.type == 'Service':
+                dbTranslationGist.invalidate_service()
 
             translationatom = TranslationAtom(id=[dbtranslationatom.client_id, dbtranslationatom.object_id],
                                               content=dbtranslationatom.content, locale_id=locale)
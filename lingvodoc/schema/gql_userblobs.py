@@ -29,7 +29,7 @@ from lingvodoc.models import (
 )
 import base64
 
-from lingvodoc.views.v2.sociolinguistics import check_socio  # TODO: replace it
+from lingvodoc.views.v2.sociolinguistics import check_socio, invalidate_sociolinguistics  # TODO: replace it
 
 #from lingvodoc.schema.gql_entity import create_object
 
@@ -143,6 +143,7 @@ class CreateUserBlob(graphene.Mutation):
                 check_socio(blob_object.real_storage_path)
             except Exception as e:
                 raise ResponseError(message=str(e))
+            invalidate_sociolinguistics()
         current_user.userblobs.append(blob_object)
         DBSession.add(blob_object)
         #DBSession.add(current_user)
@@ -183,6 +184,8 @@ class DeleteUserBlob(graphene.Mutation):
             raise ResponseError(message="No such blob in the system'")
  
         filelocation = blob.real_storage_path
+        if blob.data_type == "sociolinguistics":
+            invalidate_sociolinguistics()
         del_object(blob)
         try:
             unlink(filelocation)
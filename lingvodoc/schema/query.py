@@ -99,7 +99,8 @@ from lingvodoc.schema.gql_holders import (
     ResponseError,
     ObjectVal,
     client_id_check,
-    LingvodocID
+    LingvodocID,
+    ObjectLoader
 )
 
 from lingvodoc.schema.gql_userrequest import (
@@ -126,7 +127,6 @@ from lingvodoc.models import (
     User as dbUser,
     Entity as dbEntity,
     LexicalEntry as dbLexicalEntry,
-    DictionaryPerspectiveToField as dbPerspectiveToField,
     Locale as dbLocale,
     TranslationAtom as dbTranslationAtom,
     TranslationGist as dbTranslationGist,
@@ -136,7 +136,6 @@ from lingvodoc.models import (
     Grant as dbGrant,
     Client
 )
-from pyramid.request import Request
 
 from sqlalchemy import (
     func,
@@ -154,6 +153,11 @@ from sqlalchemy.sql.functions import coalesce
 from pyramid.security import authenticated_userid
 
 from lingvodoc.utils.phonology import phonology as utils_phonology
+from lingvodoc.utils.search import (
+    rank_lexical_entries,
+    ranked_lexical_entries,
+    search_filter
+)
 
 RUSSIAN_LOCALE = 1
 ENGLISH_LOCALE = 2
@@ -179,12 +183,14 @@ class Query(graphene.ObjectType):
     lexicalentry = graphene.Field(LexicalEntry, id=LingvodocID())
     lexicalentries = graphene.List(LexicalEntry, searchstring=graphene.String(), can_add_tags=graphene.Boolean(),
                                    perspective_id=LingvodocID(), field_id=LingvodocID(),
-                                   search_in_published=graphene.Boolean())
+                                   search_in_published=graphene.Boolean(),
+                                   first=graphene.Int(), after=LingvodocID())
     advanced_lexicalentries = graphene.List(LexicalEntry, searchstrings=graphene.List(ObjectVal),
                                             perspectives=LingvodocID(),
                                             adopted=graphene.Boolean(),
                                             adopted_type=LingvodocID(),
-                                            with_entimology=graphene.Boolean())
+                                            with_entimology=graphene.Boolean(),
+                                            first=graphene.Int(), after=LingvodocID())
     translationgists = graphene.List(TranslationGist)
     translation_search = graphene.List(TranslationGist, searchstring=graphene.String(), translation_type=graphene.String())
     translation_service_search = graphene.Field(TranslationGist, searchstring=graphene.String())
@@ -259,18 +265,9 @@ class Query(graphene.ObjectType):
         else:
             raise ResponseError(message='no such mode')
     def resolve_all_statuses(self, info):
-        request = info.context.request
         response = list()
         for status in ['WiP', 'Published', 'Limited access', 'Hidden']:
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': status}
-            headers = {'Cookie': request.headers['Cookie']}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-            jn = resp.json
-            response.append(TranslationGist(id=[jn["client_id"], jn["object_id"] ]))
+            response.append(TranslationGist(id=list(dbTranslationGist.get_service_gist_id(status))))
         return response
 
     def resolve_all_fields(self, info):
@@ -286,21 +283,9 @@ class Query(graphene.ObjectType):
         return response
 
     def resolve_all_data_types(self, info):
-        import json
-        request = info.context.request
         response = list()
         for data_type in ['Text', 'Image', 'Sound', 'Markup', 'Link', 'Grouping Tag']:
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': data_type}
-            # headers = {'Cookie': request.headers['Cookie']}
-            # subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-            jn = resp.json
-            #if "contains" in jn:
-            #    del jn["contains"]
-            response.append(TranslationGist(id=[jn["client_id"], jn["object_id"] ]))
+            response.append(TranslationGist(id=list(dbTranslationGist.get_service_gist_id(data_type))))
         return response
 
     def resolve_dictionaries(self, info, published):
@@ -321,39 +306,11 @@ class Query(graphene.ObjectType):
         """
         context = info.context
         dbdicts = list()
-        request = context.get('request')
         if published:
 
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': 'Published'}
-            headers = dict()
-            if request.headers.get('Cookie'):
-                headers = {'Cookie': request.headers['Cookie']}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-
-            if 'error' not in resp.json:
-                state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                    'client_id']
-            else:
-                raise KeyError("Something wrong with the base", resp.json['error'])
-
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': 'Limited access'}  # todo: fix
-            headers = dict()
-            if request.headers.get('Cookie'):
-                headers = {'Cookie': request.headers['Cookie']}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-
-            if 'error' not in resp.json:
-                limited_object_id, limited_client_id = resp.json['object_id'], resp.json['client_id']
-            else:
-                raise KeyError("Something wrong with the base", resp.json['error'])
+            state_translation_gist_client_id, state_translation_gist_object_id = \
+                dbTranslationGist.get_service_gist_id('Published')
+            limited_client_id, limited_object_id = dbTranslationGist.get_service_gist_id('Limited access')
 
             dbdicts = DBSession.query(dbDictionary).filter(
                 or_(and_(dbDictionary.state_translation_gist_object_id == state_translation_gist_object_id,
@@ -399,34 +356,10 @@ class Query(graphene.ObjectType):
         }
         """
         context = info.context
-        request = context.get('request')
-        cookies = info.context.get('cookies')
         if published:
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': 'Published'}
-            headers = {'Cookie': cookies}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-            if 'error' not in resp.json:
-                state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                    'client_id']
-            else:
-                raise KeyError("Something wrong with the base", resp.json['error'])
-
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': 'Limited access'}
-            headers = {'Cookie': cookies}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-            if 'error' not in resp.json:
-                limited_object_id, limited_client_id = resp.json['object_id'], resp.json[
-                    'client_id']
-            else:
-                raise KeyError("Something wrong with the base", resp.json['error'])
+            state_translation_gist_client_id, state_translation_gist_object_id = \
+                dbTranslationGist.get_service_gist_id('Published')
+            limited_client_id, limited_object_id = dbTranslationGist.get_service_gist_id('Limited access')
 
             """
             atom_perspective_name_alias = aliased(dbTranslationAtom, name="PerspectiveName")
@@ -478,10 +411,19 @@ class Query(graphene.ObjectType):
         context = info.context
 
         languages = DBSession.query(dbLanguage).filter(dbLanguage.marked_for_deletion == False).all()
-        languages_list = [Language(id=[lang.client_id, lang.object_id],
-                                   parent_id=[lang.parent_client_id, lang.parent_object_id],
-                                   translation_gist_id=[lang.translation_gist_client_id, lang.translation_gist_object_id],
-                                   translation=lang.get_translation(context.get('locale_id'))) for lang in languages]
+        translation_dict = dbTranslationGist.get_translations(
+            [(lang.translation_gist_client_id, lang.translation_gist_object_id) for lang in languages],
+            context.get('locale_id'))
+
+        languages_list = []
+        for lang in languages:
+            language = Language(id=[lang.client_id, lang.object_id],
+                                parent_id=[lang.parent_client_id, lang.parent_object_id],
+                                translation_gist_id=[lang.translation_gist_client_id, lang.translation_gist_object_id],
+                                translation=translation_dict[
+                                    (lang.translation_gist_client_id, lang.translation_gist_object_id)])
+            language.dbObject = lang
+            languages_list.append(language)
         return languages_list
 
     def resolve_entity(self, info, id):
@@ -736,7 +678,8 @@ class Query(graphene.ObjectType):
         return response
 
 
-    def resolve_lexicalentries(self, info, searchstring, search_in_published, field_id=None, perspective_id=None, can_add_tags=None): #basic_search() function
+    def resolve_lexicalentries(self, info, searchstring, search_in_published, field_id=None, perspective_id=None, can_add_tags=None,
+                               first=None, after=None): #basic_search() function
         """
         query EntriesList {
             lexicalentries(searchstring: "следить", search_in_published: true) {
@@ -752,10 +695,7 @@ class Query(graphene.ObjectType):
 
         if searchstring:
             if len(searchstring) >= 1:
-                field = None
-                if field_id:
-                    field_client_id, field_object_id = field_id[0], field_id[1]
-                    field = DBSession.query(dbField).filter_by(client_id=field_client_id, object_id=field_object_id).first()
+                search_condition = search_filter(searchstring, field_id)
 
                 client_id = info.context.get('client_id')
                 group = DBSession.query(dbGroup).filter(dbGroup.subject_override == True).join(dbBaseGroup) \
@@ -766,7 +706,7 @@ class Query(graphene.ObjectType):
                 published_cursor = None
 
                 if group:
-                    results_cursor = DBSession.query(dbEntity).filter(dbEntity.content.like('%'+searchstring+'%'), dbEntity.marked_for_deletion == False)
+                    results_cursor = DBSession.query(dbEntity).filter(search_condition, dbEntity.marked_for_deletion == False)
                     if perspective_id:
                         perspective_client_id, perspective_object_id = perspective_id
                         results_cursor = results_cursor.join(dbLexicalEntry) \
@@ -782,22 +722,8 @@ class Query(graphene.ObjectType):
                         published_cursor = results_cursor
 
                     ignore_groups = False
-                    request = info.context.get('request')
-                    subreq = Request.blank('/translation_service_search')
-                    subreq.method = 'POST'
-                    subreq.headers = request.headers
-                    subreq.json = {'searchstring': 'Published'}
-                    headers = dict()
-                    if request.headers.get('Cookie'):
-                        headers = {'Cookie': request.headers['Cookie']}
-                    subreq.headers = headers
-                    resp = request.invoke_subrequest(subreq)
-
-                    if 'error' not in resp.json:
-                        state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], \
-                                                                                             resp.json['client_id']
-                    else:
-                        raise KeyError("Something wrong with the base", resp.json['error'])
+                    state_translation_gist_client_id, state_translation_gist_object_id = \
+                        dbTranslationGist.get_service_gist_id('Published')
 
                     if perspective_id:
                         perspective_client_id, perspective_object_id = perspective_id
@@ -818,9 +744,9 @@ class Query(graphene.ObjectType):
                             .join(dbUser, dbGroup.users) \
                             .join(Client) \
                             .filter(Client.id == client_id,
-                                    dbEntity.content.like('%' + searchstring + '%'), dbEntity.marked_for_deletion == False)
+                                    search_condition, dbEntity.marked_for_deletion == False)
                     else:
-                        results_cursor = results_cursor.filter(dbEntity.content.like('%' + searchstring + '%'),
+                        results_cursor = results_cursor.filter(search_condition,
                                                                dbEntity.marked_for_deletion == False)
                     if published_cursor:
                         published_cursor = published_cursor \
@@ -829,7 +755,7 @@ class Query(graphene.ObjectType):
                             dbDictionary.state_translation_gist_client_id == state_translation_gist_client_id,
                             dbPerspective.state_translation_gist_object_id == state_translation_gist_object_id,
                             dbPerspective.state_translation_gist_client_id == state_translation_gist_client_id,
-                            dbEntity.content.like('%' + searchstring + '%'))
+                            search_condition)
 
                     if can_add_tags:
                         results_cursor = results_cursor \
@@ -840,31 +766,15 @@ class Query(graphene.ObjectType):
                         results_cursor = results_cursor.filter(dbBaseGroup.subject == 'lexical_entries_and_entities',
                                                        dbBaseGroup.action == 'view')
 
-                    if field:
-                        results_cursor = results_cursor.join(dbPerspective.dictionaryperspectivetofield).filter(
-                            dbPerspectiveToField.field == field)
-                        if published_cursor:
-                            published_cursor = published_cursor.join(
-                                dbPerspective.dictionaryperspectivetofield).filter(
-                                dbPerspectiveToField.field == field)
-
-                    entries = list()
-
-                    for item in results_cursor:
-                        if item.parent not in entries:
-                            entries.append(item.parent)
+                    entity_query_list = [results_cursor]
                     if published_cursor:
-                        for item in published_cursor:
-                            if item.parent not in entries:
-                                entries.append(item.parent)
+                        entity_query_list.append(published_cursor)
+
+                    entries = ranked_lexical_entries(searchstring, entity_query_list, after=after, first=first)
 
                     lexical_entries = list()
                     for entry in entries:
                         if not entry.marked_for_deletion:
-                            if (entry.parent_client_id, entry.parent_object_id) in dbPerspective.get_deleted():
-                                continue
-                            if (entry.parent_client_id, entry.parent_object_id) in dbPerspective.get_hidden():
-                                continue
                             lexical_entries.append(entry.track(search_in_published, info.context["locale_id"]))
 
                     lexical_entries_list = list()
@@ -911,7 +821,8 @@ class Query(graphene.ObjectType):
             raise ResponseError(message="Bad string")
 
     def resolve_advanced_lexicalentries(self, info, searchstrings, perspectives=None, adopted=None,
-                                        adopted_type=None, with_etimology=None): #advanced_search() function
+                                        adopted_type=None, with_etimology=None,
+                                        first=None, after=None): #advanced_search() function
 
         """
         query EntriesList {
@@ -926,38 +837,14 @@ class Query(graphene.ObjectType):
 
         """
         request = info.context.get('request')
-        cookies = info.context.get('cookies')
-        headers = info.context.get('headers')
 
         if not perspectives:
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': 'Published'}
-            headers = {'Cookie': cookies}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-            if 'error' not in resp.json:
-                state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], \
-                                                                                     resp.json[
-                                                                                         'client_id']
-                published_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
-            else:
-                raise KeyError("Something wrong with the base", resp.json['error'])
-            subreq = Request.blank('/translation_service_search')
-            subreq.method = 'POST'
-            subreq.headers = request.headers
-            subreq.json = {'searchstring': 'Limited access'}
-            headers = {'Cookie': cookies}
-            subreq.headers = headers
-            resp = request.invoke_subrequest(subreq)
-            if 'error' not in resp.json:
-                state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], \
-                                                                                     resp.json[
-                                                                                         'client_id']
-                limited_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
-            else:
-                raise KeyError("Something wrong with the base", resp.json['error'])
+            state_translation_gist_client_id, state_translation_gist_object_id = \
+                dbTranslationGist.get_service_gist_id('Published')
+            published_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
+            state_translation_gist_client_id, state_translation_gist_object_id = \
+                dbTranslationGist.get_service_gist_id('Limited access')
+            limited_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
 
             perspectives = [(persp.client_id, persp.object_id) for persp in DBSession.query(dbPerspective).filter(
                 dbPerspective.marked_for_deletion == False,
@@ -979,11 +866,11 @@ class Query(graphene.ObjectType):
             if not searchstring["searchstring"]:
                 raise ResponseError(message="Error: bad argument 'searchstring'.")
             search_parts = searchstring["searchstring"].split()
-            search_expression = dbEntity.content.like('%' + search_parts[0] + '%')
+            search_expression = search_filter(search_parts[0])
             to_do_or = searchstring.get('search_by_or', True)
 
             for part in search_parts[1:]:
-                search_expression = or_(search_expression, dbEntity.content.like('%' + part + '%'))
+                search_expression = or_(search_expression, search_filter(part))
             if 'entity_type' in searchstring and searchstring['entity_type']:
                 search_expression = and_(search_expression, dbField.client_id == searchstring['entity_type'][0],
                                          dbField.object_id == searchstring['entity_type'][1])
@@ -1033,7 +920,9 @@ class Query(graphene.ObjectType):
                                  lex.marked_for_deletion, lex.additional_metadata,
                                  lex.additional_metadata.get('came_from')
                                  if lex.additional_metadata and 'came_from' in lex.additional_metadata else None)
-                                for lex in pre_results]
+                                for lex in rank_lexical_entries(
+                                    pre_results, ' '.join(o['searchstring'] for o in searchstrings),
+                                    after=after, first=first)]
 
         lexical_entries = dbLexicalEntry.track_multiple(lexes_composite_list, int(request.cookies.get('locale_id') or 2),
                                               publish=True, accept=True)
@@ -1285,6 +1174,17 @@ class Context(dict):
         self.cookies = context_dict.get('cookies')
 
         self.cache = {}
+        self.loader_dict = {}
+
+    def object_loader(self, db_type):
+        """
+        Gets loader batching fetches of DB objects of a given type during query execution.
+        """
+
+        if db_type not in self.loader_dict:
+            self.loader_dict[db_type] = ObjectLoader(db_type)
+
+        return self.loader_dict[db_type]
 
     def acl_check_if(self, action, subject, subject_id):
         """
@@ -14,12 +14,13 @@ import transaction
 import tempfile
 from pydub import AudioSegment
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathvalidate import sanitize_filename
 from urllib import request
 
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy import create_engine
-from sqlalchemy import and_
+from sqlalchemy import and_, tuple_
 from lingvodoc.models import (
     Client,
     DBSession as SyncDBSession,
@@ -36,8 +37,9 @@ from lingvodoc.models import (
     DictionaryPerspective,
     BaseGroup,
     Group,
-    PublishingEntity
-
+    PublishingEntity,
+    invalidate_etymology_groups,
+    invalidate_statistics_rollup
 )
 from lingvodoc.cache.caching import TaskStatus, initialize_cache
 
@@ -60,13 +62,18 @@ log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
 
-def make_request(path, cookies, req_type='get', json_data=None):
+def make_session():
     session = requests.Session()
     session.headers.update({'Connection': 'Keep-Alive'})
     adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=10)
+    session.mount('http://', adapter)
+    return session
+
+
+def make_request(path, cookies, req_type='get', json_data=None):
+    session = make_session()
     # with open('authentication_data.json', 'r') as f:
     #     cookies = json.loads(f.read())
-    session.mount('http://', adapter)
     # log.error(path)
     if req_type == 'get':
         status = session.get(path, cookies=cookies)
@@ -217,7 +224,7 @@ def create_entity(session, le_client_id, le_object_id, field_client_id, field_ob
                   additional_metadata, client_id, object_id, content=None, filename=None,
                   link_client_id=None, link_object_id=None,
                   self_client_id=None, self_object_id=None, up_lvl=None, locale_id=2,
-                  storage=None, published=False, accepted=False):  # tested
+                  storage=None, published=False, accepted=False, stored=None):  # tested
     upper_level = None
     tr_atom = session.query(TranslationAtom).join(TranslationGist, and_(
         TranslationAtom.locale_id == 2,
@@ -245,7 +252,10 @@ def create_entity(session, le_client_id, le_object_id, field_client_id, field_ob
     real_location = None
     url = None
     if data_type == 'image' or data_type == 'sound' or 'markup' in data_type:
-        real_location, url = create_object(content, entity, data_type, filename, storage)
+        if stored:
+            real_location, url, hash = stored
+        else:
+            real_location, url = create_object(content, entity, data_type, filename, storage)
         entity.content = url
         old_meta = entity.additional_metadata
         need_hash = True
@@ -253,7 +263,8 @@ def create_entity(session, le_client_id, le_object_id, field_client_id, field_ob
             if old_meta.get('hash'):
                 need_hash = False
         if need_hash:
-            hash = hashlib.sha224(base64.urlsafe_b64decode(content)).hexdigest()
+            if not hash:
+                hash = hashlib.sha224(base64.urlsafe_b64decode(content)).hexdigest()
             hash_dict = {'hash': hash}
             if old_meta:
                 old_meta.update(hash_dict)
@@ -288,12 +299,13 @@ def create_entity(session, le_client_id, le_object_id, field_client_id, field_ob
     return entity, entity.publishingentity
 
 
-def create_objects(server, existing, session):
+def create_objects(server, existing, session, tables=(Dictionary, DictionaryPerspective,
+                                                      DictionaryPerspectiveToField, LexicalEntry, Entity,
+                                                      PublishingEntity)):
     new_entries = list()
     new_entities = list()
     publ_entities = list()
-    for table in [Dictionary, DictionaryPerspective, DictionaryPerspectiveToField, LexicalEntry, Entity,
-                  PublishingEntity]:
+    for table in tables:
         curr_server = server[table.__tablename__]
         curr_existing = existing[table.__tablename__]
         curr_old = list()
@@ -325,7 +337,11 @@ def create_objects(server, existing, session):
                     else:
                         new_entries.append(table(**kwargs))
 
-        all_entries = session.query(table).all()
+        # Only objects received from the server can be updated, so we load only them.
+        server_ids = [(int(client_id), int(object_id))
+                      for client_id in curr_server for object_id in curr_server[client_id]]
+        all_entries = session.query(table).filter(
+            tuple_(table.client_id, table.object_id).in_(server_ids)).all() if server_ids else []
         for entry in all_entries:
             client_id = str(entry.client_id)
             object_id = str(entry.object_id)
@@ -365,7 +381,7 @@ def create_tmp_resp(table, query, response):
     response[table.__tablename__] = tmp_resp
 
 
-def basic_tables_content(client_id, object_id, session):
+def basic_tables_content(client_id, object_id, session, entries=True):
     response = dict()
     query = session.query(Dictionary).filter_by(client_id=client_id,
                                                 object_id=object_id).all()
@@ -377,6 +393,8 @@ def basic_tables_content(client_id, object_id, session):
         .filter(DictionaryPerspective.parent_client_id == client_id,
                 DictionaryPerspective.parent_object_id == object_id).all()
     create_tmp_resp(DictionaryPerspectiveToField, query, response)
+    if not entries:
+        return response
     query = session.query(LexicalEntry).join(LexicalEntry.parent) \
         .filter(DictionaryPerspective.parent_client_id == client_id,
                 DictionaryPerspective.parent_object_id == object_id).all()
@@ -393,27 +411,283 @@ def basic_tables_content(client_id, object_id, session):
     return response
 
 
+def received_tables_content(server, session):
+    """
+    Gets local versions of lexical entries, entities and publishing entities received from the server.
+    """
+    response = dict()
+    for table in [LexicalEntry, Entity, PublishingEntity]:
+        server_ids = [(json_object['client_id'], json_object['object_id'])
+                      for json_object in server[table.__tablename__]]
+        query = session.query(table).filter(
+            tuple_(table.client_id, table.object_id).in_(server_ids)).all() if server_ids else []
+        create_tmp_resp(table, query, response)
+    return response
+
+
+def stream_lexical_entries(path, cookies, chunk_size=500, max_retries=10):
+    """
+    Yields lexical entries from a streaming newline-delimited JSON export of a perspective.
+
+    If the connection breaks, export is requested again starting after the last received entry, so that
+    received entries are neither lost nor downloaded twice.
+    """
+    session = make_session()
+    params = {'chunk_size': chunk_size}
+    retries = 0
+    while True:
+        status = None
+        try:
+            status = session.get(path, params=params, cookies=cookies, stream=True)
+            status.raise_for_status()
+            for line in status.iter_lines():
+                if not line:
+                    continue
+                try:
+                    lexical_entry_json = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    raise requests.exceptions.ChunkedEncodingError('Truncated line in %s' % path)
+                params['after_client_id'] = lexical_entry_json['client_id']
+                params['after_object_id'] = lexical_entry_json['object_id']
+                yield lexical_entry_json
+            return
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            retries += 1
+            if retries > max_retries:
+                raise
+            log.warning('export of %s interrupted, resuming after %s %s' % (
+                path, params.get('after_client_id'), params.get('after_object_id')))
+        finally:
+            if status is not None:
+                status.close()
+
+
+def perspective_lexical_entries(central_server, client_id, object_id, perspective_json, cookies):
+    """
+    Yields all lexical entries of a perspective, or only published ones if we are not allowed to view all.
+    """
+    path = central_server + 'dictionary/%s/%s/perspective/%s/%s/' % (
+        client_id,
+        object_id,
+        perspective_json['client_id'],
+        perspective_json['object_id'])
+    received = False
+    try:
+        for lexical_entry_json in stream_lexical_entries(path + 'all_stream', cookies):
+            received = True
+            yield lexical_entry_json
+        return
+    except requests.exceptions.HTTPError as error:
+        if received or error.response.status_code not in (403, 404):
+            raise
+        legacy_flag = error.response.status_code == 404
+    if not legacy_flag:
+        for lexical_entry_json in stream_lexical_entries(path + 'published_stream', cookies):
+            yield lexical_entry_json
+        return
+
+    # Servers of versions without streaming export respond with 404, then we use list export, in the same
+    # way as synchronization falls back to full lists, see diff_desk.
+
+    try:
+        lexical_entry_jsons = list_lexical_entries(path + 'all', cookies)
+    except requests.exceptions.HTTPError as error:
+        if error.response.status_code != 403:
+            raise
+        lexical_entry_jsons = list_lexical_entries(path + 'published', cookies)
+    for lexical_entry_json in lexical_entry_jsons:
+        yield lexical_entry_json
+
+
+def list_lexical_entries(path, cookies):
+    """
+    Gets all lexical entries of a perspective from a non-streaming list export, 'path' should end with either
+    'all' or 'published'.
+    """
+    count_json = make_request(path + '_count', cookies)
+    count_json.raise_for_status()
+    all_json = make_request(path + '?start_from=0&count=%s' % count_json.json()['count'], cookies)
+    all_json.raise_for_status()
+    lexical_entry_jsons = all_json.json()
+    # In preview mode entities are hidden and only first lexical entries are available.
+    if lexical_entry_jsons and lexical_entry_jsons[0].get('contains') and \
+            'entity hidden: you' in (lexical_entry_jsons[0]['contains'][0].get('content') or '').lower():
+        all_json = make_request(path + '?start_from=0&count=%s' % 20, cookies)
+        all_json.raise_for_status()
+        lexical_entry_jsons = all_json.json()
+    return lexical_entry_jsons
+
+
+def save_lexical_entries(lexical_entry_jsons, storage, session, cookies):
+    """
+    Saves a batch of lexical entries with their entities received from the server, updating already
+    existing ones. Returns False if contents of entities could not be downloaded.
+    """
+    new_jsons = dict()
+    for table in [LexicalEntry, Entity, PublishingEntity]:
+        new_jsons[table.__tablename__] = list()
+    for lexical_entry_json in lexical_entry_jsons:
+        new_jsons['lexicalentry'].append(dict2strippeddict(lexical_entry_json, LexicalEntry))
+        for entity_json in lexical_entry_json['contains']:
+            if not entity_json.get('self_client_id'):
+                # if entity.json.get('link_client_id') and entity.json.get('link_object_id'):s
+
+                new_jsons['entity'].append(entity_json)
+
+                new_jsons['publishingentity'].append(dict2strippeddict(entity_json, PublishingEntity))
+                for inner_entity in entity_json['contains']:  # TODO: infinite nesting
+                    new_jsons['entity'].append(inner_entity)
+                    new_jsons['publishingentity'].append(dict2strippeddict(inner_entity, PublishingEntity))
+    response = received_tables_content(new_jsons, session)
+    for key in new_jsons:
+        tmp = create_nested_content(new_jsons[key])
+        new_jsons[key] = tmp
+
+    new_objects, new_entities, publ_entities = create_objects(new_jsons, response, session,
+                                                              [LexicalEntry, Entity, PublishingEntity])
+    session.bulk_save_objects(new_objects)
+    entities_objects = create_new_entities(new_entities, storage=storage, session=session, cookies=cookies)
+    if entities_objects is None:
+        return False
+    session.bulk_save_objects(entities_objects)
+    session.bulk_save_objects(publ_entities)
+    invalidate_etymology_groups(session, entities_objects)
+    invalidate_statistics_rollup(session, new_objects + entities_objects + publ_entities)
+    return True
+
+
 #                    folder_name=None, up_lvl=None, locale_id=2,
 #                   storage=None)
 
 
-def create_new_entities(new_entities, storage, session, cookies):  # add queue
+def is_media(data_type):
+    return data_type == 'image' or data_type == 'sound' or 'markup' in data_type
+
+
+def entity_file_location(entity, filename, storage):
+    """
+    Gets local storage path and url of a file of an entity given as a dict, in the same way as
+    create_object.
+    """
+    filename = sanitize_filename(filename)
+    storage_dir = os.path.join(storage["path"], Entity.__tablename__,
+                               str(entity['client_id']), str(entity['object_id']))
+    os.makedirs(storage_dir, exist_ok=True)
+    url = "".join((storage["prefix"],
+                   storage["static_route"],
+                   Entity.__tablename__,
+                   '/',
+                   str(entity['client_id']), '/',
+                   str(entity['object_id']), '/',
+                   filename))
+    return os.path.join(storage_dir, filename), url
+
+
+def download_file(http_session, url, storage_path, cookies):
+    """
+    Streams a file straight to the local storage, returning its content hash, or None if the file could
+    not be downloaded.
+    """
+    try:
+        status = http_session.get(url, cookies=cookies, stream=True)
+        try:
+            if status.status_code != 200:
+                log.error(url)
+                return None
+            content_hash = hashlib.sha224()
+            with open(storage_path, 'wb+') as f:
+                for chunk in status.iter_content(chunk_size=65536):
+                    content_hash.update(chunk)
+                    f.write(chunk)
+            return content_hash.hexdigest()
+        finally:
+            status.close()
+    except requests.exceptions.RequestException as error:
+        log.error('%s: %s' % (url, error))
+        return None
+
+
+def fetch_media(new_entities, storage, session, cookies, max_workers=8):
+    """
+    Downloads files of media entities into the local storage.
+
+    Files are streamed straight to their storage paths by a bounded number of threads sharing a pool of
+    connections. Files with hashes already present locally and files repeated in the batch are
+    downloaded at most once and then shared. Returns a dict of (real_location, url, hash) by entity id,
+    or None if some file could not be downloaded.
+    """
+    media_entities = [entity for entity in new_entities if is_media(entity['data_type'].lower())]
+    if not media_entities:
+        return dict()
+
+    def file_key(entity):
+        content_hash = (entity.get('additional_metadata') or {}).get('hash')
+        return ('hash', content_hash) if content_hash else ('url', entity['content'])
+
+    # Files with the same hash already stored locally are reused.
+    local_dict = dict()
+    hash_list = list(set(key[1] for key in map(file_key, media_entities) if key[0] == 'hash'))
+    if hash_list:
+        url_prefix = storage["prefix"] + storage["static_route"]
+        hash_query = session.query(Entity.additional_metadata['hash'].astext, Entity.content).filter(
+            Entity.additional_metadata['hash'].astext.in_(hash_list),
+            Entity.marked_for_deletion == False)
+        for content_hash, url in hash_query:
+            if not url or not url.startswith(url_prefix) or ('hash', content_hash) in local_dict:
+                continue
+            real_location = os.path.join(storage["path"], *url[len(url_prefix):].split('/'))
+            if os.path.exists(real_location):
+                local_dict[('hash', content_hash)] = (real_location, url, content_hash)
+
+    stored_dict = dict()
+    job_dict = dict()
+    for entity in media_entities:
+        entity_id = (entity['client_id'], entity['object_id'])
+        key = file_key(entity)
+        if key in local_dict:
+            stored_dict[entity_id] = local_dict[key]
+        elif key in job_dict:
+            job_dict[key][1].append(entity_id)
+        else:
+            full_name = entity['content'].split('/')
+            storage_path, url = entity_file_location(entity, full_name[len(full_name) - 1], storage)
+            job_dict[key] = ((entity['content'], storage_path, url), [entity_id])
+
+    http_session = requests.Session()
+    http_session.headers.update({'Connection': 'Keep-Alive'})
+    http_session.mount('http://', requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_workers, max_retries=10))
+    http_session.mount('https://', requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=max_workers, max_retries=10))
+
+    job_list = list(job_dict.values())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        hash_list = list(executor.map(
+            lambda job: download_file(http_session, job[0][0], job[0][1], cookies), job_list))
+    http_session.close()
+
+    for ((content, storage_path, url), entity_id_list), content_hash in zip(job_list, hash_list):
+        if content_hash is None:
+            return None
+        for entity_id in entity_id_list:
+            stored_dict[entity_id] = (storage_path, url, content_hash)
+    return stored_dict
+
+
+def create_new_entities(new_entities, storage, session, cookies):
     entities_objects = list()
+    stored_dict = fetch_media(new_entities, storage, session, cookies)
+    if stored_dict is None:
+        session.rollback()
+        return
     for entity in new_entities:
         content = entity.get('content')
-        data_type = entity['data_type'].lower()
         filename = None
-        if data_type == 'image' or data_type == 'sound' or 'markup' in data_type:
+        stored = stored_dict.get((entity['client_id'], entity['object_id']))
+        if stored:
             full_name = content.split('/')
             filename = full_name[len(full_name) - 1]
-            content = make_request(content, cookies)
-            if content.status_code != 200:
-                log.error(entity['content'])
-                session.rollback()
-                return
-
-            content = content.content
-            content = base64.urlsafe_b64encode(content)
+            content = None
 
         entity_obj, publ_obj = create_entity(session,
                                              entity['parent_client_id'],
@@ -431,6 +705,7 @@ def create_new_entities(new_entities, storage, session, cookies):  # add queue
                                              storage=storage,
                                              published=entity.get('published'),
                                              accepted=entity.get('accepted'),
+                                             stored=stored
                                              )
 
         entities_objects.append(entity_obj)
@@ -460,8 +735,7 @@ def download(
     log.setLevel(logging.DEBUG)
     # with transaction.manager:
     new_jsons = dict()
-    for table in [Dictionary, DictionaryPerspective, DictionaryPerspectiveToField,
-                  LexicalEntry, Entity, PublishingEntity]:
+    for table in [Dictionary, DictionaryPerspective, DictionaryPerspectiveToField]:
         new_jsons[table.__tablename__] = list()
     # new_entity_jsons = list()
     dictionary_json = make_request(central_server + 'dictionary/%s/%s' % (client_id, object_id), cookies)
@@ -512,95 +786,45 @@ def download(
                 dict2strippeddict(field_json, DictionaryPerspectiveToField))  # todo: think about it
 
         new_jsons['dictionaryperspective'].append(dict2strippeddict(perspective_json, DictionaryPerspective))
-        count_json = make_request(central_server + 'dictionary/%s/%s/perspective/%s/%s/all_count' % (
-            client_id,
-            object_id,
-            perspective_json['client_id'],
-            perspective_json['object_id']), cookies)
-        if count_json.status_code != 200:
-            log.error('count fail', count_json.status_code)
-            session.rollback()
-            return
-        count_json = count_json.json()
-        all_json = make_request(central_server + 'dictionary/%s/%s/perspective/%s/%s/all?start_from=0&count=%s' % (
-            client_id,
-            object_id,
-            perspective_json['client_id'],
-            perspective_json['object_id'],
-            count_json['count']), cookies)
-        published_json = None
-
-        if all_json.status_code != 200:
-            if all_json.status_code == 403:
-                count_json = make_request(central_server + 'dictionary/%s/%s/perspective/%s/%s/published_count' % (
-                    client_id,
-                    object_id,
-                    perspective_json['client_id'],
-                    perspective_json['object_id']), cookies)
-                if count_json.status_code != 200:
-                    log.error('count fail', count_json.status_code)
-                    session.rollback()
-                    return
-                count_json = count_json.json()
-                published_json = make_request(
-                    central_server + 'dictionary/%s/%s/perspective/%s/%s/published?start_from=0&count=%s' % (
-                        client_id,
-                        object_id,
-                        perspective_json['client_id'],
-                        perspective_json['object_id'],
-                        count_json['count']), cookies)
-                if published_json.status_code != 200:
-                    log.error('published fail', all_json.status_code)
-                    session.rollback()
-                    return
-                else:
-                    publ_json = published_json.json()
-                    if len(publ_json) > 0 and publ_json[0].get('contains') and len(publ_json[0]['contains']) > 0 and \
-                            published_json.json()[0]['contains'][0].get('content') and 'entity hidden: you' in \
-                            published_json.json()[0]['contains'][0]['content'].lower():
-                        published_json = make_request(
-                            central_server + 'dictionary/%s/%s/perspective/%s/%s/published?start_from=0&count=%s' % (
-                                client_id,
-                                object_id,
-                                perspective_json['client_id'],
-                                perspective_json['object_id'],
-                                20), cookies)
-                        if published_json.status_code != 200:
-                            session.rollback()
-                            return
-
-            else:
-                log.error('get all fail', all_json.status_code)
-                session.rollback()
-                return
-        if published_json:
-            all_json = published_json
-        all_json = all_json.json()
-        for lexical_entry_json in all_json:
-            new_jsons['lexicalentry'].append(dict2strippeddict(lexical_entry_json, LexicalEntry))
-            for entity_json in lexical_entry_json['contains']:
-                if not entity_json.get('self_client_id'):
-                    # if entity.json.get('link_client_id') and entity.json.get('link_object_id'):s
-
-                    new_jsons['entity'].append(entity_json)
-
-                    new_jsons['publishingentity'].append(dict2strippeddict(entity_json, PublishingEntity))
-                    for inner_entity in entity_json['contains']:  # TODO: infinite nesting
-                        new_jsons['entity'].append(inner_entity)
-                        new_jsons['publishingentity'].append(dict2strippeddict(inner_entity, PublishingEntity))
-    response = basic_tables_content(client_id, object_id, session)
+    response = basic_tables_content(client_id, object_id, session, entries=False)
     for key in new_jsons:
         tmp = create_nested_content(new_jsons[key])
         new_jsons[key] = tmp
 
-    new_objects, new_entities, publ_entities = create_objects(new_jsons, response, session)
+    new_objects, new_entities, publ_entities = create_objects(
+        new_jsons, response, session, [Dictionary, DictionaryPerspective, DictionaryPerspectiveToField])
 
     task_status.set(2, 30, "Got objects from server", "")
     session.bulk_save_objects(new_objects)
     task_status.set(3, 40, "Created objects until entities", "")
-    session.bulk_save_objects(create_new_entities(new_entities, storage=storage, session=session, cookies=cookies))
+
+    # Lexical entries are streamed from the server and saved in batches, so that neither the server nor
+    # we ever have to hold the whole dictionary in memory.
+    batch_size = 500
+    for perspective_json in perspectives_json:
+        lexical_entry_jsons = list()
+        try:
+            for lexical_entry_json in perspective_lexical_entries(
+                    central_server, client_id, object_id, perspective_json, cookies):
+                lexical_entry_jsons.append(lexical_entry_json)
+                if len(lexical_entry_jsons) >= batch_size:
+                    if not save_lexical_entries(lexical_entry_jsons, storage, session, cookies):
+                        log.error('media fail')
+                        session.rollback()
+                        task_status.set(5, 100, "Finished (ERROR), failed to download media files", "")
+                        return
+                    lexical_entry_jsons = list()
+        except requests.exceptions.RequestException as error:
+            log.error('get all fail: %s' % error)
+            session.rollback()
+            task_status.set(5, 100, "Finished (ERROR), failed to download lexical entries", "")
+            return
+        if lexical_entry_jsons and not save_lexical_entries(lexical_entry_jsons, storage, session, cookies):
+            log.error('media fail')
+            session.rollback()
+            task_status.set(5, 100, "Finished (ERROR), failed to download media files", "")
+            return
     task_status.set(4, 90, "Created entities", "")
-    session.bulk_save_objects(publ_entities)
     log.error('dictionary %s %s downloaded' % (client_id, object_id))
     task_status.set(5, 100, "Finished", "")
     session.commit()
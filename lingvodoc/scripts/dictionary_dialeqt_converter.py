@@ -16,6 +16,7 @@ from sqlalchemy import and_
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.attributes import flag_modified
 from lingvodoc.cache.caching import TaskStatus
+from lingvodoc.utils import etymology
 
 from lingvodoc.models import (
     Client,
@@ -42,45 +43,20 @@ def find_lexical_entries_by_tags(tags, field_client_id, field_object_id):
         .join(LexicalEntry.entity) \
         .join(Entity.publishingentity) \
         .join(Entity.field) \
-        .filter(Entity.content.in_(tags),
+        .filter(Entity.content.in_(list(tags)),
                 PublishingEntity.accepted == True,
                 Field.client_id == field_client_id,
                 Field.object_id == field_object_id).all()
 
 def find_all_tags(lexical_entry, field_client_id, field_object_id):
-    tag = None
-    for entity in lexical_entry.entity:
-        if entity.field.data_type == 'Grouping Tag':
-            tag = entity.content
-            break
-    if not tag:
-        return []
-    else:
-        tags = [tag]
-        new_tags = [tag]
-        while new_tags:
-            lexical_entries = find_lexical_entries_by_tags(new_tags, field_client_id, field_object_id)
-            new_tags = list()
-            for lex in lexical_entries:
-                entities = DBSession.query(Entity) \
-                    .join(Entity.field) \
-                    .join(Entity.publishingentity) \
-                    .filter(Entity.parent == lex,
-                            PublishingEntity.accepted == True,
-                            Field.client_id == field_client_id,
-                            Field.object_id == field_object_id).all()
-                for entity in entities:
-                    if entity.content not in tags:
-                        tags.append(entity.content)
-                        new_tags.append(entity.content)
-        return tags
+    return etymology.find_all_tags(lexical_entry, field_client_id, field_object_id, True)
 
 def create_group_entity(request, client, user):  # tested
         response = dict()
         req = request
-        tags = list()
+        tags = set()
         if 'tag' in req:
-            tags.append(req['tag'])
+            tags.add(req['tag'])
         field_client_id=req['field_client_id']
         field_object_id=req['field_object_id']
         field = DBSession.query(Field).\
@@ -94,15 +70,12 @@ def create_group_entity(request, client, user):  # tested
                 filter_by(client_id=par['client_id'], object_id=par['object_id']).first()
             if not parent:
                 return {'error': str("No such lexical entry in the system")}
-            par_tags = find_all_tags(parent, field_client_id, field_object_id)
-            for tag in par_tags:
-                if tag not in tags:
-                    tags.append(tag)
+            tags.update(find_all_tags(parent, field_client_id, field_object_id))
         if not tags:
             n = 10  # better read from settings
             tag = time.ctime() + ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits)
                                          for c in range(n))
-            tags.append(tag)
+            tags.add(tag)
         lexical_entries = find_lexical_entries_by_tags(tags, field_client_id, field_object_id)
         for par in req['connections']:
             parent = DBSession.query(LexicalEntry).\
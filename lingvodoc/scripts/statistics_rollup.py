@@ -0,0 +1,38 @@
+import os
+import sys
+
+from sqlalchemy import engine_from_config
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+    )
+
+from pyramid.scripts.common import parse_vars
+
+from ..models import DBSession
+from ..utils.statistics import backfill_rollup
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [--force] [var=value]\n'
+          '(example: "%s development.ini")\n'
+          'Computes statistics rollup of perspectives where it is out of date, or of all perspectives\n'
+          'with --force.' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+    config_uri = argv[1]
+    force = '--force' in argv[2:]
+    options = parse_vars([arg for arg in argv[2:] if arg != '--force'])
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri, options=options)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+
+    DBSession.configure(bind=engine)
+    count = backfill_rollup(force=force)
+    print('Statistics rollup computed for %s perspectives.' % count)
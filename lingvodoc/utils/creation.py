@@ -17,7 +17,6 @@ from lingvodoc.models import (
 
 from lingvodoc.views.v2.utils import add_user_to_group
 from lingvodoc.schema.gql_holders import ResponseError
-from lingvodoc.views.v2.translations import translationgist_contents
 
 from sqlalchemy import (
     and_,
@@ -31,18 +30,6 @@ import base64
 import hashlib
 
 
-
-def translation_service_search(searchstring):
-    translationatom = DBSession.query(TranslationAtom)\
-        .join(TranslationGist).\
-        filter(TranslationAtom.content == searchstring,
-               TranslationAtom.locale_id == 2,
-               TranslationGist.type == 'Service')\
-        .order_by(TranslationAtom.client_id)\
-        .first()
-    response = translationgist_contents(translationatom.parent)
-    return response
-
 def create_perspective(id = (None, None),
                        parent_id=None,
                        translation_gist_id=(None, None),
@@ -59,8 +46,8 @@ def create_perspective(id = (None, None),
     parent = DBSession.query(Dictionary).filter_by(client_id=parent_client_id, object_id=parent_object_id).first()
     if not parent:
         raise ResponseError(message="No such dictionary in the system")
-    resp = translation_service_search("WiP")
-    state_translation_gist_object_id, state_translation_gist_client_id = resp['object_id'], resp['client_id']
+    state_translation_gist_client_id, state_translation_gist_object_id = \
+        TranslationGist.get_service_gist_id('WiP')
 
     dbperspective = DictionaryPerspective(client_id=client_id,
                                   object_id=object_id,
@@ -103,8 +90,8 @@ def create_dbdictionary(id=None,
     if duplicate_check:
         raise ResponseError(message="Dictionary with such ID already exists in the system")
     parent = DBSession.query(Language).filter_by(client_id=parent_client_id, object_id=parent_object_id).first()
-    resp = translation_service_search("WiP")
-    state_translation_gist_object_id, state_translation_gist_client_id = resp['object_id'], resp['client_id']
+    state_translation_gist_client_id, state_translation_gist_object_id = \
+        TranslationGist.get_service_gist_id('WiP')
     dbdictionary_obj = Dictionary(client_id=client_id,
                                     object_id=object_id,
                                     state_translation_gist_object_id=state_translation_gist_object_id,
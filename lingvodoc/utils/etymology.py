@@ -0,0 +1,152 @@
+from lingvodoc.models import (
+    DBSession,
+    Entity,
+    EtymologyGroup,
+    LexicalEntry,
+    PublishingEntity
+)
+
+from sqlalchemy import (
+    and_,
+    tuple_
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+
+
+# Etymology groups without regard to acceptance of grouping tags are materialized in the etymologygroup
+# table, see EtymologyGroup. A group is materialized as a whole on its first lookup, or immediately after
+# its lexical entries are connected, and is removed when any of its grouping tags changes, see
+# invalidate_etymology_groups.
+
+
+def tag_filter(query, entity, field_client_id, field_object_id, accepted):
+    """
+    Restricts a query to non-deleted grouping tag entities of a specified field, optionally only to accepted
+    ones.
+    """
+    query = query.filter(entity.field_client_id == field_client_id,
+                         entity.field_object_id == field_object_id,
+                         entity.marked_for_deletion == False)
+    if accepted:
+        publishing = aliased(PublishingEntity)
+        query = query.filter(publishing.client_id == entity.client_id,
+                             publishing.object_id == entity.object_id,
+                             publishing.accepted == True)
+    return query
+
+
+def tag_closure(entry_id, field_client_id, field_object_id, accepted):
+    """
+    Gets a recursive CTE of all grouping tags transitively connected to a lexical entry, i.e. its own tags,
+    tags of lexical entries sharing any of them, and so on.
+
+    UNION discards already found tags, so recursion stops as soon as no new tags are found.
+    """
+    seed = aliased(Entity, name='seed')
+    closure = tag_filter(DBSession.query(seed.content.label('content')),
+                         seed, field_client_id, field_object_id, accepted) \
+        .filter(seed.parent_client_id == entry_id[0],
+                seed.parent_object_id == entry_id[1]) \
+        .cte(name='tag_closure', recursive=True)
+
+    linking = aliased(Entity, name='linking')
+    linked = aliased(Entity, name='linked')
+    step = DBSession.query(linked.content) \
+        .filter(linking.content == closure.c.content,
+                linked.parent_client_id == linking.parent_client_id,
+                linked.parent_object_id == linking.parent_object_id)
+    step = tag_filter(step, linking, field_client_id, field_object_id, accepted)
+    step = tag_filter(step, linked, field_client_id, field_object_id, accepted)
+
+    return closure.union(step)
+
+
+def find_all_tags(lexical_entry, field_client_id, field_object_id, accepted):
+    """
+    Gets the set of all grouping tags of the etymology group of a lexical entry in a single query.
+    """
+    closure = tag_closure((lexical_entry.client_id, lexical_entry.object_id),
+                          field_client_id, field_object_id, accepted)
+    return set(content for content, in DBSession.query(closure.c.content))
+
+
+def materialize_group(entry_id, field_client_id, field_object_id):
+    """
+    Materializes the etymology group of a lexical entry, returns id of the group or None if the entry has
+    no grouping tags of the field.
+    """
+    closure = tag_closure(entry_id, field_client_id, field_object_id, False)
+    entry_id_list = sorted(
+        tag_filter(DBSession.query(Entity.parent_client_id, Entity.parent_object_id),
+                   Entity, field_client_id, field_object_id, False)
+        .filter(Entity.content.in_(DBSession.query(closure.c.content)))
+        .distinct())
+    if not entry_id_list:
+        return None
+
+    group_id = tuple(entry_id_list[0])
+    DBSession.query(EtymologyGroup).filter(
+        EtymologyGroup.field_client_id == field_client_id,
+        EtymologyGroup.field_object_id == field_object_id,
+        tuple_(EtymologyGroup.entry_client_id, EtymologyGroup.entry_object_id).in_(entry_id_list)) \
+        .delete(synchronize_session=False)
+
+    # Concurrent lookups can materialize the same group at the same time, and they compute the same rows.
+    DBSession.execute(insert(EtymologyGroup.__table__).values([
+        {'field_client_id': field_client_id,
+         'field_object_id': field_object_id,
+         'entry_client_id': client_id,
+         'entry_object_id': object_id,
+         'group_client_id': group_id[0],
+         'group_object_id': group_id[1]}
+        for client_id, object_id in entry_id_list]).on_conflict_do_nothing())
+    return group_id
+
+
+def entry_group(entry_id, field_client_id, field_object_id):
+    """
+    Gets id of the etymology group of a lexical entry, materializing the group if required, or None if the
+    entry has no grouping tags of the field.
+    """
+    group_id = DBSession.query(EtymologyGroup.group_client_id, EtymologyGroup.group_object_id).filter_by(
+        field_client_id=field_client_id, field_object_id=field_object_id,
+        entry_client_id=entry_id[0], entry_object_id=entry_id[1]).first()
+    if group_id:
+        return tuple(group_id)
+    return materialize_group(entry_id, field_client_id, field_object_id)
+
+
+def find_group_entries(lexical_entry, field_client_id, field_object_id):
+    """
+    Gets all lexical entries of the etymology group of a lexical entry with a single indexed lookup once
+    the group is materialized.
+    """
+    group_id = entry_group((lexical_entry.client_id, lexical_entry.object_id), field_client_id, field_object_id)
+    if not group_id:
+        return []
+    return DBSession.query(LexicalEntry).join(EtymologyGroup, and_(
+        EtymologyGroup.entry_client_id == LexicalEntry.client_id,
+        EtymologyGroup.entry_object_id == LexicalEntry.object_id)).filter(
+        EtymologyGroup.field_client_id == field_client_id,
+        EtymologyGroup.field_object_id == field_object_id,
+        EtymologyGroup.group_client_id == group_id[0],
+        EtymologyGroup.group_object_id == group_id[1]).all()
+
+
+def find_group_tags(lexical_entry, field_client_id, field_object_id):
+    """
+    Gets the set of all grouping tags of the materialized etymology group of a lexical entry.
+    """
+    group_id = entry_group((lexical_entry.client_id, lexical_entry.object_id), field_client_id, field_object_id)
+    if not group_id:
+        return set()
+    return set(content for content, in tag_filter(
+        DBSession.query(Entity.content).join(EtymologyGroup, and_(
+            EtymologyGroup.entry_client_id == Entity.parent_client_id,
+            EtymologyGroup.entry_object_id == Entity.parent_object_id)),
+        Entity, field_client_id, field_object_id, False).filter(
+        EtymologyGroup.field_client_id == field_client_id,
+        EtymologyGroup.field_object_id == field_object_id,
+        EtymologyGroup.group_client_id == group_id[0],
+        EtymologyGroup.group_object_id == group_id[1]))
@@ -0,0 +1,136 @@
+from lingvodoc.models import (
+    DBSession,
+    Dictionary,
+    DictionaryPerspective,
+    Entity,
+    LexicalEntry,
+    TranslationGist
+)
+from lingvodoc.schema.gql_holders import ResponseError
+
+from sqlalchemy import (
+    and_,
+    func,
+    or_,
+    tuple_,
+    union_all
+)
+
+
+# Entity content search is backed by the trigram index on entity.content (see the
+# 'entity content trigram index' migration), which serves both substring LIKE filtering and
+# similarity ranking.
+
+
+def search_filter(searchstring, field_id=None):
+    """
+    Gets a condition on entities with content containing the search string, optionally restricted to
+    entities of a specified field.
+    """
+    condition = Entity.content.like('%' + searchstring + '%')
+    if field_id:
+        condition = and_(condition,
+                         Entity.field_client_id == field_id[0],
+                         Entity.field_object_id == field_id[1])
+    return condition
+
+
+def search_rank(searchstring):
+    """
+    Gets trigram similarity of entity content to the search string.
+    """
+    return func.coalesce(func.similarity(Entity.content, searchstring), 0)
+
+
+def ranked_lexical_entries(searchstring, entity_query_list, after=None, first=None):
+    """
+    Gets lexical entries of entities selected by a list of entity queries, ordered by best similarity of
+    their entities to the search string.
+
+    Entries of deleted and hidden perspectives are skipped. Results can be paginated by the number of
+    entries and by the id of the last entry of the previous page, which must be one of the found entries.
+    """
+    select_list = [
+        query.with_entities(Entity.parent_client_id.label('client_id'),
+                            Entity.parent_object_id.label('object_id'),
+                            search_rank(searchstring).label('rank')).statement
+        for query in entity_query_list]
+    entity_rank = (union_all(*select_list) if len(select_list) > 1 else select_list[0]).alias('entity_rank')
+
+    entry_rank = DBSession.query(entity_rank.c.client_id,
+                                 entity_rank.c.object_id,
+                                 func.max(entity_rank.c.rank).label('rank')) \
+        .group_by(entity_rank.c.client_id, entity_rank.c.object_id).subquery()
+
+    hidden_client_id, hidden_object_id = TranslationGist.get_service_gist_id('Hidden')
+
+    results_cursor = DBSession.query(LexicalEntry).join(entry_rank, and_(
+        LexicalEntry.client_id == entry_rank.c.client_id,
+        LexicalEntry.object_id == entry_rank.c.object_id)) \
+        .join(DictionaryPerspective, and_(
+            DictionaryPerspective.client_id == LexicalEntry.parent_client_id,
+            DictionaryPerspective.object_id == LexicalEntry.parent_object_id)) \
+        .join(Dictionary, and_(
+            Dictionary.client_id == DictionaryPerspective.parent_client_id,
+            Dictionary.object_id == DictionaryPerspective.parent_object_id)) \
+        .filter(LexicalEntry.marked_for_deletion == False,
+                DictionaryPerspective.marked_for_deletion == False,
+                Dictionary.marked_for_deletion == False,
+                tuple_(DictionaryPerspective.state_translation_gist_client_id,
+                       DictionaryPerspective.state_translation_gist_object_id) !=
+                tuple_(hidden_client_id, hidden_object_id),
+                tuple_(Dictionary.state_translation_gist_client_id,
+                       Dictionary.state_translation_gist_object_id) !=
+                tuple_(hidden_client_id, hidden_object_id))
+
+    if after:
+        after_rank = results_cursor.with_entities(entry_rank.c.rank).filter(
+            entry_rank.c.client_id == after[0],
+            entry_rank.c.object_id == after[1]).scalar()
+        if after_rank is None:
+            raise ResponseError(message="No such lexical entry in the search results")
+        results_cursor = results_cursor.filter(or_(
+            entry_rank.c.rank < after_rank,
+            and_(entry_rank.c.rank == after_rank,
+                 tuple_(entry_rank.c.client_id, entry_rank.c.object_id) > tuple_(after[0], after[1]))))
+
+    results_cursor = results_cursor.order_by(
+        entry_rank.c.rank.desc(), entry_rank.c.client_id, entry_rank.c.object_id)
+
+    if first:
+        results_cursor = results_cursor.limit(first)
+    return results_cursor.all()
+
+
+def rank_lexical_entries(entries, searchstring, after=None, first=None):
+    """
+    Orders already found lexical entries by best similarity of their entities to the search string, with
+    the same pagination as ranked_lexical_entries.
+    """
+    entries = list(entries)
+    if not entries:
+        return entries
+
+    rank_dict = dict(
+        ((client_id, object_id), rank)
+        for client_id, object_id, rank in DBSession.query(
+            Entity.parent_client_id, Entity.parent_object_id, func.max(search_rank(searchstring)))
+        .filter(tuple_(Entity.parent_client_id, Entity.parent_object_id).in_(
+            [(entry.client_id, entry.object_id) for entry in entries]),
+            Entity.marked_for_deletion == False)
+        .group_by(Entity.parent_client_id, Entity.parent_object_id))
+
+    def sort_key(entry):
+        return -(rank_dict.get((entry.client_id, entry.object_id)) or 0), entry.client_id, entry.object_id
+
+    entries.sort(key=sort_key)
+
+    if after:
+        key_list = [(entry.client_id, entry.object_id) for entry in entries]
+        after = tuple(after)
+        if after not in key_list:
+            raise ResponseError(message="No such lexical entry in the search results")
+        entries = entries[key_list.index(after) + 1:]
+    if first:
+        entries = entries[:first]
+    return entries
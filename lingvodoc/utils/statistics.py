@@ -12,10 +12,12 @@ import traceback
 
 # External imports.
 
+import transaction
+
 from pyramid.response import Response
 from pyramid.view import view_config
 
-from sqlalchemy import and_, BigInteger, cast, extract, func, tuple_
+from sqlalchemy import and_, BigInteger, cast, extract, func, select, tuple_
 from sqlalchemy.orm import aliased
 
 # Lingvodoc imports.
@@ -32,6 +34,8 @@ from lingvodoc.models import (
     LexicalEntry,
     PublishingEntity,
     RUSSIAN_LOCALE,
+    StatisticsRollup,
+    StatisticsRollupPerspective,
     TranslationAtom,
     TranslationGist,
     User,
@@ -45,16 +49,6 @@ from lingvodoc.views.v2.utils import add_user_to_group
 from lingvodoc.schema.gql_holders import ResponseError
 
 log = logging.getLogger(__name__)
-def translation_service_search(searchstring):
-    translationatom = DBSession.query(TranslationAtom)\
-        .join(TranslationGist).\
-        filter(TranslationAtom.content == searchstring,
-               TranslationAtom.locale_id == 2,
-               TranslationGist.type == 'Service')\
-        .order_by(TranslationAtom.client_id)\
-        .first()
-    response = translationgist_contents(translationatom.parent)
-    return response
 
 
 #: Set of statistically simple field types, statistics of entities belonging to fields with these types are
@@ -62,6 +56,562 @@ def translation_service_search(searchstring):
 simple_field_type_set = set(['image', 'link', 'markup', 'sound', 'text'])
 
 
+#: Length of a day in seconds, statistics rollup counts objects by days since the Unix epoch.
+ROLLUP_DAY = 86400
+
+
+def created_at_expression(model):
+    """
+    Gets creation time of lexical entries or entities as a Unix timestamp, taking into account creation
+    time of merged objects.
+    """
+    return func.coalesce(
+        cast(model.additional_metadata[('merge', 'min_created_at')].astext, BigInteger),
+        extract('epoch', model.created_at))
+
+
+def client_id_expression(model):
+    """
+    Gets client id of lexical entries or entities, taking into account original clients of merged objects.
+    """
+    return func.coalesce(
+        cast(model.additional_metadata[('merge', 'original_client_id')].astext, BigInteger),
+        model.client_id)
+
+
+def field_type_dict(field_list):
+    """
+    Gets lowercase data types of fields by field ids in a single query.
+    """
+    type_dict = dict(
+        ((client_id, object_id), content.lower())
+        for client_id, object_id, content in DBSession.query(
+            TranslationAtom.parent_client_id, TranslationAtom.parent_object_id, TranslationAtom.content)
+        .filter(
+            tuple_(TranslationAtom.parent_client_id, TranslationAtom.parent_object_id).in_(set(
+                (field.data_type_translation_gist_client_id, field.data_type_translation_gist_object_id)
+                for field in field_list)),
+            TranslationAtom.locale_id == 2)) if field_list else {}
+
+    return dict(
+        ((field.client_id, field.object_id), type_dict.get(
+            (field.data_type_translation_gist_client_id, field.data_type_translation_gist_object_id)))
+        for field in field_list)
+
+
+def update_rollup(perspective_client_id, perspective_object_id, force = False):
+    """
+    Recomputes statistics rollup of a perspective, unless it is already up to date and 'force' is not set.
+    """
+
+    # Concurrent statistics requests can try to recompute rollup of the same perspective, so we wait for
+    # any other recomputation to finish and check if it made the rollup up to date.
+
+    DBSession.execute(select([func.pg_advisory_xact_lock(func.hashtext(
+        'statisticsrollup:{0}:{1}'.format(perspective_client_id, perspective_object_id)))]))
+
+    if not force and DBSession.query(StatisticsRollupPerspective).filter_by(
+        perspective_client_id = perspective_client_id,
+        perspective_object_id = perspective_object_id).first() is not None:
+
+        return
+
+    DBSession.query(StatisticsRollup).filter_by(
+        perspective_client_id = perspective_client_id,
+        perspective_object_id = perspective_object_id).delete(synchronize_session = False)
+
+    DBSession.query(StatisticsRollupPerspective).filter_by(
+        perspective_client_id = perspective_client_id,
+        perspective_object_id = perspective_object_id).delete(synchronize_session = False)
+
+    # Counting lexical entries by clients and days.
+
+    entry_query = (DBSession.query(
+        client_id_expression(LexicalEntry).label('client_id'),
+        cast(func.floor(created_at_expression(LexicalEntry) / ROLLUP_DAY), BigInteger).label('day'))
+
+        .filter(and_(
+            LexicalEntry.parent_client_id == perspective_client_id,
+            LexicalEntry.parent_object_id == perspective_object_id,
+            LexicalEntry.marked_for_deletion == False)).subquery())
+
+    count_list = [
+        (None, None, client_id, day, None, count)
+        for client_id, day, count in DBSession.query(
+            entry_query.c.client_id, entry_query.c.day, func.count('*')).group_by(
+                entry_query.c.client_id, entry_query.c.day)]
+
+    # Counting entities of simple fields by fields, clients, days and publishing status. Grouping tags are
+    # counted by lexical entries having tags in a time interval, which can't be summed over days, so they
+    # are not rolled up, see grouping_counts().
+
+    field_list = DBSession.query(Field).filter(and_(
+        DictionaryPerspectiveToField.parent_client_id == perspective_client_id,
+        DictionaryPerspectiveToField.parent_object_id == perspective_object_id,
+        DictionaryPerspectiveToField.marked_for_deletion == False,
+        Field.client_id == DictionaryPerspectiveToField.field_client_id,
+        Field.object_id == DictionaryPerspectiveToField.field_object_id,
+        Field.marked_for_deletion == False)).all()
+
+    simple_field_id_list = [
+        field_id for field_id, data_type in field_type_dict(field_list).items()
+        if data_type in simple_field_type_set]
+
+    if simple_field_id_list:
+
+        entity_query = (DBSession.query(
+
+            Entity.field_client_id,
+            Entity.field_object_id,
+            client_id_expression(Entity).label('client_id'),
+            cast(func.floor(created_at_expression(Entity) / ROLLUP_DAY), BigInteger).label('day'),
+            PublishingEntity.published)
+
+            .filter(and_(
+                LexicalEntry.parent_client_id == perspective_client_id,
+                LexicalEntry.parent_object_id == perspective_object_id,
+                LexicalEntry.marked_for_deletion == False,
+                Entity.parent_client_id == LexicalEntry.client_id,
+                Entity.parent_object_id == LexicalEntry.object_id,
+                tuple_(Entity.field_client_id, Entity.field_object_id).in_(simple_field_id_list),
+                Entity.marked_for_deletion == False,
+                PublishingEntity.client_id == Entity.client_id,
+                PublishingEntity.object_id == Entity.object_id)).subquery())
+
+        count_list.extend(DBSession.query(
+            entity_query.c.field_client_id, entity_query.c.field_object_id,
+            entity_query.c.client_id, entity_query.c.day, entity_query.c.published,
+            func.count('*'))
+
+            .group_by(
+                entity_query.c.field_client_id, entity_query.c.field_object_id,
+                entity_query.c.client_id, entity_query.c.day, entity_query.c.published).all())
+
+    DBSession.bulk_insert_mappings(StatisticsRollup, [
+        {'perspective_client_id': perspective_client_id,
+         'perspective_object_id': perspective_object_id,
+         'field_client_id': field_client_id,
+         'field_object_id': field_object_id,
+         'client_id': client_id,
+         'day': day,
+         'published': published,
+         'count': count}
+        for field_client_id, field_object_id, client_id, day, published, count in count_list])
+
+    DBSession.add(StatisticsRollupPerspective(
+        perspective_client_id = perspective_client_id,
+        perspective_object_id = perspective_object_id))
+
+    DBSession.flush()
+
+
+def grouping_counts(perspective_id_list, field_id_list, time_begin, time_end):
+    """
+    Gets counts of tags of given grouping tag fields of given perspectives created in a time interval
+    [time_begin, time_end) in the same way as 'stat_perspective' and 'stat_dictionary' count them, i.e. by
+    lexical entries having at least one tag of a field, of a client and of a publishing status in the
+    interval.
+
+    Returns tuples in the same format as rollup_counts().
+    """
+
+    entry_group_query = (DBSession.query(
+
+        LexicalEntry.parent_client_id.label('perspective_client_id'),
+        LexicalEntry.parent_object_id.label('perspective_object_id'),
+        LexicalEntry.client_id.label('entry_client_id'),
+        LexicalEntry.object_id.label('entry_object_id'),
+        Entity.field_client_id,
+        Entity.field_object_id,
+        client_id_expression(Entity).label('client_id'),
+        PublishingEntity.published)
+
+        .filter(and_(
+            tuple_(LexicalEntry.parent_client_id, LexicalEntry.parent_object_id).in_(perspective_id_list),
+            LexicalEntry.marked_for_deletion == False,
+            Entity.parent_client_id == LexicalEntry.client_id,
+            Entity.parent_object_id == LexicalEntry.object_id,
+            tuple_(Entity.field_client_id, Entity.field_object_id).in_(field_id_list),
+            Entity.marked_for_deletion == False,
+            PublishingEntity.client_id == Entity.client_id,
+            PublishingEntity.object_id == Entity.object_id,
+            created_at_expression(Entity) >= time_begin,
+            created_at_expression(Entity) < time_end)).distinct().subquery())
+
+    count_list = (DBSession.query(
+        entry_group_query.c.perspective_client_id, entry_group_query.c.perspective_object_id,
+        entry_group_query.c.field_client_id, entry_group_query.c.field_object_id,
+        entry_group_query.c.client_id, entry_group_query.c.published,
+        func.count('*'))
+
+        .group_by(
+            entry_group_query.c.perspective_client_id, entry_group_query.c.perspective_object_id,
+            entry_group_query.c.field_client_id, entry_group_query.c.field_object_id,
+            entry_group_query.c.client_id, entry_group_query.c.published).all())
+
+    return [row[:-1] + (int(row[-1]),) for row in count_list]
+
+
+def rollup_counts(perspective_id_list, time_begin, time_end):
+    """
+    Gets counts of lexical entries and entities of given perspectives created in a day-aligned time
+    interval [time_begin, time_end) from the statistics rollup, recomputing it for perspectives where it
+    is out of date, and counts of grouping tags, see grouping_counts().
+
+    Returns list of (perspective_client_id, perspective_object_id, field_client_id, field_object_id,
+    client_id, published, count) tuples, with lexical entry counts having no field.
+    """
+
+    if not perspective_id_list:
+        return []
+
+    up_to_date_id_set = set(DBSession.query(
+        StatisticsRollupPerspective.perspective_client_id,
+        StatisticsRollupPerspective.perspective_object_id).filter(tuple_(
+            StatisticsRollupPerspective.perspective_client_id,
+            StatisticsRollupPerspective.perspective_object_id).in_(perspective_id_list)).all())
+
+    for perspective_id in perspective_id_list:
+        if perspective_id not in up_to_date_id_set:
+            update_rollup(*perspective_id)
+
+    count_list = (DBSession.query(
+        StatisticsRollup.perspective_client_id, StatisticsRollup.perspective_object_id,
+        StatisticsRollup.field_client_id, StatisticsRollup.field_object_id,
+        StatisticsRollup.client_id, StatisticsRollup.published,
+        func.sum(StatisticsRollup.count))
+
+        .filter(and_(
+            tuple_(StatisticsRollup.perspective_client_id, StatisticsRollup.perspective_object_id).in_(
+                perspective_id_list),
+            StatisticsRollup.day >= int(time_begin // ROLLUP_DAY),
+            StatisticsRollup.day < int(time_end // ROLLUP_DAY)))
+
+        .group_by(
+            StatisticsRollup.perspective_client_id, StatisticsRollup.perspective_object_id,
+            StatisticsRollup.field_client_id, StatisticsRollup.field_object_id,
+            StatisticsRollup.client_id, StatisticsRollup.published).all())
+
+    # Grouping tags are not rolled up, but rollups computed before that was so can still have them.
+
+    field_list = DBSession.query(Field).filter(and_(
+        tuple_(DictionaryPerspectiveToField.parent_client_id,
+            DictionaryPerspectiveToField.parent_object_id).in_(perspective_id_list),
+        DictionaryPerspectiveToField.marked_for_deletion == False,
+        Field.client_id == DictionaryPerspectiveToField.field_client_id,
+        Field.object_id == DictionaryPerspectiveToField.field_object_id,
+        Field.marked_for_deletion == False)).distinct().all()
+
+    grouping_field_id_list = [
+        field_id for field_id, data_type in field_type_dict(field_list).items()
+        if data_type == 'grouping tag']
+
+    grouping_field_id_set = set(grouping_field_id_list)
+
+    count_list = [
+        row[:-1] + (int(row[-1]),) for row in count_list
+        if (row[2], row[3]) not in grouping_field_id_set]
+
+    if grouping_field_id_list:
+
+        count_list.extend(grouping_counts(
+            perspective_id_list, grouping_field_id_list, time_begin, time_end))
+
+    return count_list
+
+
+def is_day_aligned(time_begin, time_end):
+    """
+    Checks if a time interval can be answered from the statistics rollup.
+    """
+    return time_begin % ROLLUP_DAY == 0 and time_end % ROLLUP_DAY == 0
+
+
+def client_user_dict(client_id_set):
+    """
+    Gets (user_id, login, name, is_browser_client) info of clients by client ids in a single query.
+    """
+
+    if not client_id_set:
+        return {}
+
+    return dict(
+        (client_id, (user_id, login, name, is_browser))
+        for client_id, user_id, login, name, is_browser in DBSession.query(
+            Client.id, Client.user_id, User.login, User.name, Client.is_browser_client)
+            .filter(Client.id.in_(client_id_set), User.id == Client.user_id))
+
+
+def gist_content_dict(gist_id_set, primary_locale_id, secondary_locale_id):
+    """
+    Gets contents of translation gists in a primary locale, or in a secondary locale, or 'UNDEFINED', in
+    the same way as translation queries of 'stat_dictionary'.
+    """
+
+    locale_dict = collections.defaultdict(dict)
+
+    if gist_id_set:
+        for client_id, object_id, locale_id, content in DBSession.query(
+            TranslationAtom.parent_client_id, TranslationAtom.parent_object_id,
+            TranslationAtom.locale_id, TranslationAtom.content).filter(
+                tuple_(TranslationAtom.parent_client_id, TranslationAtom.parent_object_id).in_(gist_id_set),
+                TranslationAtom.locale_id.in_([primary_locale_id, secondary_locale_id])):
+
+            locale_dict[(client_id, object_id)].setdefault(locale_id, content)
+
+    return dict(
+        (gist_id, locale_dict[gist_id].get(primary_locale_id) or
+            locale_dict[gist_id].get(secondary_locale_id) or 'UNDEFINED')
+        for gist_id in gist_id_set)
+
+
+def unknown_field_type_error(field_list):
+    """
+    Checks that fields are all of statistically known types, returning an error if they are not.
+    """
+
+    for data_type in field_type_dict(field_list).values():
+
+        if data_type not in simple_field_type_set and data_type != 'grouping tag':
+            return {'error': message('Unknown field data type \'{0}\'.'.format(data_type))}
+
+
+def rollup_stat_perspective(perspective, time_begin, time_end, locale_id):
+    """
+    Gathers user participation statistics for a perspective from the statistics rollup, see
+    'stat_perspective'.
+    """
+
+    field_data_list = DBSession.query(Field).filter(and_(
+        DictionaryPerspectiveToField.parent_client_id == perspective.client_id,
+        DictionaryPerspectiveToField.parent_object_id == perspective.object_id,
+        DictionaryPerspectiveToField.marked_for_deletion == False,
+        Field.client_id == DictionaryPerspectiveToField.field_client_id,
+        Field.object_id == DictionaryPerspectiveToField.field_object_id,
+        Field.marked_for_deletion == False)).all()
+
+    error = unknown_field_type_error(field_data_list)
+
+    if error:
+        return error
+
+    count_list = rollup_counts(
+        [(perspective.client_id, perspective.object_id)], time_begin, time_end)
+
+    client_dict = client_user_dict(set(row[4] for row in count_list))
+
+    field_name_dict = TranslationGist.get_translations(
+        [(field.translation_gist_client_id, field.translation_gist_object_id)
+            for field in field_data_list], locale_id)
+
+    # Counting lexical entries, then entities of perspective's fields.
+
+    user_data_dict = {}
+    field_count_dict = collections.defaultdict(list)
+
+    for _, _, field_client_id, field_object_id, client_id, published, count in count_list:
+
+        if client_id not in client_dict:
+            continue
+
+        if field_client_id is not None:
+            field_count_dict[(field_client_id, field_object_id)].append((client_id, published, count))
+            continue
+
+        user_id, login, name, is_browser = client_dict[client_id]
+
+        if user_id not in user_data_dict:
+            user_data_dict[user_id] = {
+                'login': login, 'name': name,
+                'lexical entries': {'web': 0, 'desktop': 0, 'total': 0}}
+
+        entry_data = user_data_dict[user_id]['lexical entries']
+
+        entry_data['web' if is_browser else 'desktop'] += count
+        entry_data['total'] += count
+
+    for field in field_data_list:
+
+        field_name = field_name_dict[(field.translation_gist_client_id, field.translation_gist_object_id)]
+
+        for client_id, published, count in field_count_dict[(field.client_id, field.object_id)]:
+
+            user_id, login, name, is_browser = client_dict[client_id]
+
+            if user_id not in user_data_dict:
+                user_data_dict[user_id] = {
+                    'login': login, 'name': name,
+                    'entities': {'published': {}, 'unpublished': {}, 'total': {}}}
+
+            user_data = user_data_dict[user_id]
+
+            if 'entities' not in user_data:
+                user_data['entities'] = {'published': {}, 'unpublished': {}, 'total': {}}
+
+            entity_data = user_data['entities']
+
+            client_string = 'web' if is_browser else 'desktop'
+            published_string = 'published' if published else 'unpublished'
+
+            for p_string in [published_string, 'total']:
+
+                for f_string in [field_name, 'total']:
+
+                    if f_string not in entity_data[p_string]:
+                        entity_data[p_string][f_string] = {'web': 0, 'desktop': 0, 'total': 0}
+
+                    for c_string in [client_string, 'total']:
+                        entity_data[p_string][f_string][c_string] += count
+
+    return user_data_dict
+
+
+def rollup_stat_dictionary(dictionary, time_begin, time_end, primary_locale_id, secondary_locale_id):
+    """
+    Gathers cumulative user participation statistics for all perspectives of a dictionary from the
+    statistics rollup, see 'stat_dictionary'.
+    """
+
+    field_data_list = DBSession.query(Field).filter(and_(
+        DictionaryPerspective.parent_client_id == dictionary.client_id,
+        DictionaryPerspective.parent_object_id == dictionary.object_id,
+        DictionaryPerspective.marked_for_deletion == False,
+        DictionaryPerspectiveToField.parent_client_id == DictionaryPerspective.client_id,
+        DictionaryPerspectiveToField.parent_object_id == DictionaryPerspective.object_id,
+        DictionaryPerspectiveToField.marked_for_deletion == False,
+        Field.client_id == DictionaryPerspectiveToField.field_client_id,
+        Field.object_id == DictionaryPerspectiveToField.field_object_id,
+        Field.marked_for_deletion == False)).distinct().all()
+
+    error = unknown_field_type_error(field_data_list)
+
+    if error:
+        return error
+
+    perspective_list = DBSession.query(DictionaryPerspective).filter_by(
+        parent_client_id = dictionary.client_id,
+        parent_object_id = dictionary.object_id,
+        marked_for_deletion = False).all()
+
+    count_list = rollup_counts(
+        [(perspective.client_id, perspective.object_id) for perspective in perspective_list],
+        time_begin, time_end)
+
+    client_dict = client_user_dict(set(row[4] for row in count_list))
+
+    # Getting perspective state and field name translations.
+
+    state_dict = dict(
+        ((perspective.client_id, perspective.object_id),
+            (perspective.state_translation_gist_client_id, perspective.state_translation_gist_object_id))
+        for perspective in perspective_list)
+
+    field_gist_dict = dict(
+        ((field.client_id, field.object_id),
+            (field.translation_gist_client_id, field.translation_gist_object_id))
+        for field in field_data_list)
+
+    content_dict = gist_content_dict(
+        set(state_dict.values()) | set(field_gist_dict.values()),
+        primary_locale_id, secondary_locale_id)
+
+    # Aggregating statistics by users, perspective states, publishing status, field names and client
+    # types.
+
+    user_data_dict = {}
+
+    for (perspective_client_id, perspective_object_id,
+        field_client_id, field_object_id, client_id, published, count) in count_list:
+
+        if client_id not in client_dict:
+            continue
+
+        field_id = (field_client_id, field_object_id)
+
+        if field_client_id is not None and field_id not in field_gist_dict:
+            continue
+
+        user_id, login, name, is_browser = client_dict[client_id]
+
+        perspective_state = content_dict[state_dict[(perspective_client_id, perspective_object_id)]]
+        client_string = 'web' if is_browser else 'desktop'
+
+        if user_id not in user_data_dict:
+            user_data_dict[user_id] = {'login': login, 'name': name}
+
+        user_data = user_data_dict[user_id]
+
+        # Lexical entries are aggregated by perspective state and client type.
+
+        if field_client_id is None:
+
+            entry_data = user_data.setdefault('lexical entries', {})
+
+            for s_string in [perspective_state, 'total']:
+
+                if s_string not in entry_data:
+                    entry_data[s_string] = {'web': 0, 'desktop': 0, 'total': 0}
+
+                for c_string in [client_string, 'total']:
+                    entry_data[s_string][c_string] += count
+
+            continue
+
+        # Entities are aggregated by perspective state, publishing status, field name and client type.
+
+        entity_data = user_data.setdefault('entities', {})
+
+        field_name = content_dict[field_gist_dict[field_id]]
+        published_string = 'published' if published else 'unpublished'
+
+        for s_string in [perspective_state, 'total']:
+
+            if s_string not in entity_data:
+                entity_data[s_string] = {'published': {}, 'unpublished': {}, 'total': {}}
+
+            for p_string in [published_string, 'total']:
+                local_entity_data = entity_data[s_string][p_string]
+
+                for f_string in [field_name, 'total']:
+
+                    if f_string not in local_entity_data:
+                        local_entity_data[f_string] = {'web': 0, 'desktop': 0, 'total': 0}
+
+                    for c_string in [client_string, 'total']:
+                        local_entity_data[f_string][c_string] += count
+
+    return user_data_dict
+
+
+def backfill_rollup(force=False):
+    """
+    Computes statistics rollup of all perspectives where it is out of date, or of all perspectives if
+    'force' is set, committing after each perspective.
+    """
+
+    perspective_query = DBSession.query(
+        DictionaryPerspective.client_id, DictionaryPerspective.object_id).filter_by(
+            marked_for_deletion = False)
+
+    if not force:
+        perspective_query = perspective_query.outerjoin(StatisticsRollupPerspective, and_(
+            StatisticsRollupPerspective.perspective_client_id == DictionaryPerspective.client_id,
+            StatisticsRollupPerspective.perspective_object_id == DictionaryPerspective.object_id)).filter(
+                StatisticsRollupPerspective.perspective_client_id == None)
+
+    perspective_id_list = perspective_query.all()
+
+    for index, (perspective_client_id, perspective_object_id) in enumerate(perspective_id_list):
+
+        with transaction.manager:
+            update_rollup(perspective_client_id, perspective_object_id, force)
+
+        log.debug('backfill_rollup: {0}/{1} perspective {2}/{3}'.format(
+            index + 1, len(perspective_id_list), perspective_client_id, perspective_object_id))
+
+    return len(perspective_id_list)
+
+
 def stat_perspective(perspective_id, time_begin, time_end, locale_id=2):
     """
     Gathers user participation statistics for a specified perspective in a given time interval
@@ -111,6 +661,11 @@ def stat_perspective(perspective_id, time_begin, time_end, locale_id=2):
             return {'error': message('No such perspective {0}/{1}.'.format(
                 perspective_client_id, perspective_object_id))}
 
+        # Day-aligned time intervals are answered from the precomputed statistics rollup.
+
+        if is_day_aligned(time_begin, time_end):
+            return rollup_stat_perspective(perspective, time_begin, time_end, locale_id)
+
         # Getting lexical entries, using following base view:
         #
         # select
@@ -397,6 +952,12 @@ def stat_dictionary(dictionary_id, time_begin, time_end, locale_id=None):
         secondary_locale_id = (ENGLISH_LOCALE
             if primary_locale_id != ENGLISH_LOCALE else RUSSIAN_LOCALE)
 
+        # Day-aligned time intervals are answered from the precomputed statistics rollup.
+
+        if is_day_aligned(time_begin, time_end):
+            return rollup_stat_dictionary(
+                dictionary, time_begin, time_end, primary_locale_id, secondary_locale_id)
+
         # And now we are going to count lexical entries, we begin with basic perspective/lexical entry view.
 
         entry_query = (DBSession.query(
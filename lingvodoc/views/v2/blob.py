@@ -1,6 +1,6 @@
 __author__ = 'alexander'
 
-from lingvodoc.views.v2.sociolinguistics import check_socio
+from lingvodoc.views.v2.sociolinguistics import check_socio, invalidate_sociolinguistics
 from lingvodoc.exceptions import CommonException
 from lingvodoc.models import (
     Client,
@@ -153,6 +153,7 @@ def upload_user_blob(request):  # TODO: remove blob Object
             request.response.status = HTTPBadRequest.code
             response = {"error": str(e)}
             return response
+        invalidate_sociolinguistics()
 
     DBSession.add(blob_object)
     DBSession.flush()
@@ -195,6 +196,8 @@ def delete_user_blob(request):
         return {'error': 'No such blob in the system'}
 
     filelocation = blob.real_storage_path
+    if blob.data_type == "sociolinguistics":
+        invalidate_sociolinguistics()
     DBSession.delete(blob)
     objecttoc = DBSession.query(ObjectTOC).filter_by(client_id=blob.client_id,
                                                      object_id=blob.object_id).one()
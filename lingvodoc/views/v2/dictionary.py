@@ -14,7 +14,6 @@ from lingvodoc.models import (
     User,
     TranslationAtom,
     TranslationGist,
-    categories,
     Entity,
     ObjectTOC
 )
@@ -24,9 +23,11 @@ from lingvodoc.views.v2.utils import (
     all_languages,
     cache_clients,
     check_for_client,
+    dictionaries_info,
     get_user_by_client_id,
     group_by_languages,
     group_by_organizations,
+    serialize_dictionary,
     user_counter,
     check_client_id
 )
@@ -98,19 +99,8 @@ def create_dictionary(request):  # tested & in docs
         parent = DBSession.query(Language).filter_by(client_id=parent_client_id, object_id=parent_object_id).first()
         additional_metadata = req.get('additional_metadata', None)
 
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {"searchstring": "WiP"}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-
-        resp = request.invoke_subrequest(subreq)
-        # set_trace()
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json['client_id']
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('WiP')
 
         dictionary = Dictionary(client_id=client_id,
                                 object_id=object_id,
@@ -156,26 +146,11 @@ def view_dictionary(request):  # tested & in docs
     object_id = request.matchdict.get('object_id')
     dictionary = DBSession.query(Dictionary).filter_by(client_id=client_id, object_id=object_id).first()
     if dictionary and not dictionary.marked_for_deletion:
-        response['parent_client_id'] = dictionary.parent_client_id
-        response['parent_object_id'] = dictionary.parent_object_id
-        response['translation_gist_client_id'] = dictionary.translation_gist_client_id
-        response['translation_gist_object_id'] = dictionary.translation_gist_object_id
-        response['client_id'] = dictionary.client_id
-        response['object_id'] = dictionary.object_id
-        response['state_translation_gist_client_id'] = dictionary.state_translation_gist_client_id
-        response['state_translation_gist_object_id'] = dictionary.state_translation_gist_object_id
-        if dictionary.additional_metadata:
-            response['additional_metadata'] = dictionary.additional_metadata
-        response['category'] = categories.get(dictionary.category)
-        response['created_at'] = dictionary.created_at
-        response['domain'] = dictionary.domain
-        response['marked_for_deletion'] = dictionary.marked_for_deletion
-        response['additional_metadata'] = dictionary.additional_metadata
         if request.cookies.get('locale_id'):
             locale_id = request.cookies['locale_id']
         else:
             locale_id = 2
-        response['translation'] = dictionary.get_translation(locale_id)
+        response = serialize_dictionary(dictionary, dictionary.get_translation(locale_id))
         request.response.status = HTTPOk.code
         return response
     request.response.status = HTTPNotFound.code
@@ -235,6 +210,7 @@ def delete_dictionary(request):  # tested & in docs
                 objecttoc = DBSession.query(ObjectTOC).filter_by(client_id=dictionary.client_id,
                                                                  object_id=dictionary.object_id).one()
                 objecttoc.marked_for_deletion = True
+            DictionaryPerspective.invalidate_state()
             request.response.status = HTTPOk.code
             return response
     request.response.status = HTTPNotFound.code
@@ -891,6 +867,7 @@ def edit_dictionary_status(request):  # tested & in docs
             req = request.json_body
         dictionary.state_translation_gist_client_id = req['state_translation_gist_client_id']
         dictionary.state_translation_gist_object_id = req['state_translation_gist_object_id']
+        DictionaryPerspective.invalidate_state()
         atom = DBSession.query(TranslationAtom).filter_by(parent_client_id=req['state_translation_gist_client_id'],
                                                           parent_object_id=req['state_translation_gist_object_id'],
                                                           locale_id=int(request.cookies['locale_id'])).first()
@@ -922,35 +899,9 @@ def dictionaries_list(request):  # TODO: test
             dicts = dicts.filter(Dictionary.category == 0)
 
     if published:
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'Published'}
-        headers = dict()
-        if request.headers.get('Cookie'):
-            headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json['client_id']
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
-
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'Limited access'}  # todo: fix
-        headers = dict()
-        if request.headers.get('Cookie'):
-            headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-
-        if 'error' not in resp.json:
-            limited_object_id, limited_client_id = resp.json['object_id'], resp.json['client_id']
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('Published')
+        limited_client_id, limited_object_id = TranslationGist.get_service_gist_id('Limited access')
 
         dicts = dicts.filter(or_(and_(Dictionary.state_translation_gist_object_id == state_translation_gist_object_id,
                                       Dictionary.state_translation_gist_client_id == state_translation_gist_client_id),
@@ -1001,18 +952,8 @@ def dictionaries_list(request):  # TODO: test
             )
         )
 
-    dictionaries = list()
     dicts = dicts.order_by(Dictionary.client_id, Dictionary.object_id)
-    for dct in dicts:
-        path = request.route_url('dictionary',
-                                 client_id=dct.client_id,
-                                 object_id=dct.object_id)
-        subreq = Request.blank(path)
-        subreq.method = 'GET'
-        subreq.headers = request.headers
-        resp = request.invoke_subrequest(subreq)
-        if 'error' not in resp.json:
-            dictionaries += [resp.json]
+    dictionaries = dictionaries_info(dicts.all(), request.cookies.get('locale_id') or 2)
 
     if author:
         user = DBSession.query(User).filter_by(id=author).first()
@@ -1063,35 +1004,9 @@ def published_dictionaries_list(request):  # tested.   # TODO: test with org
     group_by_lang = req.get('group_by_lang', None)
     visible = req.get('visible', None)
     dicts = DBSession.query(Dictionary).filter_by(marked_for_deletion=False)
-    subreq = Request.blank('/translation_service_search')
-    subreq.method = 'POST'
-    subreq.headers = request.headers
-    subreq.json = {'searchstring': 'Published'}
-    headers = dict()
-    if request.headers.get('Cookie'):
-        headers = {'Cookie': request.headers['Cookie']}
-    subreq.headers = headers
-    resp = request.invoke_subrequest(subreq)
-
-    if 'error' not in resp.json:
-        state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json['client_id']
-    else:
-        raise KeyError("Something wrong with the base", resp.json['error'])
-
-    subreq = Request.blank('/translation_service_search')
-    subreq.method = 'POST'
-    subreq.headers = request.headers
-    subreq.json = {'searchstring': 'Limited access'}  # todo: fix
-    headers = dict()
-    if request.headers.get('Cookie'):
-        headers = {'Cookie': request.headers['Cookie']}
-    subreq.headers = headers
-    resp = request.invoke_subrequest(subreq)
-
-    if 'error' not in resp.json:
-        limited_object_id, limited_client_id = resp.json['object_id'], resp.json['client_id']
-    else:
-        raise KeyError("Something wrong with the base", resp.json['error'])
+    state_translation_gist_client_id, state_translation_gist_object_id = \
+        TranslationGist.get_service_gist_id('Published')
+    limited_client_id, limited_object_id = TranslationGist.get_service_gist_id('Limited access')
 
     if visible:
         user = Client.get_user_by_client_id(authenticated_userid(request))
@@ -1130,23 +1045,13 @@ def published_dictionaries_list(request):  # tested.   # TODO: test with org
     if group_by_lang and not group_by_org:
         return group_by_languages(dicts, request)
 
+    locale_id = request.cookies.get('locale_id') or 2
+
     if not group_by_lang and group_by_org:
         tmp = group_by_organizations(dicts, request)
         organizations = []
         for org in tmp:
-            dcts = org['dicts']
-            dictionaries = []
-            for dct in dcts:
-                path = request.route_url('dictionary',
-                                         client_id=dct.client_id,
-                                         object_id=dct.object_id)
-                subreq = Request.blank(path)
-                subreq.method = 'GET'
-                subreq.headers = request.headers
-                resp = request.invoke_subrequest(subreq)
-                if 'error' not in resp.json:
-                    dictionaries += [resp.json]
-            org['dicts'] = dictionaries
+            org['dicts'] = dictionaries_info(org['dicts'], locale_id)
             organizations += [org]
         return {'organizations': organizations}
     if group_by_lang and group_by_org:
@@ -1158,19 +1063,8 @@ def published_dictionaries_list(request):  # tested.   # TODO: test with org
             del org['dicts']
             organizations += [org]
         return {'organizations': organizations}
-    dictionaries = []
     dicts = dicts.order_by("client_id", "object_id")
-    for dct in dicts.all():
-        path = request.route_url('dictionary',
-                                 client_id=dct.client_id,
-                                 object_id=dct.object_id)
-        subreq = Request.blank(path)
-        subreq.method = 'GET'
-        subreq.headers = request.headers
-        resp = request.invoke_subrequest(subreq)
-        if 'error' not in resp.json:
-            dictionaries += [resp.json]
-    response['dictionaries'] = dictionaries
+    response['dictionaries'] = dictionaries_info(dicts.all(), locale_id)
     request.response.status = HTTPOk.code
 
     return response
@@ -35,6 +35,12 @@ from pyramid.view import view_config
 
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
+from lingvodoc.utils.etymology import (
+    find_all_tags,
+    find_group_entries,
+    find_group_tags,
+    materialize_group
+)
 from lingvodoc.views.v2.delete import real_delete_lexical_entry
 from lingvodoc.views.v2.utils import check_client_id
 
@@ -66,8 +72,13 @@ def view_connected_words(request):
     field_object_id = int(request.params.get('field_object_id'))
     lexical_entry = DBSession.query(LexicalEntry).filter_by(client_id=client_id, object_id=object_id).first()
     if lexical_entry and not lexical_entry.marked_for_deletion:
-        tags = find_all_tags(lexical_entry, field_client_id, field_object_id, accepted)
-        lexes = find_lexical_entries_by_tags(tags, field_client_id, field_object_id, accepted)
+        # Etymology groups without regard to acceptance are materialized, so we can look them up directly.
+        if accepted:
+            tags = find_all_tags(lexical_entry, field_client_id, field_object_id, accepted)
+            lexes = find_lexical_entries_by_tags(tags, field_client_id, field_object_id, accepted)
+        else:
+            lexes = find_group_entries(lexical_entry, field_client_id, field_object_id)
+            tags = find_group_tags(lexical_entry, field_client_id, field_object_id) if published else set()
         lexes_composite_list = [(lex.created_at,
                                  lex.client_id, lex.object_id, lex.parent_client_id, lex.parent_object_id,
                                  lex.marked_for_deletion, lex.additional_metadata,
@@ -97,7 +108,7 @@ def find_lexical_entries_by_tags(tags, field_client_id, field_object_id, accepte
         .join(LexicalEntry.entity) \
         .join(Entity.publishingentity) \
         .join(Entity.field) \
-        .filter(Entity.content.in_(tags),
+        .filter(Entity.content.in_(list(tags)),
                 Entity.marked_for_deletion == False,
                 Field.client_id == field_client_id,
                 Field.object_id == field_object_id)
@@ -107,42 +118,6 @@ def find_lexical_entries_by_tags(tags, field_client_id, field_object_id, accepte
     return result
 
 
-def find_all_tags(lexical_entry, field_client_id, field_object_id, accepted):
-    tag = None
-    for entity in lexical_entry.entity:
-        if not entity.marked_for_deletion and entity.field_client_id == field_client_id and entity.field_object_id == field_object_id:
-            if accepted:
-                if not entity.publishingentity.accepted:
-                    continue
-            tag = entity.content
-            break
-    if not tag:
-        return []
-    else:
-        tags = [tag]
-        new_tags = [tag]
-        while new_tags:
-            lexical_entries = find_lexical_entries_by_tags(new_tags, field_client_id, field_object_id, accepted)
-            new_tags = list()
-            for lex in lexical_entries:
-                entities = DBSession.query(Entity) \
-                    .join(Entity.field) \
-                    .join(Entity.publishingentity) \
-                    .filter(Entity.parent == lex,
-                            Field.client_id == field_client_id,
-                            Field.object_id == field_object_id,
-                            Entity.marked_for_deletion==False)
-                if accepted:
-                    entities = entities.filter(PublishingEntity.accepted == True)
-
-                entities = entities.all()
-                for entity in entities:
-                    if entity.content not in tags:
-                        tags.append(entity.content)
-                        new_tags.append(entity.content)
-        return tags
-
-
 @view_config(route_name='bulk_group_entities', renderer='json', request_method='POST')
 def bulk_group_entities(request):  # tested
     try:
@@ -208,17 +183,13 @@ def bulk_group_entities(request):  # tested
         #     tags.append(req['tag'])
 
         for tag in req['tag_groups']:
-            tags = list()
             tag_ent = req['tag_groups'][tag][0]
             parent = DBSession.query(LexicalEntry).\
                 filter_by(client_id=tag_ent['parent_client_id'], object_id=tag_ent['parent_object_id']).first()
             if not parent:
                 request.response.status = HTTPNotFound.code
                 return {'error': str("No such lexical entry in the system")}
-            par_tags = find_all_tags(parent, field_client_id, field_object_id, accepted)
-            for tag in par_tags:
-                if tag not in tags:
-                    tags.append(tag)
+            tags = find_all_tags(parent, field_client_id, field_object_id, accepted)
             lexical_entries = find_lexical_entries_by_tags(tags, field_client_id, field_object_id, accepted)
             if parent not in lexical_entries:
                 lexical_entries.append(parent)
@@ -244,6 +215,7 @@ def bulk_group_entities(request):  # tested
                             BaseGroup.action == 'create').one()
                         if user in group.users:
                             tag_entity.publishingentity.accepted = True
+            materialize_group((parent.client_id, parent.object_id), field_client_id, field_object_id)
             request.response.status = HTTPOk.code
             response['counter'] = client.counter
             return response
@@ -274,9 +246,9 @@ def create_group_entity(request):  # tested
         user = DBSession.query(User).filter_by(id=client.user_id).first()
         if not user:
             raise CommonException("This client id is orphaned. Try to logout and then login once more.")
-        tags = list()
+        tags = set()
         if 'tag' in req:
-            tags.append(req['tag'])
+            tags.add(req['tag'])
         field_client_id=req['field_client_id']
         field_object_id=req['field_object_id']
         field = DBSession.query(Field).\
@@ -294,15 +266,12 @@ def create_group_entity(request):  # tested
             if not parent:
                 request.response.status = HTTPNotFound.code
                 return {'error': str("No such lexical entry in the system")}
-            par_tags = find_all_tags(parent, field_client_id, field_object_id, False)
-            for tag in par_tags:
-                if tag not in tags:
-                    tags.append(tag)
+            tags.update(find_group_tags(parent, field_client_id, field_object_id))
         if not tags:
             n = 10  # better read from settings
             tag = time.ctime() + ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits)
                                          for c in range(n))
-            tags.append(tag)
+            tags.add(tag)
         lexical_entries = find_lexical_entries_by_tags(tags, field_client_id, field_object_id, False)
         for par in req['connections']:
             parent = DBSession.query(LexicalEntry).\
@@ -332,6 +301,9 @@ def create_group_entity(request):  # tested
                         BaseGroup.action == 'create').one()
                     if user in group.users:
                         tag_entity.publishingentity.accepted = True
+        if lexical_entries:
+            materialize_group((lexical_entries[0].client_id, lexical_entries[0].object_id),
+                              field_client_id, field_object_id)
         request.response.status = HTTPOk.code
         return response
     except KeyError as e:
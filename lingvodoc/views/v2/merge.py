@@ -5,11 +5,14 @@ __author__ = 'alexander'
 
 import collections
 import copy
+import hashlib
 import itertools
 import json
 import logging
 import math
+import os
 import pprint
+import time
 import traceback
 
 from pyramid.httpexceptions import (
@@ -27,7 +30,7 @@ from pyramid.request import Request
 from pyramid.security import authenticated_userid
 from pyramid.view import view_config
 
-from sqlalchemy import and_, create_engine, tuple_
+from sqlalchemy import and_, case, cast, create_engine, func, Text, tuple_
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.attributes import flag_modified
 
@@ -35,6 +38,7 @@ from transaction import manager
 
 # Lingvodoc imports.
 
+import lingvodoc.cache.caching as caching
 from lingvodoc.cache.caching import initialize_cache, TaskStatus
 
 from lingvodoc.exceptions import CommonException
@@ -53,6 +57,7 @@ from lingvodoc.models import (
     LexicalEntry,
     ObjectTOC,
     organization_to_group_association,
+    PublishingEntity,
     User,
     user_to_group_association,
     user_to_organization_association
@@ -182,6 +187,7 @@ def merge_dictionaries(request):  # TODO: test
                             new_group.users.append(user)
                 group.marked_for_deletion = True
             dicti.marked_for_deletion = True
+        DictionaryPerspective.invalidate_state()
         request.response.status = HTTPOk.code
         return {'object_id': object_id,
                 'client_id': client_id}
@@ -344,6 +350,7 @@ def merge_perspectives_api(request):  # TODO: test
                 group.marked_for_deletion = True
             parent.marked_for_deletion = True
         new_persp.marked_for_deletion = False  # TODO: check where it is deleted
+        DictionaryPerspective.invalidate_state()
         request.response.status = HTTPOk.code
         return {'object_id': object_id,
                 'client_id': client_id}
@@ -632,6 +639,146 @@ def match_simple(entry_data_list, entity_type_primary, entity_type_secondary, th
         match_data_list, match_data_list, float(threshold), int(levenshtein))
 
 
+def deletion_variants(string, limit):
+    """
+    Gets set of all strings obtainable from a given string by deleting at most the specified number of
+    characters.
+    """
+
+    variant_set = {string}
+    current_set = {string}
+
+    for i in range(limit):
+
+        current_set = set(
+            variant[:index] + variant[index + 1:]
+                for variant in current_set
+                for index in range(len(variant)))
+
+        if not current_set:
+            break
+
+        variant_set.update(current_set)
+
+    return variant_set
+
+
+class BK_Tree(object):
+    """
+    Burkhard-Keller tree of strings with Levenshtein distance metric, allows to find all strings within a
+    specified distance from a given string without comparing it to each of them.
+    """
+
+    def __init__(self, distance):
+
+        self.distance = distance
+        self.root = None
+
+    def add(self, string):
+
+        if self.root is None:
+            self.root = (string, {})
+            return
+
+        node_string, child_dict = self.root
+
+        while True:
+            distance = self.distance(string, node_string)
+
+            child = child_dict.get(distance)
+
+            if child is None:
+                child_dict[distance] = (string, {})
+                return
+
+            node_string, child_dict = child
+
+    def search(self, string, limit):
+
+        result_list = []
+        node_list = [self.root] if self.root is not None else []
+
+        while node_list:
+            node_string, child_dict = node_list.pop()
+            distance = self.distance(string, node_string)
+
+            if distance <= limit:
+                result_list.append(node_string)
+
+            # By the triangle inequality, only subtrees with distances to the node within the limit of the
+            # query distance can contain matching strings.
+
+            for child_distance, child in child_dict.items():
+                if distance - limit <= child_distance <= distance + limit:
+                    node_list.append(child)
+
+        return result_list
+
+
+#: Maximum Levenshtein distance limit for which candidate matches are generated via the symmetric
+#: deletion index, for greater limits, with deletion variant sets growing too fast, BK-tree is used.
+symmetric_deletion_limit = 2
+
+
+def levenshtein_matches(feature_list, limit, levenshtein):
+    """
+    Finds all pairs of different features within a specified Levenshtein distance.
+
+    Instead of computing distances between all pairs of features, we generate candidate pairs either via
+    symmetric deletion index (if Levenshtein distance between two strings is at most d, they have a common
+    string obtainable from each by at most d deletions) or via BK-tree search, and compute distances only
+    for these candidates.
+
+    Returns dictionary mapping each feature to a sorted list of features greater than it and within the
+    distance limit.
+    """
+
+    levenshtein_dict = collections.defaultdict(list)
+
+    if limit <= symmetric_deletion_limit:
+
+        deletion_dict = collections.defaultdict(list)
+
+        for index, feature in enumerate(feature_list):
+            for variant in deletion_variants(feature, int(limit)):
+                deletion_dict[variant].append(index)
+
+        candidate_set = set()
+
+        for index_list in deletion_dict.values():
+            for i, index_a in enumerate(index_list):
+                for index_b in index_list[i + 1:]:
+
+                    candidate_set.add(
+                        (index_a, index_b) if index_a < index_b else (index_b, index_a))
+
+        for index_a, index_b in sorted(candidate_set):
+
+            feature_a = feature_list[index_a]
+            feature_b = feature_list[index_b]
+
+            if levenshtein(feature_a, feature_b) <= limit:
+                levenshtein_dict[feature_a].append(feature_b)
+
+    else:
+
+        bk_tree = BK_Tree(levenshtein)
+
+        for feature in feature_list:
+            bk_tree.add(feature)
+
+        for feature_a in feature_list:
+
+            match_list = sorted(
+                feature_b for feature_b in bk_tree.search(feature_a, limit)
+                    if feature_b > feature_a)
+
+            if match_list:
+                levenshtein_dict[feature_a] = match_list
+
+    return levenshtein_dict
+
+
 def match_fields(entry_data_list, field_selection_list, threshold):
     """
     Matches lexical entries via a newer, more flexible algorithm (cf. match_simple).
@@ -810,18 +957,11 @@ def match_fields(entry_data_list, field_selection_list, threshold):
                 log.debug('entry_feature_dict:\n' + pprint.pformat(entry_feature_dict))
                 log.debug('feature_entry_dict:\n' + pprint.pformat(feature_entry_dict))
 
-                # At the moment we have to compute N^2/2 Levenshtein distances. If such computations will be
-                # found too time consuming, we can try optimized Levenshtein distance computation with
-                # prefix sharing and lazy evaluations.
+                # Computing Levenshtein distances only for plausible candidate feature pairs instead of all
+                # N^2/2 pairs, see levenshtein_matches().
 
-                levenshtein_dict = collections.defaultdict(list)
                 feature_list = sorted(feature_entry_dict.keys())
-
-                for index, feature_a in enumerate(feature_list):
-                    for feature_b in feature_list[index + 1:]:
-
-                        if levenshtein(feature_a, feature_b) <= limit:
-                            levenshtein_dict[feature_a].append(feature_b)
+                levenshtein_dict = levenshtein_matches(feature_list, limit, levenshtein)
 
                 log.debug('feature_list:\n' + pprint.pformat(feature_list))
                 log.debug('levenshtein_dict:\n' + pprint.pformat(levenshtein_dict))
@@ -945,38 +1085,203 @@ def match_graph(match_result_list):
             pprint.pformat(group_entry_list))
 
 
-@view_config(
-    route_name = 'merge_suggestions',
-    renderer = 'json',
-    request_method = 'POST',
-    permission = 'view')
-def merge_suggestions(request):
+def merge_suggestions_data_version(perspective_client_id, perspective_object_id):
     """
-    Finds groups of mergeable lexical entries according to specified criteria.
+    Gets data version stamp of a perspective's lexical entries and entities, which changes whenever any of
+    them are created or deleted, or whenever any entity is published or accepted, or stops being so.
     """
 
-    perspective_client_id = request.matchdict.get('perspective_client_id')
-    perspective_object_id = request.matchdict.get('perspective_object_id')
+    entry_stamp = DBSession.query(
+        func.count(LexicalEntry.client_id),
+        func.sum(case([(LexicalEntry.marked_for_deletion == True, 1)], else_ = 0)),
+        func.max(LexicalEntry.created_at)).filter_by(
+            parent_client_id = perspective_client_id,
+            parent_object_id = perspective_object_id).one()
+
+    entity_stamp = DBSession.query(
+        func.count(Entity.client_id),
+        func.sum(case([(Entity.marked_for_deletion == True, 1)], else_ = 0)),
+        func.max(Entity.created_at)).filter(
+            LexicalEntry.parent_client_id == perspective_client_id,
+            LexicalEntry.parent_object_id == perspective_object_id,
+            Entity.parent_client_id == LexicalEntry.client_id,
+            Entity.parent_object_id == LexicalEntry.object_id).one()
+
+    # Publishing status has no modification time, so we use checksums of ids of published and accepted
+    # entities, which change when the status of some entities changes even if their number does not.
+
+    entity_id_hash = func.hashtext(
+        cast(PublishingEntity.client_id, Text) + ':' + cast(PublishingEntity.object_id, Text))
+
+    publishing_stamp = DBSession.query(
+        func.sum(case([(PublishingEntity.published == True, entity_id_hash)], else_ = 0)),
+        func.sum(case([(PublishingEntity.accepted == True, entity_id_hash)], else_ = 0))).filter(
+            LexicalEntry.parent_client_id == perspective_client_id,
+            LexicalEntry.parent_object_id == perspective_object_id,
+            Entity.parent_client_id == LexicalEntry.client_id,
+            Entity.parent_object_id == LexicalEntry.object_id,
+            PublishingEntity.client_id == Entity.client_id,
+            PublishingEntity.object_id == Entity.object_id).one()
+
+    return ':'.join(str(value) for value in entry_stamp + entity_stamp + publishing_stamp)
+
+
+def merge_suggestions_compute(
+    perspective_client_id, perspective_object_id, algorithm, option_dict, threshold, locale_id):
+    """
+    Finds mergeable lexical entries of a perspective, returns data of matching lexical entries and a list
+    of matches.
+
+    Match results with all confidence scores are cached by perspective, matching options and data version
+    stamp of the perspective, so that repeated requests with another threshold only re-filter cached
+    matches.
+    """
+
+    log_prefix = 'merge_suggestions {0}/{1}'.format(perspective_client_id, perspective_object_id)
+
+    cache_key = 'merge_suggestions:{0}:{1}:{2}:{3}'.format(
+        perspective_client_id, perspective_object_id,
+        hashlib.md5(json.dumps([algorithm, option_dict], sort_keys = True).encode('utf-8')).hexdigest(),
+        merge_suggestions_data_version(perspective_client_id, perspective_object_id))
+
+    cache_result = caching.CACHE.get(cache_key) if caching.CACHE else None
+
+    if cache_result is not None:
+
+        entry_data_list, match_result_list = cache_result
+        log.debug('{0}: cached matches'.format(log_prefix))
+
+    else:
+
+        # Getting data of the undeleted lexical entries of the perspective in a single bulk query.
+
+        lexical_entry_list = DBSession.query(LexicalEntry).filter_by(
+            parent_client_id = perspective_client_id,
+            parent_object_id = perspective_object_id,
+            marked_for_deletion = False).all()
+
+        log.debug('{0}: {1} lexical entries'.format(log_prefix, len(lexical_entry_list)))
+
+        lexes_composite_list = [(
+            entry.created_at,
+            entry.client_id, entry.object_id, entry.parent_client_id, entry.parent_object_id,
+            entry.marked_for_deletion,
+            entry.additional_metadata or None,
+            entry.additional_metadata.get('came_from') if entry.additional_metadata else None)
+            for entry in lexical_entry_list]
+
+        entry_data_list = (LexicalEntry.track_multiple(
+            lexes_composite_list, locale_id, publish = False) if lexes_composite_list else [])
+
+        remove_deleted(entry_data_list)
+
+        # Matching lexical entries with zero threshold, so that we would have all confidence scores.
 
-    request_json = request.json
+        if not entry_data_list:
+            match_result_list = []
+
+        elif algorithm == 'simple':
+
+            match_result_list = match_simple(entry_data_list,
+                option_dict['entity_type_primary'], option_dict['entity_type_secondary'],
+                0, option_dict['levenshtein'])
+
+        else:
+            match_result_list = match_fields(
+                entry_data_list, option_dict['field_selection_list'], 0)
+
+        match_id_set = set(id
+            for id_a, id_b, confidence in match_result_list
+                for id in (id_a, id_b))
+
+        entry_data_list = [
+            entry_data for entry_data in entry_data_list
+                if (entry_data['client_id'], entry_data['object_id']) in match_id_set]
+
+        if caching.CACHE:
+            caching.CACHE.set(cache_key, (entry_data_list, match_result_list))
+
+    # Filtering matches by the threshold.
+
+    match_result_list = [
+        (id_a, id_b, confidence)
+            for id_a, id_b, confidence in match_result_list
+                if confidence >= float(threshold)]
+
+    log.debug('{0}: {1} matches'.format(log_prefix, len(match_result_list)))
+
+    match_id_set = set(id
+        for id_a, id_b, confidence in match_result_list
+            for id in (id_a, id_b))
+
+    entry_data_list = [
+        entry_data for entry_data in entry_data_list
+            if (entry_data['client_id'], entry_data['object_id']) in match_id_set]
+
+    return entry_data_list, match_result_list
+
+
+def merge_suggestions_options(request_json):
+    """
+    Gets merge suggestions algorithm, matching options and threshold from request data.
+    """
 
     algorithm = request_json.get('algorithm')
     threshold = request_json.get('threshold') or 0.1
 
     if algorithm not in set(['simple', 'fields']):
-        return {'error': message('Unknown entity matching algorithm \'{0}\'.'.format(algorithm))}
-
-    # Getting merge suggestions options.
+        raise ValueError('Unknown entity matching algorithm \'{0}\'.'.format(algorithm))
 
     if algorithm == 'simple':
 
-        entity_type_primary = request_json.get('entity_type_primary') or 'Transcription'
-        entity_type_secondary = request_json.get('entity_type_secondary') or 'Translation'
-
-        levenshtein = request_json.get('levenshtein') or 1
+        option_dict = {
+            'entity_type_primary': request_json.get('entity_type_primary') or 'Transcription',
+            'entity_type_secondary': request_json.get('entity_type_secondary') or 'Translation',
+            'levenshtein': request_json.get('levenshtein') or 1}
 
     else:
-        field_selection_list = request_json['field_selection_list']
+        option_dict = {
+            'field_selection_list': request_json['field_selection_list']}
+
+    return algorithm, option_dict, threshold
+
+
+def merge_suggestions_result(entry_data_list, match_result_list, user_has_permissions):
+    """
+    Compiles merge suggestions response.
+    """
+
+    return {
+
+        'entry_data': entry_data_list,
+
+        'match_result': [
+            ({'client_id': id_a[0], 'object_id': id_a[1]},
+                {'client_id': id_b[0], 'object_id': id_b[1]},
+                confidence)
+                for id_a, id_b, confidence in match_result_list],
+
+        'user_has_permissions': user_has_permissions}
+
+
+@view_config(
+    route_name = 'merge_suggestions',
+    renderer = 'json',
+    request_method = 'POST',
+    permission = 'view')
+def merge_suggestions(request):
+    """
+    Finds groups of mergeable lexical entries according to specified criteria.
+    """
+
+    perspective_client_id = request.matchdict.get('perspective_client_id')
+    perspective_object_id = request.matchdict.get('perspective_object_id')
+
+    try:
+        algorithm, option_dict, threshold = merge_suggestions_options(request.json)
+
+    except ValueError as error:
+        return {'error': message(str(error))}
 
     log.debug('merge_suggestions {0}/{1}'.format(
         perspective_client_id, perspective_object_id))
@@ -995,68 +1300,157 @@ def merge_suggestions(request):
         perspective.parent_client_id, perspective.parent_object_id,
         perspective_client_id, perspective_object_id)
 
-    # Getting data of the undeleted lexical entries of the perspective.
+    # Matching lexical entries, returning match data together with data of matching lexical entries.
+
+    entry_data_list, match_result_list = merge_suggestions_compute(
+        perspective_client_id, perspective_object_id, algorithm, option_dict, threshold, locale_id)
+
+    return merge_suggestions_result(
+        entry_data_list, match_result_list, user_has_permissions)
 
-    lexical_entry_list = list(DBSession.query(LexicalEntry).filter_by(
-        parent_client_id = perspective_client_id,
-        parent_object_id = perspective_object_id,
-        marked_for_deletion = False).all())
 
-    if not lexical_entry_list:
+@celery.task
+def merge_suggestions_task(
+    task_key, cache_kwargs, sqlalchemy_url, storage,
+    perspective_client_id, perspective_object_id,
+    algorithm, option_dict, threshold, locale_id, user_has_permissions):
+    """
+    Finds mergeable lexical entries in the background, saves merge suggestions as a JSON file.
+    """
 
-        log.debug('merge_suggestions {0}/{1}: 0 lexical entries'.format(
-            perspective_client_id, perspective_object_id))
+    engine = create_engine(sqlalchemy_url)
+    DBSession.configure(bind = engine)
 
-        return {
-            'entry_data': [],
-            'match_result': [],
-            'user_has_permissions': user_has_permissions}
+    initialize_cache(cache_kwargs)
+    task_status = TaskStatus.get_from_cache(task_key)
 
-    entry_data_list = [l.track(False, locale_id) for l in lexical_entry_list]
-    remove_deleted(entry_data_list)
+    with manager:
+        try:
 
-    log.debug('merge_suggestions {0}/{1}: {2} lexical entries'.format(
-        perspective_client_id, perspective_object_id, len(entry_data_list)))
+            task_status.set(1, 0, 'Matching lexical entries')
 
-    # Matching lexical entries.
+            entry_data_list, match_result_list = merge_suggestions_compute(
+                perspective_client_id, perspective_object_id,
+                algorithm, option_dict, threshold, locale_id)
 
-    if algorithm == 'simple':
+            result = merge_suggestions_result(
+                entry_data_list, match_result_list, user_has_permissions)
 
-        match_result_list = match_simple(entry_data_list,
-            entity_type_primary, entity_type_secondary, threshold, levenshtein)
+            # Saving merge suggestions.
 
-    else:
-        match_result_list = match_fields(entry_data_list, field_selection_list, threshold)
+            cur_time = time.time()
+            storage_dir = os.path.join(storage['path'], 'merge_suggestions', str(cur_time))
+            os.makedirs(storage_dir, exist_ok = True)
 
-    log.debug('merge_suggestions {0}/{1}: {2} matches'.format(
-        perspective_client_id, perspective_object_id, len(match_result_list)))
+            result_filename = 'merge_suggestions_{0}_{1}.json'.format(
+                perspective_client_id, perspective_object_id)
 
-    if not match_result_list:
+            with open(os.path.join(storage_dir, result_filename), 'w', encoding = 'utf-8') as result_file:
+                json.dump(result, result_file, ensure_ascii = False)
 
-        return {
-            'entry_data': [],
-            'match_result': [],
-            'user_has_permissions': user_has_permissions}
+            url = ''.join([
+                storage['prefix'],
+                storage['static_route'],
+                'merge_suggestions', '/',
+                str(cur_time), '/',
+                result_filename])
 
-    # Returning match data together with data of matching lexical entries.
+            task_status.set(1, 100,
+                'Finished, {0} matches'.format(len(match_result_list)),
+                result_link_list = [url])
 
-    match_id_set = set(id
-        for id_a, id_b, confidence in match_result_list
-            for id in (id_a, id_b))
+        # If something is not right, we report it.
 
-    return {
+        except Exception as exception:
 
-        'entry_data': [
-            entry_data for entry_data in entry_data_list
-                if (entry_data['client_id'], entry_data['object_id']) in match_id_set],
+            traceback_string = ''.join(traceback.format_exception(
+                exception, exception, exception.__traceback__))[:-1]
 
-        'match_result': [
-            ({'client_id': id_a[0], 'object_id': id_a[1]},
-                {'client_id': id_b[0], 'object_id': id_b[1]},
-                confidence)
-                for id_a, id_b, confidence in match_result_list],
+            log.debug('merge_suggestions_async: exception')
+            log.debug('\n' + traceback_string)
 
-        'user_has_permissions': user_has_permissions}
+            if task_status is not None:
+                task_status.set(1, 100, 'Finished (ERROR), external error')
+
+            DBSession.rollback()
+            return {'error': message('\n' + traceback_string)}
+
+
+@view_config(
+    route_name = 'merge_suggestions_async',
+    renderer = 'json',
+    request_method = 'POST',
+    permission = 'view')
+def merge_suggestions_async(request):
+    """
+    Launches background merge suggestions task, see 'merge_suggestions' procedure.
+    """
+
+    perspective_client_id = request.matchdict.get('perspective_client_id')
+    perspective_object_id = request.matchdict.get('perspective_object_id')
+
+    log.debug('merge_suggestions_async {0}/{1}'.format(
+        perspective_client_id, perspective_object_id))
+
+    task_status = None
+
+    try:
+        algorithm, option_dict, threshold = merge_suggestions_options(request.json)
+
+        locale_id = int(request.cookies.get('locale_id') or 2)
+
+        # Checking if the user has sufficient permissions to perform suggested merges.
+
+        user = Client.get_user_by_client_id(request.authenticated_userid)
+
+        if not user:
+            return {'error': message('User authentification failure.')}
+
+        perspective = DBSession.query(DictionaryPerspective).filter_by(
+            client_id = perspective_client_id, object_id = perspective_object_id).first()
+
+        if not perspective:
+            return {'error': message('No such perspective {0}/{1}.'.format(
+                perspective_client_id, perspective_object_id))}
+
+        user_has_permissions = check_user_merge_permissions(
+            request, user,
+            perspective.parent_client_id, perspective.parent_object_id,
+            perspective_client_id, perspective_object_id)
+
+        # Launching asynchronous merge suggestions task.
+
+        task_status = TaskStatus(user.id, 'Merge suggestions',
+            'perspective {0}/{1}'.format(perspective_client_id, perspective_object_id), 1)
+
+        task_status.set(1, 0, 'Starting merge suggestions')
+
+        merge_suggestions_task.delay(
+            task_status.key,
+            request.registry.settings['cache_kwargs'],
+            request.registry.settings['sqlalchemy.url'],
+            request.registry.settings['storage'],
+            perspective_client_id, perspective_object_id,
+            algorithm, option_dict, threshold, locale_id, user_has_permissions)
+
+    # If something is not right, we report it.
+
+    except Exception as exception:
+
+        traceback_string = ''.join(traceback.format_exception(
+            exception, exception, exception.__traceback__))[:-1]
+
+        log.debug('merge_suggestions_async: exception')
+        log.debug('\n' + traceback_string)
+
+        if task_status is not None:
+            task_status.set(1, 100, 'Finished (ERROR), external error')
+
+        request.response.status = HTTPInternalServerError.code
+        return {'error': message('\n' + traceback_string)}
+
+    request.response.status = HTTPOk.code
+    return {'result': task_status.key}
 
 
 def build_merge_tree(entry):
@@ -10,7 +10,8 @@ from lingvodoc.models import (
     User
 )
 from lingvodoc.views.v2.utils import (
-    get_user_by_client_id
+    get_user_by_client_id,
+    organization_info
 )
 
 from pyramid.httpexceptions import (
@@ -114,20 +115,7 @@ def view_organization(request):  # TODO: test
     organization = DBSession.query(Organization).filter_by(id=organization_id).first()
     if organization:
         if not organization.marked_for_deletion:
-            response['name'] = organization.name
-            response['about'] = organization.about
-            users = []
-            for user in organization.users:
-                users += [user.id]
-            response['users'] = users
-            additional_metadata = organization.additional_metadata
-            if additional_metadata is None:
-                additional_metadata = dict()
-            response['additional_metadata'] = additional_metadata
-            admins = list()
-            if additional_metadata.get('admins'):
-                admins = additional_metadata['admins']
-            response['admin'] = admins
+            response = organization_info(organization, [user.id for user in organization.users])
             request.response.status = HTTPOk.code
             return response
     request.response.status = HTTPNotFound.code
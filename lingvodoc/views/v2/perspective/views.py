@@ -8,6 +8,8 @@ import json
 import logging
 import multiprocessing
 
+import transaction
+
 from sqlalchemy.orm.attributes import flag_modified
 
 from pyramid.httpexceptions import (
@@ -38,7 +40,6 @@ from pyramid.security import authenticated_userid
 from pyramid.view import view_config
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
-from sqlalchemy.orm.exc import NoResultFound
 
 from lingvodoc.cache.caching import MEMOIZE
 from lingvodoc.exceptions import CommonException
@@ -86,35 +87,8 @@ def permissions_on_perspectives(request):
 
     client_id = authenticated_userid(request)
 
-    subreq = Request.blank('/translation_service_search')
-    subreq.method = 'POST'
-    subreq.headers = request.headers
-    subreq.json = {'searchstring': 'Published'}
-    headers = dict()
-    if request.headers.get('Cookie'):
-        headers = {'Cookie': request.headers['Cookie']}
-    subreq.headers = headers
-    resp = request.invoke_subrequest(subreq)
-
-    if 'error' not in resp.json:
-        published_gist_object_id, published_gist_client_id = resp.json['object_id'], resp.json['client_id']
-    else:
-        raise KeyError("Something wrong with the base", resp.json['error'])
-
-    subreq = Request.blank('/translation_service_search')
-    subreq.method = 'POST'
-    subreq.headers = request.headers
-    subreq.json = {'searchstring': 'Limited access'}  # todo: fix
-    headers = dict()
-    if request.headers.get('Cookie'):
-        headers = {'Cookie': request.headers['Cookie']}
-    subreq.headers = headers
-    resp = request.invoke_subrequest(subreq)
-
-    if 'error' not in resp.json:
-        limited_gist_object_id, limited_gist_client_id = resp.json['object_id'], resp.json['client_id']
-    else:
-        raise KeyError("Something wrong with the base", resp.json['error'])
+    published_gist_client_id, published_gist_object_id = TranslationGist.get_service_gist_id('Published')
+    limited_gist_client_id, limited_gist_object_id = TranslationGist.get_service_gist_id('Limited access')
 
     intermediate = dict()
 
@@ -182,32 +156,12 @@ def perspectives_list(request):  # tested
     visible = request.params.get('visible', None)
 
 
-    subreq = Request.blank('/translation_service_search')
-    subreq.method = 'POST'
-    subreq.headers = request.headers
-    subreq.json = {'searchstring': 'Published'}
-    headers = {'Cookie': request.headers['Cookie']}
-    subreq.headers = headers
-    resp = request.invoke_subrequest(subreq)
-    if 'error' not in resp.json:
-        state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-            'client_id']
-        published_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
-    else:
-        raise KeyError("Something wrong with the base", resp.json['error'])
-    subreq = Request.blank('/translation_service_search')
-    subreq.method = 'POST'
-    subreq.headers = request.headers
-    subreq.json = {'searchstring': 'Limited access'}
-    headers = {'Cookie': request.headers['Cookie']}
-    subreq.headers = headers
-    resp = request.invoke_subrequest(subreq)
-    if 'error' not in resp.json:
-        state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-            'client_id']
-        limited_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
-    else:
-        raise KeyError("Something wrong with the base", resp.json['error'])
+    state_translation_gist_client_id, state_translation_gist_object_id = \
+        TranslationGist.get_service_gist_id('Published')
+    published_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
+    state_translation_gist_client_id, state_translation_gist_object_id = \
+        TranslationGist.get_service_gist_id('Limited access')
+    limited_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
 
     atom_perspective_name_alias = aliased(TranslationAtom, name="PerspectiveName")
     atom_perspective_name_fallback_alias = aliased(TranslationAtom, name="PerspectiveNameFallback")
@@ -783,19 +737,8 @@ def create_perspective(request):  # tested & in docs
         else:
             additional_metadata = coord
 
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'WiP'}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                'client_id']
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('WiP')
 
         perspective = DictionaryPerspective(client_id=client_id,
                                             object_id=object_id,
@@ -913,32 +856,12 @@ def view_perspectives(request):
     perspectives = list()
 
     if published:
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'Published'}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                'client_id']
-            published = (state_translation_gist_client_id, state_translation_gist_object_id)
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'Limited access'}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                'client_id']
-            limited = (state_translation_gist_client_id, state_translation_gist_object_id)
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('Published')
+        published = (state_translation_gist_client_id, state_translation_gist_object_id)
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('Limited access')
+        limited = (state_translation_gist_client_id, state_translation_gist_object_id)
 
     for perspective in parent.dictionaryperspective:
         path = request.route_url('perspective',
@@ -1339,6 +1262,7 @@ def edit_perspective_status(request):  # tested & in docs
             req = request.json_body
         perspective.state_translation_gist_client_id = req['state_translation_gist_client_id']
         perspective.state_translation_gist_object_id = req['state_translation_gist_object_id']
+        DictionaryPerspective.invalidate_state()
         atom = DBSession.query(TranslationAtom).filter_by(parent_client_id=req['state_translation_gist_client_id'],
                                                           parent_object_id=req['state_translation_gist_object_id'],
                                                           locale_id=int(request.cookies['locale_id'])).first()
@@ -1501,13 +1425,9 @@ def view_perspective_fields(request):
             .order_by(DictionaryPerspectiveToField.position) \
             .all()
         try:
-            link_gist = DBSession.query(TranslationGist) \
-                .join(TranslationAtom) \
-                .filter(TranslationGist.type == 'Service',
-                        TranslationAtom.content == 'Link',
-                        TranslationAtom.locale_id == 2).one()
-            link_ids = {'client_id': link_gist.client_id, 'object_id': link_gist.object_id}
-        except NoResultFound:
+            link_client_id, link_object_id = TranslationGist.get_service_gist_id('Link')
+            link_ids = {'client_id': link_client_id, 'object_id': link_object_id}
+        except KeyError:
             request.response.status = HTTPNotFound.code
             return {'error': str("Something wrong with the base")}
         for field in fields:
@@ -1543,13 +1463,9 @@ def update_perspective_fields(request):
             request.response.status = HTTPBadRequest.code
             return {'error': "invalid json"}
         try:
-            link_gist = DBSession.query(TranslationGist) \
-                .join(TranslationAtom) \
-                .filter(TranslationGist.type == 'Service',
-                        TranslationAtom.content == 'Link',
-                        TranslationAtom.locale_id == 2).one()
-            link_ids = {'client_id': link_gist.client_id, 'object_id': link_gist.object_id}
-        except NoResultFound:
+            link_client_id, link_object_id = TranslationGist.get_service_gist_id('Link')
+            link_ids = {'client_id': link_client_id, 'object_id': link_object_id}
+        except KeyError:
             request.response.status = HTTPNotFound.code
             return {'error': str("Something wrong with the base")}
         fields = DBSession.query(DictionaryPerspectiveToField) \
@@ -1904,6 +1820,100 @@ def lexical_entries_published_count(request):
         return {'error': str("No such perspective in the system")}
 
 
+def lexical_entries_stream(perspective_id, locale_id, publish, after=None, chunk_size=500, limit=None):
+    """
+    Yields lexical entries of a perspective with their entities as newline-delimited JSON.
+
+    Entries are ordered by id and loaded in chunks of bounded size, each chunk in a separate transaction,
+    so that an export of any size never has to be held in memory as a whole. Export can be resumed from
+    any entry by passing its id as 'after'.
+    """
+    count = 0
+    while limit is None or count < limit:
+        with transaction.manager:
+            entity_condition = Entity.marked_for_deletion == False
+            if publish:
+                entity_condition = and_(entity_condition,
+                                        Entity.publishingentity.has(PublishingEntity.published == True))
+            lexes = DBSession.query(LexicalEntry).filter(
+                LexicalEntry.parent_client_id == perspective_id[0],
+                LexicalEntry.parent_object_id == perspective_id[1],
+                LexicalEntry.marked_for_deletion == False,
+                LexicalEntry.entity.any(entity_condition))
+            if after:
+                lexes = lexes.filter(tuple_(LexicalEntry.client_id, LexicalEntry.object_id) > tuple_(*after))
+            lexes = lexes.order_by(LexicalEntry.client_id, LexicalEntry.object_id) \
+                .limit(chunk_size if limit is None else min(chunk_size, limit - count)).all()
+            if not lexes:
+                return
+
+            lexes_composite_list = [(lex.created_at,
+                                     lex.client_id, lex.object_id, lex.parent_client_id, lex.parent_object_id,
+                                     lex.marked_for_deletion, lex.additional_metadata,
+                                     lex.additional_metadata.get('came_from')
+                                     if lex.additional_metadata and 'came_from' in lex.additional_metadata else None)
+                                    for lex in lexes]
+            chunk = ''.join(json.dumps(entry) + '\n' for entry in
+                            LexicalEntry.track_multiple(lexes_composite_list, locale_id, publish=publish, accept=True))
+
+            after = (lexes[-1].client_id, lexes[-1].object_id)
+            count += len(lexes)
+        yield chunk.encode('utf-8')
+
+
+def lexical_entries_stream_response(request, publish, preview_mode=False):
+    """
+    Gets streaming newline-delimited JSON export of lexical entries of a perspective, see
+    lexical_entries_stream.
+
+    Accepts optional 'after_client_id' and 'after_object_id' parameters to resume export after the specified
+    entry and an optional 'chunk_size' parameter. In preview mode only first 20 entries are exported.
+    """
+    client_id = request.matchdict.get('perspective_client_id')
+    object_id = request.matchdict.get('perspective_object_id')
+    parent = DBSession.query(DictionaryPerspective).filter_by(client_id=client_id, object_id=object_id).first()
+    if not parent or parent.marked_for_deletion:
+        # Not rendered by the view's JSON renderer, so that clients reading the stream get a plain error.
+        return HTTPNotFound(json={'error': str("No such perspective in the system")})
+
+    after_client_id = request.params.get('after_client_id')
+    after_object_id = request.params.get('after_object_id')
+    after = (int(after_client_id), int(after_object_id)) if after_client_id and after_object_id else None
+    chunk_size = min(int(request.params.get('chunk_size') or 500), 5000)
+
+    limit = None
+    if preview_mode:
+        if after:
+            return Response(app_iter=[], content_type='application/x-ndjson')
+        limit = 20
+
+    return Response(
+        app_iter=lexical_entries_stream(
+            (parent.client_id, parent.object_id), int(request.cookies.get('locale_id') or 2), publish,
+            after=after, chunk_size=chunk_size, limit=limit),
+        content_type='application/x-ndjson')
+
+
+@view_config(route_name='lexical_entries_all_stream', renderer='json', request_method='GET', permission='view')
+def lexical_entries_all_stream(request):
+    return lexical_entries_stream_response(request, publish=None)
+
+
+@view_config(route_name='lexical_entries_published_stream', renderer='json', request_method='GET')
+def lexical_entries_published_stream(request):
+    client_id = request.matchdict.get('perspective_client_id')
+    object_id = request.matchdict.get('perspective_object_id')
+    preview_mode = False
+
+    parent = DBSession.query(DictionaryPerspective).filter_by(client_id=client_id, object_id=object_id).first()
+    if parent and not parent.marked_for_deletion:
+        if (parent.state == 'Limited access' or parent.parent.state == 'Limited access') and "view:lexical_entries_and_entities:" + client_id + ":" + object_id not in request.effective_principals:
+            log.debug("PREVIEW MODE")
+            preview_mode = True
+
+    return lexical_entries_stream_response(request, publish=True, preview_mode=preview_mode)
+
+
 @view_config(route_name='lexical_entries_not_accepted_count', renderer='json', request_method='GET')
 def lexical_entries_not_accepted_count(request):
     client_id = request.matchdict.get('perspective_client_id')
@@ -2374,6 +2384,7 @@ def delete_perspective(request):  # tested & in docs
                 objecttoc = DBSession.query(ObjectTOC).filter_by(client_id=perspective.client_id,
                                                                  object_id=perspective.object_id).one()
                 objecttoc.marked_for_deletion = True
+            DictionaryPerspective.invalidate_state()
             request.response.status = HTTPOk.code
             return response
     request.response.status = HTTPNotFound.code
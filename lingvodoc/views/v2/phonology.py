@@ -1,32 +1,38 @@
 
 # Standard library imports.
 
+import array
 import base64
 import collections
+import concurrent.futures
+import contextlib
 import datetime
-from errno import EEXIST
-from hashlib import md5
+from hashlib import md5, sha224
 import io
 import itertools
+import json
 import logging
 import math
-from os import makedirs, path
+from multiprocessing import cpu_count
+from os import makedirs, path, remove, rename
+import pickle
 import pprint
 import re
 from shutil import copyfileobj
 import sndhdr
 import string
+import sys
 import tempfile
 from time import time
 import traceback
 
-import urllib.request
 import urllib.parse
 
 import zipfile
 
 # External imports.
 
+import billiard
 import cchardet as chardet
 from celery.utils.log import get_task_logger
 
@@ -65,6 +71,7 @@ import xlsxwriter
 
 import lingvodoc.cache.caching as caching
 from lingvodoc.cache.caching import CACHE, initialize_cache, TaskStatus
+from lingvodoc.cache.disk.cache import DiskCache
 
 from lingvodoc.models import (
     Client,
@@ -81,7 +88,7 @@ from lingvodoc.models import (
 )
 
 from lingvodoc.queue.celery import celery
-from lingvodoc.views.v2.utils import anonymous_userid, message, storage_file, unimplemented
+from lingvodoc.views.v2.utils import anonymous_userid, message, storage_buffer, storage_file, unimplemented
 
 
 # Setting up logging.
@@ -153,6 +160,28 @@ def get_kaiser_window(half_window_size):
     return (window_list, window_sum)
 
 
+#: Dictionary used for memoization of Kaiser window numpy arrays.
+kaiser_window_array_dict = dict()
+
+
+def get_kaiser_window_array(half_window_size):
+    """
+    Returns (2N + 1)-sample Kaiser window, where N is a half window size in samples, as a numpy array,
+    along with the sum of window's values.
+
+    Employs memoization.
+    """
+
+    if half_window_size in kaiser_window_array_dict:
+        return kaiser_window_array_dict[half_window_size]
+
+    window_list, window_sum = get_kaiser_window(half_window_size)
+    window_array = numpy.array(window_list)
+
+    kaiser_window_array_dict[half_window_size] = (window_array, window_sum)
+    return (window_array, window_sum)
+
+
 #: Dictionary used for memoization of Gaussian window function computation.
 gaussian_window_dict = dict()
 
@@ -222,6 +251,77 @@ def burg(sample_list, coefficient_number):
     return a0, coefficient_list
 
 
+def burg_batch(sample_array, coefficient_number):
+    """
+    Computes Linear Prediction coefficients via Burg method for each row of a 2d numpy array of samples,
+    performing the same recursion as burg() simultaneously for all rows.
+    """
+
+    frame_count, sample_count = sample_array.shape
+
+    a0_array = (sample_array ** 2).sum(axis = 1) / sample_count
+
+    b1 = sample_array[:, :-1].copy()
+    b2 = sample_array[:, 1:].copy()
+
+    aa = numpy.zeros((frame_count, coefficient_number))
+    coefficient_array = numpy.zeros((frame_count, coefficient_number))
+
+    for i in range(coefficient_number):
+
+        count = sample_count - i - 1
+
+        numerator = (b1[:, :count] * b2[:, :count]).sum(axis = 1)
+        denominator = (b1[:, :count] ** 2 + b2[:, :count] ** 2).sum(axis = 1)
+
+        # Failing in the same way burg() fails on a frame of zero samples.
+
+        if (denominator == 0).any():
+            raise ZeroDivisionError('float division by zero')
+
+        coefficient = 2.0 * numerator / denominator
+
+        coefficient_array[:, i] = coefficient
+        a0_array *= 1.0 - coefficient ** 2
+
+        if i > 0:
+            coefficient_array[:, :i] = aa[:, :i] - coefficient[:, None] * aa[:, i - 1 :: -1]
+
+        aa[:, : i + 1] = coefficient_array[:, : i + 1]
+
+        # Updates of forward and backward prediction errors use only not yet updated values, so they can be
+        # performed at once.
+
+        count = sample_count - i - 2
+        a = aa[:, i : i + 1]
+
+        b1_updated = b1[:, :count] - a * b2[:, :count]
+        b2[:, :count] = b2[:, 1 : count + 1] - a * b1[:, 1 : count + 1]
+        b1[:, :count] = b1_updated
+
+    return a0_array, coefficient_array
+
+
+def polynomial_roots_batch(coefficient_array):
+    """
+    Computes roots of polynomials given by rows of a 2d numpy array of coefficients in order of increasing
+    degree, as eigenvalues of a stack of companion matrices constructed in the same way as by
+    numpy.polynomial.polynomial.polyroots.
+
+    All polynomials must have the same degree, i.e. all leading coefficients must be non-zero.
+    """
+
+    polynomial_count, size = coefficient_array.shape
+    degree = size - 1
+
+    companion_array = numpy.zeros((polynomial_count, degree, degree))
+
+    companion_array[:, numpy.arange(1, degree), numpy.arange(degree - 1)] = 1.0
+    companion_array[:, :, -1] -= coefficient_array[:, :-1] / coefficient_array[:, -1:]
+
+    return numpy.linalg.eigvals(companion_array[:, ::-1, ::-1])
+
+
 class AudioPraatLike(object):
     """
     Allows computations of sound intensity and formants using algorithms mimicking as close as possible
@@ -256,7 +356,7 @@ class AudioPraatLike(object):
         self.intensity_step_count = int(
             math.floor((self.intensity_sound.frame_count() - 1) // self.intensity_step_size + 1))
 
-        self.intensity_list = [None for i in range(self.intensity_step_count)]
+        self.intensity_array = None
 
         #
         # Praat's formant window size is 0.05 seconds, and formant time step is 8 times less, i.e.
@@ -284,55 +384,98 @@ class AudioPraatLike(object):
 
         self.init_formant_f = self.init_formant_fft
 
-    def get_intensity(self, step_index):
-        """
-        Computes intensity at the point specified by intensity time step index.
+    def init_intensity(self):
         """
+        Computes intensity values at all intensity time steps of the recording in a single vectorized pass.
 
-        if step_index < 4 or step_index >= self.intensity_step_count - 4:
-            raise ValueError('step index {0} is out of bounds [4, {1})'.format(
-                step_index, self.intensity_step_count - 4))
-
-        # Checking if we already computed required intensity value.
+        Sound samples are viewed as a sequence of overlapping windows via a strided numpy view, which is
+        then multiplied by the Kaiser window. To keep memory usage bounded for long recordings, windows are
+        processed in fixed-size batches.
+        """
 
-        if self.intensity_list[step_index] != None:
-            return self.intensity_list[step_index]
+        self.intensity_array = numpy.full(self.intensity_step_count, numpy.nan)
 
-        # No, we haven't, so we are going to compute it.
+        window_count = self.intensity_step_count - 8
 
-        window_list, window_sum = get_kaiser_window(self.intensity_half_window_size)
+        if window_count <= 0:
+            return
 
-        sample_array = self.intensity_sound.get_array_of_samples()
-        sample_sum = 0.0
+        window_array, window_sum = get_kaiser_window_array(self.intensity_half_window_size)
 
         channel_count = self.intensity_sound.channels
         amplitude_limit = self.intensity_sound.max_possible_amplitude
 
-        # We sum squared normalized amplitudes of all samples of all channels in the window.
+        # Summing squared normalized amplitudes of all channels for each frame, window weights do not
+        # depend on the channel.
+
+        sample_array = numpy.asarray(
+            self.intensity_sound.get_array_of_samples(), dtype = numpy.float64)
+
+        frame_count = len(sample_array) // channel_count
+
+        sample_array = sample_array[:frame_count * channel_count].reshape(
+            (frame_count, channel_count)) / amplitude_limit
+
+        energy_array = numpy.ascontiguousarray((sample_array ** 2).sum(axis = 1))
+
+        # Window of the time step i starts at the frame (i - 4) * step_size, so the windows of time steps
+        # 4, 5, ... are represented by a view with rows shifted by step_size frames.
 
-        sample_from = (step_index - 4) * self.intensity_step_size * channel_count
+        window_view = numpy.lib.stride_tricks.as_strided(
+            energy_array,
+            shape = (window_count, self.intensity_window_size),
+            strides = (
+                self.intensity_step_size * energy_array.strides[0],
+                energy_array.strides[0]))
 
-        for i in range(self.intensity_window_size):
-            for j in range(channel_count):
-                sample = sample_array[sample_from + i * channel_count + j] / amplitude_limit
-                sample_sum += sample ** 2 * window_list[i]
+        # Rows of the view overlap, so it must not be written to.
+
+        window_view.flags.writeable = False
+
+        sum_array = numpy.empty(window_count)
+        batch_size = max(1, (1 << 20) // self.intensity_window_size)
+
+        for batch_from in range(0, window_count, batch_size):
+
+            sum_array[batch_from : batch_from + batch_size] = numpy.dot(
+                window_view[batch_from : batch_from + batch_size], window_array)
 
         # Multiplication by 2.5e9 is taken directly from Praat source code, where it is performed via
         # division by 4e-10.
 
-        intensity_ratio = sample_sum / (channel_count * window_sum) * 2.5e9
-        intensity = -300 if intensity_ratio < 1e-30 else 10 * math.log10(intensity_ratio)
+        ratio_array = sum_array / (channel_count * window_sum) * 2.5e9
+        small_array = ratio_array < 1e-30
+
+        ratio_array[small_array] = 1.0
+        intensity_array = 10 * numpy.log10(ratio_array)
+        intensity_array[small_array] = -300
+
+        self.intensity_array[4 : self.intensity_step_count - 4] = intensity_array
+
+    def get_intensity(self, step_index):
+        """
+        Returns intensity at the point specified by intensity time step index.
+        """
+
+        if step_index < 4 or step_index >= self.intensity_step_count - 4:
+            raise ValueError('step index {0} is out of bounds [4, {1})'.format(
+                step_index, self.intensity_step_count - 4))
+
+        # Computing intensity values of the whole recording, if required.
 
-        # Saving computed intensity value for reuse, and returning it.
+        if self.intensity_array is None:
+            self.init_intensity()
 
-        self.intensity_list[step_index] = intensity
-        return intensity
+        return float(self.intensity_array[step_index])
 
     def get_interval_intensity(self, begin, end):
         """
         Computes mean-energy intensity of an interval specified by beginning and end in seconds.
         """
 
+        if self.intensity_array is None:
+            self.init_intensity()
+
         # Due to windowed nature of intensity computation, we can't compute it for points close to the
         # beginning and the end of the recording; such points are skipped.
 
@@ -341,9 +484,8 @@ class AudioPraatLike(object):
         begin_step = max(4, int(math.ceil(begin * factor)))
         end_step = min(self.intensity_step_count - 5, int(math.floor(end * factor)))
 
-        energy_sum = sum(
-            math.pow(10, 0.1 * self.get_intensity(step_index))
-                for step_index in range(begin_step, end_step + 1))
+        energy_sum = float(numpy.power(10.0,
+            0.1 * self.intensity_array[begin_step : end_step + 1]).sum())
 
         return 10 * math.log10(energy_sum / (end_step - begin_step + 1))
 
@@ -382,6 +524,11 @@ class AudioPraatLike(object):
 
         self.formant_list = [None for i in range(self.formant_step_count)]
 
+        self.formant_sample_array = numpy.array(self.formant_sample_list)
+
+        self.formant_array = numpy.full((self.formant_step_count, 3), numpy.nan)
+        self.formant_flag_array = numpy.zeros(self.formant_step_count, dtype = bool)
+
     def init_formant_fft(self):
         """
         Initializes formant computation data using FFT-based resampling computed via numpy.
@@ -450,6 +597,11 @@ class AudioPraatLike(object):
 
         self.formant_list = [None for i in range(self.formant_step_count)]
 
+        self.formant_sample_array = numpy.array(self.formant_sample_list)
+
+        self.formant_array = numpy.full((self.formant_step_count, 3), numpy.nan)
+        self.formant_flag_array = numpy.zeros(self.formant_step_count, dtype = bool)
+
     def get_formants(self, step_index):
         """
         Computes point formant values at the point specified by formant time step index.
@@ -566,6 +718,145 @@ class AudioPraatLike(object):
 
         return formant_list[:3]
 
+    def get_formants_batch(self, begin_step, end_step):
+        """
+        Computes first three point formant values at all formant time steps in [begin_step, end_step),
+        processing all not yet computed time steps at once.
+
+        Results are numerically equivalent, up to floating point rounding, to the results of computing
+        point formant values one step at a time via get_formants().
+
+        Returns numpy array of shape (end_step - begin_step, 3).
+        """
+
+        # Initializing formant computation data, if required.
+
+        if self.formant_list == None:
+            self.init_formant_f()
+
+        if begin_step >= end_step:
+            return numpy.empty((0, 3))
+
+        if begin_step < 4 or end_step > self.formant_step_count - 4:
+            raise ValueError('step index range [{0}, {1}) is out of bounds [4, {2})'.format(
+                begin_step, end_step, self.formant_step_count - 4))
+
+        step_array = begin_step + numpy.flatnonzero(
+            ~self.formant_flag_array[begin_step : end_step])
+
+        if len(step_array) > 0:
+            self.compute_formant_steps(step_array)
+
+        return self.formant_array[begin_step : end_step]
+
+    def compute_formant_steps(self, step_array):
+        """
+        Computes and memoizes first three point formant values at time steps given by a numpy array of
+        formant time step indices.
+        """
+
+        # Getting windowed frames of all time steps at once.
+
+        window_array = numpy.array(get_gaussian_window(self.formant_window_size))
+
+        index_array = (
+            (step_array[:, None] - 4) * self.formant_step_size +
+                numpy.arange(self.formant_window_size))
+
+        frame_array = self.formant_sample_array[index_array] * window_array
+
+        # Computing Linear Prediction coefficients and roots of characteristic polynomials, see
+        # get_formants() for details.
+
+        a0_array, coefficient_array = burg_batch(frame_array, 10)
+
+        polynomial_array = numpy.empty((len(step_array), 11))
+
+        polynomial_array[:, 0] = 1.0
+        polynomial_array[:, 1:] = -coefficient_array
+
+        if (polynomial_array[:, -1] == 0).any():
+
+            # Polynomials of a lower degree would have a different number of roots, we process each one
+            # separately, just as get_formants() does.
+
+            root_array = numpy.full((len(step_array), 10), numpy.nan, dtype = complex)
+
+            for index, polynomial in enumerate(polynomial_array):
+
+                root_list = numpy.polynomial.Polynomial(polynomial).roots()
+                root_array[index, :len(root_list)] = root_list
+
+        else:
+            root_array = polynomial_roots_batch(polynomial_array).astype(complex)
+
+        # Only roots above the real line give formants, so we refine them via the same Newton-Raphson
+        # iteration as get_formants() does, simultaneously for all such roots.
+
+        frame_index_array, root_index_array = numpy.nonzero(root_array.imag > 0)
+
+        previous = root_array[frame_index_array, root_index_array]
+
+        polynomial_list = polynomial_array[frame_index_array, ::-1]
+        derivative_list = polynomial_list * numpy.arange(10, -1, -1)
+
+        def evaluate(c_list, value):
+            result = numpy.zeros(len(value), dtype = complex)
+
+            for i in range(c_list.shape[1]):
+                result = result * value + c_list[:, i]
+
+            return result
+
+        with numpy.errstate(divide = 'ignore', invalid = 'ignore', over = 'ignore'):
+
+            previous_delta = numpy.abs(evaluate(polynomial_list, previous))
+            active_array = numpy.arange(len(previous))
+
+            while len(active_array) > 0:
+
+                value = previous[active_array]
+
+                current = value - (
+                    evaluate(polynomial_list[active_array], value) /
+                    evaluate(derivative_list[active_array], value))
+
+                current_delta = numpy.abs(evaluate(polynomial_list[active_array], current))
+                better_array = current_delta < previous_delta[active_array]
+
+                active_array = active_array[better_array]
+
+                previous[active_array] = current[better_array]
+                previous_delta[active_array] = current_delta[better_array]
+
+        # Moving roots into the unit circle and computing formant frequencies.
+
+        outside_array = numpy.abs(previous) > 1.0
+        previous[outside_array] = 1.0 / previous[outside_array].conjugate()
+
+        nyquist_frequency = self.formant_frame_rate * 0.5
+
+        frequency_array = numpy.full(root_array.shape, numpy.inf)
+
+        frequency_array[frame_index_array, root_index_array] = (
+            numpy.abs(numpy.arctan2(numpy.abs(previous.imag), previous.real)) *
+                nyquist_frequency / math.pi)
+
+        frequency_array[
+            (frequency_array < 50) |
+            (frequency_array > nyquist_frequency - 50)] = numpy.inf
+
+        frequency_array.sort(axis = 1)
+        frequency_array = frequency_array[:, :3]
+
+        # Failing in the same way get_interval_formants() fails if we do not have three formants.
+
+        if numpy.isinf(frequency_array).any():
+            raise ValueError('not enough values to unpack (expected 3)')
+
+        self.formant_array[step_array] = frequency_array
+        self.formant_flag_array[step_array] = True
+
     def get_interval_formants(self, begin, end):
         """
         Computes first and second formants of an interval specified by beginning and end in seconds.
@@ -586,18 +877,9 @@ class AudioPraatLike(object):
 
         # Getting point formant values.
 
-        f1_list, f2_list, f3_list = [], [], []
-
-        for step_index in range(begin_step, end_step + 1):
-            f1, f2, f3 = self.get_formants(step_index)
-
-            f1_list.append(f1)
-            f2_list.append(f2)
-            f3_list.append(f3)
-
-        f1_list.sort()
-        f2_list.sort()
-        f3_list.sort()
+        f1_list, f2_list, f3_list = (
+            sorted(f_list) for f_list in
+                self.get_formants_batch(begin_step, end_step + 1).T.tolist())
 
         # Computing interval formant values as means (without highest and lowest values, if possible).
 
@@ -836,18 +1118,31 @@ def escape_character(string):
     return escape_character_re.sub(lambda match: escape_character_dict[match.group(0)], string)
 
 
-def process_textgrid(textgrid, unusual_f, no_vowel_f, no_vowel_selected_f):
+def textgrid_tier_list(textgrid):
+    """
+    Gets list of tiers of parsed TextGrid markup as tuples of tier number, tier name and list of tier
+    intervals, with Praat character escape sequences in interval texts substituted.
+    """
+
+    return [
+
+        (tier_number, tier_name,
+            [(begin, end, character_escape(text))
+                for begin, end, text in textgrid.get_tier(tier_number).get_all_intervals()])
+
+            for tier_number, tier_name in textgrid.get_tier_name_num()]
+
+
+def process_textgrid(tier_list, unusual_f, no_vowel_f, no_vowel_selected_f):
     """
-    Processes TextGrid markup, checking for each tier if it should be analyzed.
+    Processes TextGrid markup given by its tier list, see textgrid_tier_list(), checking for each tier if it
+    should be analyzed.
     """
 
     tier_data_list = []
     vowel_flag = False
 
-    for tier_number, tier_name in textgrid.get_tier_name_num():
-
-        raw_interval_list = [(begin, end, character_escape(text))
-            for begin, end, text in textgrid.get_tier(tier_number).get_all_intervals()]
+    for tier_number, tier_name, raw_interval_list in tier_list:
 
         raw_interval_seq_list = [[]]
 
@@ -1180,12 +1475,59 @@ def formant_reference(f1, f2):
     return vowel_list
 
 
+class Result_Spool(object):
+    """
+    Accumulates phonology analysis results in a temporary file instead of in memory, supports appending,
+    length and repeated iteration, like a list.
+    """
+
+    def __init__(self):
+
+        self.result_file = tempfile.TemporaryFile()
+        self.result_count = 0
+
+    def append(self, result):
+
+        self.result_file.seek(0, io.SEEK_END)
+        pickle.dump(result, self.result_file, pickle.HIGHEST_PROTOCOL)
+
+        self.result_count += 1
+
+    def __len__(self):
+        return self.result_count
+
+    def __iter__(self):
+
+        self.result_file.seek(0)
+
+        for i in range(self.result_count):
+            yield pickle.load(self.result_file)
+
+    def close(self):
+        self.result_file.close()
+
+
+def write_column_list(worksheet, row_index, column_list):
+    """
+    Writes a list of data columns into a worksheet starting from a specified row, row by row, as required
+    by the constant memory mode of xlsxwriter.
+    """
+
+    for index, row_list in enumerate(itertools.zip_longest(*column_list, fillvalue = '')):
+        worksheet.write_row(row_index + index, 0, row_list)
+
+
 def compile_workbook(vowel_selection, result_list, result_group_set, workbook_stream):
     """
     Compiles analysis results into an Excel workbook.
+
+    If the workbook is given by a file path, it is compiled in constant memory mode, with worksheet rows
+    flushed to disk as soon as they are written.
     """
 
-    workbook = xlsxwriter.Workbook(workbook_stream, {'in_memory': True})
+    workbook = xlsxwriter.Workbook(workbook_stream,
+        {'constant_memory': True} if isinstance(workbook_stream, str) else {'in_memory': True})
+
     format_percent = workbook.add_format({'num_format': '0.00%'})
 
     group_string_dict = {group: repr(group)
@@ -1246,7 +1588,10 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
     row_counter_dict = {group: 2 for group in result_group_set}
     sound_counter_dict = {group: 0 for group in result_group_set}
 
-    vowel_formant_dict = {group: collections.defaultdict(list) for group in result_group_set}
+    # Formant vectors are accumulated as flat arrays of F1/F2/F3 values.
+
+    vowel_formant_dict = {group: collections.defaultdict(lambda: array.array('d'))
+        for group in result_group_set}
 
     # Filling in analysis results.
 
@@ -1300,13 +1645,13 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                     for group in textgrid_group_list:
 
                         sound_counter_dict[group] += 1
-                        vowel_formant_dict[group][vowel_a].append(tuple(f_list_a))
+                        vowel_formant_dict[group][vowel_a].extend(f_list_a)
 
                     if text_b_list[2] != text_a_list[2]:
                         for group in textgrid_group_list:
 
                             sound_counter_dict[group] += 1
-                            vowel_formant_dict[group][vowel_b].append(tuple(f_list_b))
+                            vowel_formant_dict[group][vowel_b].extend(f_list_b)
 
                 # ...for all intervals.
 
@@ -1344,7 +1689,7 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                                 row_counter_dict[group] += 1
 
                             sound_counter_dict[group] += 1
-                            vowel_formant_dict[group][vowel].append(tuple(f_list))
+                            vowel_formant_dict[group][vowel].extend(f_list)
 
     # And now we will produce 2d F1/F2 and 3d F1/F2/F3  scatter charts for all analysed and sufficiently
     # frequent vowels of all result groups.
@@ -1357,13 +1702,15 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
 
         vowel_formant_list = []
 
-        for vowel, f_tuple_list in sorted(vowel_formant_dict[group].items()):
-            f_tuple_list = list(set(f_tuple_list))
+        for vowel, f_array in sorted(vowel_formant_dict[group].items()):
+            # Removing duplicate F1/F2/F3 3-vectors, numpy.unique() with the axis argument requires numpy
+            # 1.13.
 
-            if len(f_tuple_list) >= 8:
-                vowel_formant_list.append((vowel,
-                    list(map(lambda f_tuple: numpy.array(f_tuple[:2]), f_tuple_list)),
-                    list(map(numpy.array, f_tuple_list))))
+            f_3d_array = numpy.array(sorted(set(
+                map(tuple, numpy.frombuffer(f_array).reshape((-1, 3)).tolist()))))
+
+            if len(f_3d_array) >= 8:
+                vowel_formant_list.append((vowel, f_3d_array[:, :2], f_3d_array))
 
         # Compiling data of formant value series by filtering F1/F2 2-vectors and F1/F2/F3 3-vectors by
         # Mahalonobis distance.
@@ -1378,132 +1725,101 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
         min_3d_f2, max_3d_f2 = None, None
         min_3d_f3, max_3d_f3 = None, None
 
-        for index, (vowel, f_2d_list, f_3d_list) in enumerate(vowel_formant_list):
+        for index, (vowel, f_2d_array, f_3d_array) in enumerate(vowel_formant_list):
 
-            mean_2d = sum(f_2d_list) / len(f_2d_list)
-            sigma_2d = numpy.cov(numpy.array(f_2d_list).T)
+            mean_2d = f_2d_array.mean(axis = 0)
+            sigma_2d = numpy.cov(f_2d_array.T)
             inverse_2d = numpy.linalg.inv(sigma_2d)
 
-            mean_3d = sum(f_3d_list) / len(f_3d_list)
-            sigma_3d = numpy.cov(numpy.array(f_3d_list).T)
+            mean_3d = f_3d_array.mean(axis = 0)
+            sigma_3d = numpy.cov(f_3d_array.T)
             inverse_3d = numpy.linalg.inv(sigma_3d)
 
-            distance_2d_list = []
-            distance_3d_list = []
-
             # Calculation of squared Mahalanobis distance inspired by the StackOverflow answer
             # http://stackoverflow.com/q/27686240/2016856.
 
-            for f_2d in f_2d_list:
+            delta_2d = f_2d_array - mean_2d
+            distance_2d_array = numpy.einsum('in,nk,ik->i', delta_2d, inverse_2d, delta_2d)
 
-                delta_2d = f_2d - mean_2d
-                distance_2d_list.append((numpy.einsum('n,nk,k->', delta_2d, inverse_2d, delta_2d), f_2d))
+            delta_3d = f_3d_array - mean_3d
+            distance_3d_array = numpy.einsum('in,nk,ik->i', delta_3d, inverse_3d, delta_3d)
 
-            for f_3d in f_3d_list:
-
-                delta_3d = f_3d - mean_3d
-                distance_3d_list.append((numpy.einsum('n,nk,k->', delta_3d, inverse_3d, delta_3d), f_3d))
-
-            distance_2d_list.sort()
-            distance_3d_list.sort()
+            order_2d = numpy.argsort(distance_2d_array, kind = 'mergesort')
+            order_3d = numpy.argsort(distance_3d_array, kind = 'mergesort')
 
             # Trying to produce one standard deviation ellipse for F1/F2 2-vectors.
 
             sigma_one_two = scipy.linalg.sqrtm(sigma_2d)
-            ellipse_list = []
-
-            for i in range(64 + 1):
-                phi = 2 * math.pi * i / 64
-
-                ellipse_list.append(
-                    mean_2d + numpy.dot(numpy.array([math.cos(phi), math.sin(phi)]), sigma_one_two))
 
-            # Splitting F1/F2 2-vectors into these that are close enough to the mean, and the outliers.
+            phi = 2 * numpy.pi * numpy.arange(64 + 1) / 64
 
-            filtered_2d_list = []
-            outlier_2d_list = []
+            ellipse_array = mean_2d + numpy.dot(
+                numpy.stack((numpy.cos(phi), numpy.sin(phi)), axis = 1), sigma_one_two)
 
-            for distance_squared, f_2d in distance_2d_list:
-                if distance_squared <= 2:
-                    filtered_2d_list.append(f_2d)
-                else:
-                    outlier_2d_list.append(f_2d)
+            # Splitting F1/F2 2-vectors into these that are close enough to the mean, and the outliers, but
+            # taking at least a half of the closest 2-vectors.
 
-            if len(filtered_2d_list) < (len(distance_2d_list) + 1) // 2:
-                sorted_list = [f_2d for distance_squared, f_2d in distance_2d_list]
+            filtered_count = max(
+                int((distance_2d_array <= 2).sum()), (len(f_2d_array) + 1) // 2)
 
-                filtered_2d_list = sorted_list[:(len(distance_2d_list) + 1) // 2]
-                outlier_2d_list = sorted_list[(len(distance_2d_list) + 1) // 2:]
+            filtered_2d_array = f_2d_array[order_2d[:filtered_count]]
+            outlier_2d_array = f_2d_array[order_2d[filtered_count:]]
 
             chart_data_2d_list.append((
-                len(filtered_2d_list), len(f_2d_list), vowel,
-                filtered_2d_list, outlier_2d_list, mean_2d, ellipse_list))
+                len(filtered_2d_array), len(f_2d_array), vowel,
+                filtered_2d_array, outlier_2d_array, mean_2d, ellipse_array))
 
             # The same for F1/F2/F3 3-vectors.
 
-            filtered_3d_list = []
-            outlier_3d_list = []
-
-            for distance_squared, f_3d in distance_3d_list:
-                if distance_squared <= 2:
-                    filtered_3d_list.append(f_3d)
-                else:
-                    outlier_3d_list.append(f_3d)
-
-            if len(filtered_3d_list) < (len(distance_3d_list) + 1) // 2:
-                sorted_list = [f_3d for distance_squared, f_3d in distance_3d_list]
+            filtered_count = max(
+                int((distance_3d_array <= 2).sum()), (len(f_3d_array) + 1) // 2)
 
-                filtered_3d_list = sorted_list[:(len(distance_3d_list) + 1) // 2]
-                outlier_3d_list = sorted_list[(len(distance_3d_list) + 1) // 2:]
+            filtered_3d_array = f_3d_array[order_3d[:filtered_count]]
+            outlier_3d_array = f_3d_array[order_3d[filtered_count:]]
 
             chart_data_3d_list.append((
-                len(filtered_3d_list), len(f_3d_list), vowel,
-                filtered_3d_list, outlier_3d_list, mean_3d, sigma_3d, inverse_3d))
+                len(filtered_3d_array), len(f_3d_array), vowel,
+                filtered_3d_array, outlier_3d_array, mean_3d, sigma_3d, inverse_3d))
 
             # Updating F1/F2 maximum/minimum info.
 
-            f1_list, f2_list = zip(*filtered_2d_list)
+            min_f1, min_f2 = filtered_2d_array.min(axis = 0)
+            max_f1, max_f2 = filtered_2d_array.max(axis = 0)
 
-            min_f1_list, max_f1_list = min(f1_list), max(f1_list)
-            min_f2_list, max_f2_list = min(f2_list), max(f2_list)
+            if min_2d_f1 == None or min_f1 < min_2d_f1:
+                min_2d_f1 = min_f1
 
-            if min_2d_f1 == None or min_f1_list < min_2d_f1:
-                min_2d_f1 = min_f1_list
+            if max_2d_f1 == None or max_f1 > max_2d_f1:
+                max_2d_f1 = max_f1
 
-            if max_2d_f1 == None or max_f1_list > max_2d_f1:
-                max_2d_f1 = max_f1_list
+            if min_2d_f2 == None or min_f2 < min_2d_f2:
+                min_2d_f2 = min_f2
 
-            if min_2d_f2 == None or min_f2_list < min_2d_f2:
-                min_2d_f2 = min_f2_list
-
-            if max_2d_f2 == None or max_f2_list > max_2d_f2:
-                max_2d_f2 = max_f2_list
+            if max_2d_f2 == None or max_f2 > max_2d_f2:
+                max_2d_f2 = max_f2
 
             # Updating F1/F2/F3 maximum/minimum info.
 
-            f1_list, f2_list, f3_list = zip(*filtered_3d_list)
-
-            min_f1_list, max_f1_list = min(f1_list), max(f1_list)
-            min_f2_list, max_f2_list = min(f2_list), max(f2_list)
-            min_f3_list, max_f3_list = min(f3_list), max(f3_list)
+            min_f1, min_f2, min_f3 = filtered_3d_array.min(axis = 0)
+            max_f1, max_f2, max_f3 = filtered_3d_array.max(axis = 0)
 
-            if min_3d_f1 == None or min_f1_list < min_3d_f1:
-                min_3d_f1 = min_f1_list
+            if min_3d_f1 == None or min_f1 < min_3d_f1:
+                min_3d_f1 = min_f1
 
-            if max_3d_f1 == None or max_f1_list > max_3d_f1:
-                max_3d_f1 = max_f1_list
+            if max_3d_f1 == None or max_f1 > max_3d_f1:
+                max_3d_f1 = max_f1
 
-            if min_3d_f2 == None or min_f2_list < min_3d_f2:
-                min_3d_f2 = min_f2_list
+            if min_3d_f2 == None or min_f2 < min_3d_f2:
+                min_3d_f2 = min_f2
 
-            if max_3d_f2 == None or max_f2_list > max_3d_f2:
-                max_3d_f2 = max_f2_list
+            if max_3d_f2 == None or max_f2 > max_3d_f2:
+                max_3d_f2 = max_f2
 
-            if min_3d_f3 == None or min_f3_list < min_3d_f3:
-                min_3d_f3 = min_f3_list
+            if min_3d_f3 == None or min_f3 < min_3d_f3:
+                min_3d_f3 = min_f3
 
-            if max_3d_f3 == None or max_f3_list > max_3d_f3:
-                max_3d_f3 = max_f3_list
+            if max_3d_f3 == None or max_f3 > max_3d_f3:
+                max_3d_f3 = max_f3
 
         # Compiling info of the formant scatter chart data series, unless we actually don't have any.
 
@@ -1524,18 +1840,15 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
             # F1/F2 points to vowels with the most number of F1/F2 points, otherwise scatter chart fails to
             # generate properly.
 
-            chart_data_2d_list.sort(reverse = True)
+            chart_data_2d_list.sort(key = lambda chart_data: chart_data[:3], reverse = True)
 
-            max_f_2d_list_length = max(len(f_2d_list)
-                for c, tc, v, f_2d_list, o_list, m, e_list in chart_data_2d_list)
+            max_f_2d_list_length = max(len(f_2d_array)
+                for c, tc, v, f_2d_array, o_array, m, e_array in chart_data_2d_list)
 
             heading_list = []
-            for c, tc, vowel, f_list, o_list, m, e_list in chart_data_2d_list:
+            for c, tc, vowel, f_array, o_array, m, e_array in chart_data_2d_list:
                 heading_list.extend(['{0} F1'.format(vowel), '{0} F2'.format(vowel)])
 
-            worksheet_table_2d.write_row('A1', heading_list)
-            worksheet_table_2d.write_row('A2', ['main part', ''] * len(chart_data_2d_list))
-
             # Removing outliers that outlie too much.
 
             f1_limit = max_2d_f1 + min_2d_f1 / 2
@@ -1544,48 +1857,47 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
             for i in range(len(chart_data_2d_list)):
                 chart_data_2d_list[i] = list(chart_data_2d_list[i])
 
-                chart_data_2d_list[i][4] = list(filter(
-                    lambda f_2d: f_2d[0] <= f1_limit and f_2d[1] <= f2_limit,
-                    chart_data_2d_list[i][4]))
+                outlier_array = chart_data_2d_list[i][4]
 
-            max_outlier_list_length = max(len(outlier_list)
-                for c, tc, v, f_list, outlier_list, m, e_list in chart_data_2d_list)
+                chart_data_2d_list[i][4] = outlier_array[
+                    (outlier_array[:, 0] <= f1_limit) & (outlier_array[:, 1] <= f2_limit)]
 
-            # Writing out chart data and compiling chart data series info.
+            max_outlier_list_length = max(len(outlier_array)
+                for c, tc, v, f_array, outlier_array, m, e_array in chart_data_2d_list)
 
-            for index, (count, total_count, vowel,
-                f_2d_list, outlier_list, mean, ellipse_list) in enumerate(chart_data_2d_list):
+            # Compiling chart data columns and chart data series info.
 
-                f1_list, f2_list = zip(*f_2d_list)
+            count_row_list = []
+            table_column_list = []
 
-                f1_outlier_list, f2_outlier_list = zip(*outlier_list)
-                x1_ellipse_list, x2_ellipse_list = zip(*ellipse_list)
+            for index, (count, total_count, vowel,
+                f_2d_array, outlier_array, mean, ellipse_array) in enumerate(chart_data_2d_list):
 
                 f1_column = column_list[index * 2]
                 f2_column = column_list[index * 2 + 1]
 
-                # Writing out formant data.
+                # Formant data.
 
-                worksheet_table_2d.write(f1_column + '3',
-                    '{0}/{1} ({2:.1f}%) points'.format(
-                        count, total_count, 100.0 * count / total_count))
+                count_row_list.extend([
+                    '{0}/{1} ({2:.1f}%) points'.format(count, total_count, 100.0 * count / total_count),
+                    ''])
 
-                worksheet_table_2d.write_column(f1_column + '4',
-                    list(f1_list) +
-                    [''] * (max_f_2d_list_length - len(f1_list)) +
+                table_column_list.append(
+                    f_2d_array[:, 0].tolist() +
+                    [''] * (max_f_2d_list_length - len(f_2d_array)) +
                     [vowel + ' outliers', '{0}/{1} ({2:.1f}%) points'.format(
-                        len(outlier_list), total_count, 100.0 * len(outlier_list) / total_count)] +
-                    list(f1_outlier_list) +
-                    [''] * (max_outlier_list_length - len(f1_outlier_list)) +
+                        len(outlier_array), total_count, 100.0 * len(outlier_array) / total_count)] +
+                    outlier_array[:, 0].tolist() +
+                    [''] * (max_outlier_list_length - len(outlier_array)) +
                     [vowel + ' mean', mean[0], vowel + ' stdev ellipse'] +
-                    list(x1_ellipse_list))
+                    ellipse_array[:, 0].tolist())
 
-                worksheet_table_2d.write_column(f2_column + '4',
-                    list(f2_list) +
-                    [''] * (max_f_2d_list_length - len(f2_list)) +
-                    ['', ''] + list(f2_outlier_list) +
-                    [''] * (max_outlier_list_length - len(f2_outlier_list)) +
-                    ['', mean[1], ''] + list(x2_ellipse_list))
+                table_column_list.append(
+                    f_2d_array[:, 1].tolist() +
+                    [''] * (max_f_2d_list_length - len(f_2d_array)) +
+                    ['', ''] + outlier_array[:, 1].tolist() +
+                    [''] * (max_outlier_list_length - len(outlier_array)) +
+                    ['', mean[1], ''] + ellipse_array[:, 1].tolist())
 
                 worksheet_table_2d.set_column(index * 2, index * 2 + 1, 11)
 
@@ -1597,9 +1909,9 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                 chart_dict_list.append({
                     'name': vowel,
                     'categories': '=\'F-table{0}\'!${1}$4:${1}${2}'.format(
-                        group_name_string, f2_column, len(f2_list) + 3),
+                        group_name_string, f2_column, len(f_2d_array) + 3),
                     'values': '=\'F-table{0}\'!${1}$4:${1}${2}'.format(
-                        group_name_string, f1_column, len(f1_list) + 3),
+                        group_name_string, f1_column, len(f_2d_array) + 3),
                     'marker': {
                         'type': 'circle',
                         'size': 5,
@@ -1612,10 +1924,10 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                     'name': vowel + ' outliers',
                     'categories': '=\'F-table{0}\'!${1}${2}:${1}${3}'.format(
                         group_name_string, f2_column,
-                        max_f_2d_list_length + 6, max_f_2d_list_length + len(f2_outlier_list) + 5),
+                        max_f_2d_list_length + 6, max_f_2d_list_length + len(outlier_array) + 5),
                     'values': '=\'F-table{0}\'!${1}${2}:${1}${3}'.format(
                         group_name_string, f1_column,
-                        max_f_2d_list_length + 6, max_f_2d_list_length + len(f1_outlier_list) + 5),
+                        max_f_2d_list_length + 6, max_f_2d_list_length + len(outlier_array) + 5),
                     'marker': {
                         'type': 'circle',
                         'size': 2,
@@ -1643,9 +1955,9 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                 chart_dict_list.append({
                     'name': vowel + ' stdev ellipse',
                     'categories': '=\'F-table{0}\'!${1}${2}:${1}${3}'.format(
-                        group_name_string, f2_column, shift + 9, shift + len(x2_ellipse_list) + 8),
+                        group_name_string, f2_column, shift + 9, shift + len(ellipse_array) + 8),
                     'values': '=\'F-table{0}\'!${1}${2}:${1}${3}'.format(
-                        group_name_string, f1_column, shift + 9, shift + len(x1_ellipse_list) + 8),
+                        group_name_string, f1_column, shift + 9, shift + len(ellipse_array) + 8),
                     'marker': {
                         'type': 'none',
                         'size': 1,
@@ -1654,6 +1966,14 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                     'line': {'color': color, 'width': 0.5},
                     'smooth': True})
 
+            # Writing out chart data row by row, as required in constant memory mode.
+
+            worksheet_table_2d.write_row('A1', heading_list)
+            worksheet_table_2d.write_row('A2', ['main part', ''] * len(chart_data_2d_list))
+            worksheet_table_2d.write_row('A3', count_row_list)
+
+            write_column_list(worksheet_table_2d, 3, table_column_list)
+
             # Generating formant chart, if we have any data.
 
             if chart_dict_list:
@@ -1688,20 +2008,17 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                 for c1 in string.ascii_uppercase
                 for c2 in string.ascii_uppercase]
 
-            chart_data_3d_list.sort(reverse = True)
+            chart_data_3d_list.sort(key = lambda chart_data: chart_data[:3], reverse = True)
 
-            max_f_3d_list_length = max(len(f_3d_list)
-                for c, tc, v, f_3d_list, o_list, m, s_3d, i_3d in chart_data_3d_list)
+            max_f_3d_list_length = max(len(f_3d_array)
+                for c, tc, v, f_3d_array, o_array, m, s_3d, i_3d in chart_data_3d_list)
 
             heading_list = []
-            for c, tc, vowel, f_list, o_list, m, s_3d, i_3d in chart_data_3d_list:
+            for c, tc, vowel, f_array, o_array, m, s_3d, i_3d in chart_data_3d_list:
 
                 heading_list.extend([
                     '{0} F1'.format(vowel), '{0} F2'.format(vowel), '{0} F3'.format(vowel)])
 
-            worksheet_table_3d.write_row('A1', heading_list)
-            worksheet_table_3d.write_row('A2', ['main part', '', ''] * len(chart_data_3d_list))
-
             # Removing outliers that outlie too much.
 
             f1_limit = max_3d_f1 + min_3d_f1 / 2
@@ -1711,56 +2028,56 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
             for i in range(len(chart_data_3d_list)):
                 chart_data_3d_list[i] = list(chart_data_3d_list[i])
 
-                chart_data_3d_list[i][4] = list(filter(
-                    lambda f_3d: f_3d[0] <= f1_limit and f_3d[1] <= f2_limit and f_3d[2] <= f3_limit,
-                    chart_data_3d_list[i][4]))
-
-            max_outlier_list_length = max(len(outlier_list)
-                for c, tc, v, f_list, outlier_list, m, s_3d, i_3d in chart_data_3d_list)
+                outlier_array = chart_data_3d_list[i][4]
 
-            # Writing out chart data.
+                chart_data_3d_list[i][4] = outlier_array[
+                    (outlier_array[:, 0] <= f1_limit) &
+                    (outlier_array[:, 1] <= f2_limit) &
+                    (outlier_array[:, 2] <= f3_limit)]
 
-            for index, (count, total_count, vowel, f_3d_list,
-                outlier_list, mean, sigma_3d, inverse_3d) in enumerate(chart_data_3d_list):
+            max_outlier_list_length = max(len(outlier_array)
+                for c, tc, v, f_array, outlier_array, m, s_3d, i_3d in chart_data_3d_list)
 
-                f1_list, f2_list, f3_list = zip(*f_3d_list)
-                f1_outlier_list, f2_outlier_list, f3_outlier_list = zip(*outlier_list)
+            # Compiling chart data columns.
 
-                f1_column = column_list[index * 3]
-                f2_column = column_list[index * 3 + 1]
-                f3_column = column_list[index * 3 + 2]
+            count_row_list = []
+            table_column_list = []
 
-                # Writing out formant data.
+            for index, (count, total_count, vowel, f_3d_array,
+                outlier_array, mean, sigma_3d, inverse_3d) in enumerate(chart_data_3d_list):
 
-                worksheet_table_3d.write(f1_column + '3',
-                    '{0}/{1} ({2:.1f}%) points'.format(
-                        count, total_count, 100.0 * count / total_count))
+                count_row_list.extend([
+                    '{0}/{1} ({2:.1f}%) points'.format(count, total_count, 100.0 * count / total_count),
+                    '', ''])
 
-                worksheet_table_3d.write_column(f1_column + '4',
-                    list(f1_list) +
-                    [''] * (max_f_3d_list_length - len(f1_list)) +
+                table_column_list.append(
+                    f_3d_array[:, 0].tolist() +
+                    [''] * (max_f_3d_list_length - len(f_3d_array)) +
                     [vowel + ' outliers', '{0}/{1} ({2:.1f}%) points'.format(
-                        len(outlier_list), total_count, 100.0 * len(outlier_list) / total_count)] +
-                    list(f1_outlier_list) +
-                    [''] * (max_outlier_list_length - len(f1_outlier_list)) +
+                        len(outlier_array), total_count, 100.0 * len(outlier_array) / total_count)] +
+                    outlier_array[:, 0].tolist() +
+                    [''] * (max_outlier_list_length - len(outlier_array)) +
                     [vowel + ' mean', mean[0]])
 
-                worksheet_table_3d.write_column(f2_column + '4',
-                    list(f2_list) +
-                    [''] * (max_f_3d_list_length - len(f2_list)) +
-                    ['', ''] + list(f2_outlier_list) +
-                    [''] * (max_outlier_list_length - len(f2_outlier_list)) +
-                    ['', mean[1]])
+                for i in (1, 2):
 
-                worksheet_table_3d.write_column(f3_column + '4',
-                    list(f3_list) +
-                    [''] * (max_f_3d_list_length - len(f3_list)) +
-                    ['', ''] + list(f3_outlier_list) +
-                    [''] * (max_outlier_list_length - len(f3_outlier_list)) +
-                    ['', mean[2]])
+                    table_column_list.append(
+                        f_3d_array[:, i].tolist() +
+                        [''] * (max_f_3d_list_length - len(f_3d_array)) +
+                        ['', ''] + outlier_array[:, i].tolist() +
+                        [''] * (max_outlier_list_length - len(outlier_array)) +
+                        ['', mean[i]])
 
                 worksheet_table_3d.set_column(index * 3, index * 3 + 2, 11)
 
+            # Writing out chart data row by row.
+
+            worksheet_table_3d.write_row('A1', heading_list)
+            worksheet_table_3d.write_row('A2', ['main part', '', ''] * len(chart_data_3d_list))
+            worksheet_table_3d.write_row('A3', count_row_list)
+
+            write_column_list(worksheet_table_3d, 3, table_column_list)
+
             # Creating 3d formant scatter charts, if we have any data.
 
             if chart_data_3d_list:
@@ -1788,19 +2105,15 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
 
                 # Graphing every vowel's data.
 
-                for index, ((c, tc, vowel, f_3d_list, outlier_list, mean_3d, s_3d, inverse_3d),
+                for index, ((c, tc, vowel, f_3d_array, outlier_array, mean_3d, s_3d, inverse_3d),
                     color) in enumerate(zip(chart_data_3d_list, itertools.cycle(color_list))):
 
                     axes.scatter(
-                        [f_3d[0] for f_3d in f_3d_list],
-                        [f_3d[1] for f_3d in f_3d_list],
-                        [f_3d[2] for f_3d in f_3d_list],
+                        f_3d_array[:, 0], f_3d_array[:, 1], f_3d_array[:, 2],
                         color = color, s = 4, depthshade = False, alpha = 0.5, zorder = 1000 + index)
 
-                    f1_outlier_list, f2_outlier_list, f3_outlier_list = zip(*outlier_list)
-
                     axes.scatter(
-                        f1_outlier_list, f2_outlier_list, f3_outlier_list,
+                        outlier_array[:, 0], outlier_array[:, 1], outlier_array[:, 2],
                         color = color, s = 1.44, depthshade = False, alpha = 0.5, zorder = index)
 
                     # Using 'plot' and not 'scatter' so that z-ordering would work correctly and mean
@@ -1881,7 +2194,7 @@ def compile_workbook(vowel_selection, result_list, result_group_set, workbook_st
                 z_min_current, z_max_current = axes.get_zlim3d()
                 z_level = z_min_current - (z_max - z_min_current) / 4
 
-                for index, ((c, tc, vowel, f_3d_list, outlier_list, mean_3d, sigma_3d, i_3d),
+                for index, ((c, tc, vowel, f_3d_array, o_array, mean_3d, sigma_3d, i_3d),
                     color) in enumerate(zip(chart_data_3d_list, itertools.cycle(color_list))):
 
                     axes.scatter(mean_3d[0], mean_3d[1], z_level,
@@ -2170,7 +2483,7 @@ def async_phonology(
                 dictionary_name, perspective_name,
                 group_by_description, vowel_selection, only_first_translation, maybe_tier_set,
                 limit, limit_exception, limit_no_vowel, limit_result,
-                task_status, storage)
+                task_status, storage, process_flag = True)
 
         # Some unknown external exception.
 
@@ -2188,67 +2501,438 @@ def async_phonology(
             return {'error': 'external error'}
 
 
-def perform_phonology(
-    perspective_cid, perspective_oid,
-    dictionary_name, perspective_name,
-    group_by_description, vowel_selection, only_first_translation, maybe_tier_set,
-    limit, limit_exception, limit_no_vowel, limit_result,
-    task_status, storage):
+#: Version of sound analysis parameters, algorithms and format of stored results, should be incremented when
+#: they change so that results stored in the phonology store would be recomputed.
+phonology_analysis_version = 2
+
+
+def phonology_store(storage):
     """
-    Performs phonology compilation.
+    Returns durable store of sound/markup analysis results shared by phonology computation and
+    sound/markup archive compilation.
+
+    Store entries are dictionaries keyed by content hashes of sound and markup files, with key 'swapped'
+    signifying that sound and markup files turned out to be swapped, and key 'result' holding either
+    'no_vowel' or analysis results as plain data without translations, see store_textgrid_result().
     """
 
-    log.debug('phonology {0}/{1}:'
-        '\n  dictionary_name: \'{2}\'\n  perspective_name: \'{3}\''
-        '\n  group_by_description: {4}\n  vowel_selection: {5}\n  only_first_translation: {6}'
-        '\n  maybe_tier_set: {7}'
-        '\n  limit: {8}\n  limit_exception: {9}\n  limit_no_vowel: {10}\n  limit_result: {11}'.format(
-        perspective_cid, perspective_oid,
-        dictionary_name, perspective_name,
-        group_by_description, vowel_selection, only_first_translation, maybe_tier_set,
-        limit, limit_exception, limit_no_vowel, limit_result))
+    return DiskCache(path.join(storage['path'], 'phonology_store'))
 
-    task_status.set(1, 0, 'Preparing')
 
-    # Setting up result filteting based on allowed tiers, if required.
+def phonology_store_key(sound_hash, markup_hash):
+    """
+    Gets phonology store key of a sound/markup pair from content hashes of sound and markup files.
+    """
 
-    if maybe_tier_set:
+    return 'phonology:{0}:{1}:{2}'.format(sound_hash, markup_hash, phonology_analysis_version)
 
-        def result_filter(textgrid_result_list):
 
-            return [(tier_number, tier_name, tier_data)
-                for tier_number, tier_name, tier_data in textgrid_result_list
-                    if tier_name in maybe_tier_set]
+def content_hash(content_bytes):
+    """
+    Computes content hash of a file in the same way as it is computed for the 'hash' metadata of entities.
+    """
 
-    else:
+    return sha224(content_bytes).hexdigest()
 
-        def result_filter(textgrid_result_list):
-            return textgrid_result_list
 
-    # Getting translation field data, for SQLAlchemy regular expression conditionals see
-    # https://stackoverflow.com/a/34989788/2016856.
+def entity_hash(entity):
+    """
+    Gets content hash of an entity's file from its metadata, if it is available.
+    """
 
-    field_data = DBSession.query(
-        DictionaryPerspectiveToField, Field, TranslationAtom).filter(
-            DictionaryPerspectiveToField.parent_client_id == perspective_cid,
-            DictionaryPerspectiveToField.parent_object_id == perspective_oid,
-            DictionaryPerspectiveToField.marked_for_deletion == False,
-            Field.client_id == DictionaryPerspectiveToField.field_client_id,
-            Field.object_id == DictionaryPerspectiveToField.field_object_id,
-            TranslationAtom.parent_client_id == Field.translation_gist_client_id,
-            TranslationAtom.parent_object_id == Field.translation_gist_object_id,
-            TranslationAtom.locale_id == 2,
-            TranslationAtom.content.op('~*')('.*translation.*')).first()
+    return (entity.additional_metadata or {}).get('hash')
 
-    if not field_data:
-        raise Exception('Missing translation field.')
 
-    field = field_data.Field
-    log.debug('field: {0}/{1}'.format(field.client_id, field.object_id))
+#: Version of markup index entries, should be changed if their format or TextGrid parsing changes.
+markup_index_version = 1
 
-    # Before everything else we should count how many sound/markup pairs we are to process.
 
-    Markup = aliased(Entity, name = 'Markup')
+def markup_index_key(markup_hash):
+    """
+    Gets phonology store key of a markup index entry from content hash of a markup file.
+    """
+
+    return 'markup_index:{0}:{1}'.format(markup_hash, markup_index_version)
+
+
+def parse_markup(markup_bytes):
+    """
+    Parses TextGrid markup, returns markup index entry with detected encoding and either list of tiers,
+    see textgrid_tier_list(), under key 'tier_list', or parsing error under key 'error'.
+    """
+
+    encoding = chardet.detect(markup_bytes)['encoding']
+
+    try:
+
+        textgrid = pympi.Praat.TextGrid(xmax = 0)
+        textgrid.from_file(io.BytesIO(markup_bytes), codec = encoding)
+
+    except Exception as exception:
+        return {'encoding': encoding, 'error': repr(exception)}
+
+    return {'encoding': encoding, 'tier_list': textgrid_tier_list(textgrid)}
+
+
+def markup_index(store, storage, markup_url, markup_hash = None):
+    """
+    Gets markup index entry of a TextGrid markup file from the phonology store, parsing markup and saving
+    its entry if it is not there yet.
+
+    If content hash of the file is not known, the file is read to compute it. Returns markup index entry
+    and content hash of the file.
+    """
+
+    if markup_hash:
+
+        entry = store.get(markup_index_key(markup_hash))
+
+        if entry is not None:
+            return entry, markup_hash
+
+    with storage_file(storage, markup_url) as markup_stream:
+        markup_bytes = markup_stream.read()
+
+    markup_hash = markup_hash or content_hash(markup_bytes)
+    store_key = markup_index_key(markup_hash)
+
+    entry = store.get(store_key)
+
+    if entry is None:
+
+        entry = parse_markup(markup_bytes)
+        store.set(store_key, entry)
+
+    return entry, markup_hash
+
+
+def markup_tier_list(store, storage, markup_url, sound_url, markup_hash = None, sound_hash = None):
+    """
+    Gets tier list of TextGrid markup of a sound/markup pair from the markup index, checking if sound and
+    markup files were accidentally swapped.
+
+    Returns tier list, swap flag, and content hashes of markup and sound files as they are referenced by
+    the entities, i.e. before any swapping; sound content hash is None if it is not known and was not
+    required.
+    """
+
+    entry, markup_hash = markup_index(store, storage, markup_url, markup_hash)
+
+    if 'tier_list' in entry:
+        return entry['tier_list'], False, markup_hash, sound_hash
+
+    # If we failed to parse TextGrid markup, we assume that sound and markup files were accidentally
+    # swapped and try again.
+
+    sound_entry, sound_hash = markup_index(store, storage, sound_url, sound_hash)
+
+    if 'tier_list' in sound_entry:
+        return sound_entry['tier_list'], True, markup_hash, sound_hash
+
+    raise ValueError('Failed to parse TextGrid markup: {0}'.format(entry['error']))
+
+
+def store_textgrid_result(textgrid_result_list):
+    """
+    Converts sound/markup analysis results to plain data kept in the phonology store, with each tier result
+    stored as a tuple of its values except translations, which depend on the lexical entry of a sound/markup
+    pair and not on contents of sound and markup files, see load_textgrid_result().
+    """
+
+    result_list = []
+
+    for tier_number, tier_name, tier_result_list in textgrid_result_list:
+
+        if isinstance(tier_result_list, list):
+
+            tier_result_list = [
+
+                (tier_result.transcription,
+                    float(tier_result.total_interval_length),
+                    float(tier_result.mean_interval_length),
+                    tier_result.max_length_str,
+                    float(tier_result.max_length_r_length),
+                    list(tier_result.max_length_f_list),
+                    tier_result.max_intensity_str,
+                    float(tier_result.max_intensity_r_length),
+                    list(tier_result.max_intensity_f_list),
+                    tier_result.coincidence_str,
+                    [(interval_str, float(r_length), list(f_list), is_max_length, is_max_intensity)
+                        for interval_str, r_length, f_list, is_max_length, is_max_intensity in
+                            tier_result.interval_data_list])
+
+                    for tier_result in tier_result_list]
+
+        result_list.append((tier_number, tier_name, tier_result_list))
+
+    return result_list
+
+
+def load_textgrid_result(result_list, translation_list):
+    """
+    Rebuilds sound/markup analysis results from plain data kept in the phonology store, see
+    store_textgrid_result(), with specified translations.
+    """
+
+    textgrid_result_list = []
+
+    for tier_number, tier_name, tier_result_list in result_list:
+
+        if isinstance(tier_result_list, list):
+
+            tier_result_list = [
+
+                Tier_Result(
+                    tier_data[0], tier_data[1], tier_data[2], translation_list, *tier_data[3:])
+
+                    for tier_data in tier_result_list]
+
+        textgrid_result_list.append((tier_number, tier_name, tier_result_list))
+
+    return textgrid_result_list
+
+
+#: Maximum number of sound/markup pairs analyzed concurrently during phonology compilation.
+phonology_worker_count = max(1, min(8, cpu_count() or 1))
+
+
+class Process_Executor(concurrent.futures.Executor):
+    """
+    Executor running functions in a pool of worker processes.
+
+    Uses billiard, the multiprocessing fork of celery, because, unlike multiprocessing pools, its pools can
+    be started from inside a daemonic process, e.g. a celery worker. Functions, their arguments and results
+    must be picklable.
+    """
+
+    def __init__(self, max_workers):
+        self.pool = billiard.Pool(max_workers)
+        self.future_list = []
+
+    def submit(self, fn, *args, **kwargs):
+
+        future = concurrent.futures.Future()
+        self.future_list.append(future)
+
+        def set_result(result):
+            if future.set_running_or_notify_cancel():
+                future.set_result(result)
+
+        # Billiard reports exceptions of worker processes wrapped in ExceptionInfo objects.
+
+        def set_exception(error):
+            if future.set_running_or_notify_cancel():
+                future.set_exception(getattr(error, 'exception', error))
+
+        self.pool.apply_async(fn, args, kwargs,
+            callback = set_result, error_callback = set_exception)
+
+        return future
+
+    def shutdown(self, wait = True):
+
+        # If some results won't be needed, we do not wait for the remaining work.
+
+        if not wait or any(future.cancelled() for future in self.future_list):
+            self.pool.terminate()
+
+        else:
+            self.pool.close()
+
+        self.pool.join()
+
+
+#: Size of chunks in which files are read and written during sound/markup archive compilation.
+archive_chunk_size = 65536
+
+#: If we can stream files into ZIP archives, ZipFile.open() supports writing since Python 3.6.
+archive_stream_flag = sys.version_info >= (3, 6)
+
+
+def analyze_sound_markup(
+    row_str, markup_url, sound_url, markup_hash, sound_hash, translation_list, storage):
+    """
+    Downloads and analyzes a single sound/markup pair, can be run in a separate thread or process.
+
+    Content hashes of markup and sound files, if not known from entity metadata, are computed from the
+    downloaded data, and the results are saved in the phonology store.
+
+    Returns either ('no_vowel', markup_url, sound_url), or ('result', markup_url, sound_url,
+    textgrid_result_list), or ('exception', markup_url, sound_url, exception, traceback_string); markup and
+    sound URLs are returned because they can turn out to be swapped.
+    """
+
+    try:
+        store = phonology_store(storage)
+
+        # Getting markup tiers from the markup index, checking for each tier if it needs to be processed.
+
+        tier_list, swapped, markup_file_hash, sound_file_hash = markup_tier_list(
+            store, storage, markup_url, sound_url, markup_hash, sound_hash)
+
+        if swapped:
+            markup_url, sound_url = sound_url, markup_url
+
+        # Some helper functionis.
+
+        def unusual_f(tier_number, tier_name, transcription, unusual_markup_dict):
+
+            log.debug(
+                '{0}: tier {1} \'{2}\' has interval(s) with unusual transcription text: '
+                '{3} / {4}'.format(
+                row_str, tier_number, tier_name, transcription, unusual_markup_dict))
+
+        def no_vowel_f(tier_number, tier_name, transcription_list):
+
+            log.debug(
+                '{0}: tier {1} \'{2}\' doesn\'t have any vowel markup: {3}'.format(
+                row_str, tier_number, tier_name, transcription_list))
+
+        def no_vowel_selected_f(tier_number, tier_name, transcription_list, selected_list):
+
+            log.debug(
+                '{0}: tier {1} \'{2}\' intervals to be processed don\'t have any vowel markup: '
+                'markup {3}, selected {4}'.format(
+                row_str, tier_number, tier_name, transcription_list, selected_list))
+
+        tier_data_list, vowel_flag = process_textgrid(
+            tier_list, unusual_f, no_vowel_f, no_vowel_selected_f)
+
+        # If there are no tiers with vowel markup, we skip this sound-markup pair altogether.
+
+        if not vowel_flag:
+
+            if sound_file_hash:
+
+                store.set(phonology_store_key(sound_file_hash, markup_file_hash),
+                    {'swapped': swapped, 'result': 'no_vowel'})
+
+            return ('no_vowel', markup_url, sound_url)
+
+        # Otherwise we retrieve the sound file, memory mapped from the local storage if possible, and
+        # analyze each vowel-containing markup.
+
+        with contextlib.ExitStack() as sound_stack:
+
+            sound_bytes = sound_stack.enter_context(storage_buffer(storage, sound_url))
+
+            # Checking if we already have analysis results for these sound and markup files, hashes are
+            # computed for files as they are referenced by the entities, i.e. before any swapping; if the
+            # files were swapped, both hashes are already known from the markup index.
+
+            store_key = phonology_store_key(
+                sound_file_hash or content_hash(sound_bytes), markup_file_hash)
+
+            if not (markup_hash and sound_hash):
+
+                store_entry = store.get(store_key)
+
+                if store_entry and isinstance(store_entry.get('result'), list):
+
+                    return ('result', markup_url, sound_url,
+                        load_textgrid_result(store_entry['result'], translation_list))
+
+            # Partially inspired by source code at scripts/convert_five_tiers.py:307, sound is decoded
+            # straight from the buffer, without a temporary file.
+
+            sound = AudioPraatLike(pydub.AudioSegment.from_wav(io.BytesIO(sound_bytes)))
+
+        textgrid_result_list = process_sound(tier_data_list, sound, translation_list)
+
+        store.set(store_key,
+            {'swapped': swapped, 'result': store_textgrid_result(textgrid_result_list)})
+
+        return ('result', markup_url, sound_url, textgrid_result_list)
+
+    except Exception as exception:
+
+        #
+        # NOTE
+        #
+        # Exceptional situations encountered so far:
+        #
+        #   1. TextGrid file actually contains sound, and wav file actually contains textgrid
+        #     markup.
+        #
+        #     Perspective 330/4, LexicalEntry 330/7, sound-Entity 330/2328, markup-Entity 330/6934
+        #
+        #   2. Markup for one of the intervals contains a newline "\n", and pympi fails to parse it.
+        #     Praat parses such files without problems.
+        #
+        #     Perspective 330/4, LexicalEntry 330/20, sound-Entity 330/6297, markup-Entity 330/6967
+        #
+
+        # Traceback is formatted here because it is not preserved when the exception is passed from a
+        # worker process.
+
+        traceback_string = ''.join(traceback.format_exception(
+            exception, exception, exception.__traceback__))[:-1]
+
+        return ('exception', markup_url, sound_url, exception, traceback_string)
+
+
+def perform_phonology(
+    perspective_cid, perspective_oid,
+    dictionary_name, perspective_name,
+    group_by_description, vowel_selection, only_first_translation, maybe_tier_set,
+    limit, limit_exception, limit_no_vowel, limit_result,
+    task_status, storage, process_flag = False):
+    """
+    Performs phonology compilation, analyzing sound/markup pairs in worker processes if 'process_flag' is
+    set, or in worker threads otherwise.
+    """
+
+    log.debug('phonology {0}/{1}:'
+        '\n  dictionary_name: \'{2}\'\n  perspective_name: \'{3}\''
+        '\n  group_by_description: {4}\n  vowel_selection: {5}\n  only_first_translation: {6}'
+        '\n  maybe_tier_set: {7}'
+        '\n  limit: {8}\n  limit_exception: {9}\n  limit_no_vowel: {10}\n  limit_result: {11}'.format(
+        perspective_cid, perspective_oid,
+        dictionary_name, perspective_name,
+        group_by_description, vowel_selection, only_first_translation, maybe_tier_set,
+        limit, limit_exception, limit_no_vowel, limit_result))
+
+    task_status.set(1, 0, 'Preparing')
+
+    # Setting up result filteting based on allowed tiers, if required.
+
+    if maybe_tier_set:
+
+        def result_filter(textgrid_result_list):
+
+            return [(tier_number, tier_name, tier_data)
+                for tier_number, tier_name, tier_data in textgrid_result_list
+                    if tier_name in maybe_tier_set]
+
+    else:
+
+        def result_filter(textgrid_result_list):
+            return textgrid_result_list
+
+    # Getting translation field data, for SQLAlchemy regular expression conditionals see
+    # https://stackoverflow.com/a/34989788/2016856.
+
+    field_data = DBSession.query(
+        DictionaryPerspectiveToField, Field, TranslationAtom).filter(
+            DictionaryPerspectiveToField.parent_client_id == perspective_cid,
+            DictionaryPerspectiveToField.parent_object_id == perspective_oid,
+            DictionaryPerspectiveToField.marked_for_deletion == False,
+            Field.client_id == DictionaryPerspectiveToField.field_client_id,
+            Field.object_id == DictionaryPerspectiveToField.field_object_id,
+            TranslationAtom.parent_client_id == Field.translation_gist_client_id,
+            TranslationAtom.parent_object_id == Field.translation_gist_object_id,
+            TranslationAtom.locale_id == 2,
+            TranslationAtom.content.op('~*')('.*translation.*')).first()
+
+    if not field_data:
+        raise Exception('Missing translation field.')
+
+    field = field_data.Field
+    log.debug('field: {0}/{1}'.format(field.client_id, field.object_id))
+
+    # Before everything else we should count how many sound/markup pairs we are to process.
+
+    Markup = aliased(Entity, name = 'Markup')
     Sound = aliased(Entity, name = 'Sound')
     Translation = aliased(Entity, name = 'Translation')
 
@@ -2297,283 +2981,281 @@ def perform_phonology(
     #
     # In batches because just in case, it seems that perspectives rarely have more then several hundred
     # such lexical entries, but we are being cautious.
+    #
+    # Sound/markup pairs without cached results are downloaded and analyzed concurrently by a bounded pool
+    # of workers, while results are processed strictly in query order, so that progress reporting and
+    # early stopping work as with sequential processing.
+    #
+    # Analysis is CPU-bound, so when we are running as a separate task, e.g. in a celery worker, workers
+    # are processes, see Process_Executor. Synchronous compilation runs inside a web server process, which
+    # is multithreaded and unsafe to fork, so then workers are threads.
 
     exception_counter = 0
     no_vowel_counter = 0
 
-    result_list = list()
+    # Analysis results are spooled to a temporary file, so that we wouldn't have to keep all of them in
+    # memory until workbook compilation.
+
+    result_list = Result_Spool()
     result_group_set = set()
 
-    for index, row in enumerate(data_query.yield_per(100)):
+    row_iterator = enumerate(data_query.yield_per(100))
+    pending_deque = collections.deque()
 
-        markup_url = row.Markup.content
-        sound_url = row.Sound.content
+    store = phonology_store(storage)
 
-        row_str = '{0} (LexicalEntry {1}/{2}, sound-Entity {3}/{4}, markup-Entity {5}/{6})'.format(
-            index,
-            row.LexicalEntry.client_id, row.LexicalEntry.object_id,
-            row.Sound.client_id, row.Sound.object_id,
-            row.Markup.client_id, row.Markup.object_id)
+    with (Process_Executor if process_flag else concurrent.futures.ThreadPoolExecutor)(
+        max_workers = phonology_worker_count) as executor:
 
-        cache_key = 'phonology:{0}:{1}:{2}:{3}'.format(
-            row.Sound.client_id, row.Sound.object_id,
-            row.Markup.client_id, row.Markup.object_id)
+        try:
+            while True:
 
-        # Processing grouping, if required.
+                # Submitting next sound/markup pairs for analysis, if we have free places in the queue.
 
-        group_list = [None]
+                while len(pending_deque) < 2 * phonology_worker_count:
 
-        if group_by_description and 'blob_description' in row.Markup.additional_metadata:
-            group_list.append(row.Markup.additional_metadata['blob_description'])
+                    index, row = next(row_iterator, (None, None))
 
-            log.debug(message('\n  blob description: {0}/{1}'.format(
-                row.Markup.additional_metadata['blob_description'],
-                row.Sound.additional_metadata['blob_description'])))
+                    if row is None or limit and index >= limit:
+                        break
 
-        # Checking if we have cached result for this pair of sound/markup.
-        #
-        # NOTE: We reference CACHE indirectly, as caching.CACHE, so that when we are inside a celery task
-        # and CACHE is re-initialized, we would get newly initialized CACHE, and not the value which was
-        # imported ealier.
+                    row_str = (
+                        '{0} (LexicalEntry {1}/{2}, sound-Entity {3}/{4}, markup-Entity {5}/{6})'.format(
+                        index,
+                        row.LexicalEntry.client_id, row.LexicalEntry.object_id,
+                        row.Sound.client_id, row.Sound.object_id,
+                        row.Markup.client_id, row.Markup.object_id))
 
-        cache_result = caching.CACHE.get(cache_key)
+                    cache_key = 'phonology:{0}:{1}:{2}:{3}'.format(
+                        row.Sound.client_id, row.Sound.object_id,
+                        row.Markup.client_id, row.Markup.object_id)
 
-        try:
-            if cache_result == 'no_vowel':
+                    # Processing grouping, if required.
 
-                log.debug('{0} [CACHE {1}]: no vowels\n{2}\n{3}'.format(
-                    row_str, cache_key, markup_url, sound_url))
+                    group_list = [None]
 
-                no_vowel_counter += 1
+                    if group_by_description and 'blob_description' in row.Markup.additional_metadata:
+                        group_list.append(row.Markup.additional_metadata['blob_description'])
 
-                task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                    'Analyzing sound and markup')
+                        log.debug(message('\n  blob description: {0}/{1}'.format(
+                            row.Markup.additional_metadata['blob_description'],
+                            row.Sound.additional_metadata['blob_description'])))
 
-                if (limit_no_vowel and no_vowel_counter >= limit_no_vowel or
-                    limit and index + 1 >= limit):
-                    break
+                    # Checking if we have cached result for this pair of sound/markup.
+                    #
+                    # NOTE: We reference CACHE indirectly, as caching.CACHE, so that when we are inside a
+                    # celery task and CACHE is re-initialized, we would get newly initialized CACHE, and not
+                    # the value which was imported ealier.
 
-                continue
+                    cache_result = caching.CACHE.get(cache_key)
 
-            # If we have cached exception, we do the same as with absence of vowels, show its info and
-            # continue.
+                    translation_list = row[3][:1] if only_first_translation else row[3]
 
-            elif isinstance(cache_result, tuple) and cache_result[0] == 'exception':
-                exception, traceback_string = cache_result[1:3]
+                    markup_hash = entity_hash(row.Markup)
+                    sound_hash = entity_hash(row.Sound)
 
-                log.debug(
-                    '{0} [CACHE {1}]: exception\n{2}\n{3}'.format(
-                    row_str, cache_key, markup_url, sound_url))
+                    # If we do not have a cached result, we try the phonology store, which persists across
+                    # cache flushes and is shared by identical sound/markup files of different entities.
 
-                log.debug(traceback_string)
+                    if cache_result is None and markup_hash and sound_hash:
 
-                exception_counter += 1
+                        store_entry = store.get(phonology_store_key(sound_hash, markup_hash))
+                        store_result = store_entry and store_entry.get('result')
 
-                task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                    'Analyzing sound and markup')
+                        if store_result:
 
-                if (limit_exception and exception_counter >= limit_exception or
-                    limit and index + 1 >= limit):
-                    break
+                            cache_result = (
+                                store_result if store_result == 'no_vowel' else
+                                load_textgrid_result(store_result, translation_list))
 
-                continue
+                            caching.CACHE.set(cache_key, cache_result)
 
-            # If we actually have the result, we use it and continue.
+                    if not (cache_result == 'no_vowel' or
+                        isinstance(cache_result, tuple) and cache_result[0] == 'exception' or
+                        cache_result):
 
-            elif cache_result:
+                        cache_result = executor.submit(
+                            analyze_sound_markup,
+                            row_str, row.Markup.content, row.Sound.content, markup_hash, sound_hash,
+                            translation_list, storage)
 
-                textgrid_result_list = cache_result
-                filtered_result_list = result_filter(textgrid_result_list)
+                    pending_deque.append((index, row_str, cache_key, group_list,
+                        row.Markup.content, row.Sound.content, cache_result))
 
-                log.debug(
-                    '{0} [CACHE {1}]:\n{2}\n{3}\n{4}'.format(
-                    row_str, cache_key, markup_url, sound_url,
-                    format_textgrid_result(group_list, textgrid_result_list)))
+                if not pending_deque:
+                    break
 
-                if maybe_tier_set:
+                # Processing the earliest sound/markup pair.
 
-                    log.debug('filtered result:\n{0}'.format(
-                        format_textgrid_result(group_list, filtered_result_list)))
+                (index, row_str, cache_key, group_list,
+                    markup_url, sound_url, cache_result) = pending_deque.popleft()
 
-                # Acquiring another result, updating progress status, stopping earlier, if required.
+                if not isinstance(cache_result, concurrent.futures.Future):
 
-                result_list.append((group_list, filtered_result_list))
-                result_group_set.update(group_list)
+                    try:
+                        if cache_result == 'no_vowel':
 
-                task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                    'Analyzing sound and markup')
+                            log.debug('{0} [CACHE {1}]: no vowels\n{2}\n{3}'.format(
+                                row_str, cache_key, markup_url, sound_url))
 
-                if (limit_result and len(result_list) >= limit_result or
-                    limit and index + 1 >= limit):
-                    break
+                            no_vowel_counter += 1
 
-                continue
+                            task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
+                                'Analyzing sound and markup')
 
-        # If we have an exception while processing cache results, we stop and terminate with error.
+                            if (limit_no_vowel and no_vowel_counter >= limit_no_vowel or
+                                limit and index + 1 >= limit):
+                                break
 
-        except:
-            task_status.set(4, 100,
-                'Finished (ERROR), cache processing error')
+                            continue
 
-            return {
-                'error': 'cache processing error',
-                'exception_counter': exception_counter,
-                'no_vowel_counter': no_vowel_counter,
-                'result_counter': len(result_list)}
+                        # If we have cached exception, we do the same as with absence of vowels, show its info
+                        # and continue.
 
-        try:
-            # Getting markup, checking for each tier if it needs to be processed.
+                        elif isinstance(cache_result, tuple) and cache_result[0] == 'exception':
+                            exception, traceback_string = cache_result[1:3]
 
-            with urllib.request.urlopen(urllib.parse.quote(markup_url, safe = '/:')) as markup_stream:
-                markup_bytes = markup_stream.read()
+                            log.debug(
+                                '{0} [CACHE {1}]: exception\n{2}\n{3}'.format(
+                                row_str, cache_key, markup_url, sound_url))
 
-            try:
-                textgrid = pympi.Praat.TextGrid(xmax = 0)
+                            log.debug(traceback_string)
 
-                textgrid.from_file(
-                    io.BytesIO(markup_bytes),
-                    codec = chardet.detect(markup_bytes)['encoding'])
+                            exception_counter += 1
 
-            except:
-                # If we failed to parse TextGrid markup, we assume that sound and markup files were
-                # accidentally swapped and try again.
+                            task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
+                                'Analyzing sound and markup')
 
-                markup_url, sound_url = sound_url, markup_url
+                            if (limit_exception and exception_counter >= limit_exception or
+                                limit and index + 1 >= limit):
+                                break
 
-                with urllib.request.urlopen(urllib.parse.quote(markup_url, safe = '/:')) as markup_stream:
-                    markup_bytes = markup_stream.read()
+                            continue
 
-                textgrid = pympi.Praat.TextGrid(xmax = 0)
+                        # If we actually have the result, we use it and continue.
 
-                textgrid.from_file(
-                    io.BytesIO(markup_bytes),
-                    codec = chardet.detect(markup_bytes)['encoding'])
+                        textgrid_result_list = cache_result
+                        filtered_result_list = result_filter(textgrid_result_list)
 
-            # Some helper functionis.
+                        log.debug(
+                            '{0} [CACHE {1}]:\n{2}\n{3}\n{4}'.format(
+                            row_str, cache_key, markup_url, sound_url,
+                            format_textgrid_result(group_list, textgrid_result_list)))
 
-            def unusual_f(tier_number, tier_name, transcription, unusual_markup_dict):
+                        if maybe_tier_set:
 
-                log.debug(
-                    '{0}: tier {1} \'{2}\' has interval(s) with unusual transcription text: '
-                    '{3} / {4}'.format(
-                    row_str, tier_number, tier_name, transcription, unusual_markup_dict))
+                            log.debug('filtered result:\n{0}'.format(
+                                format_textgrid_result(group_list, filtered_result_list)))
 
-            def no_vowel_f(tier_number, tier_name, transcription_list):
+                        # Acquiring another result, updating progress status, stopping earlier, if required.
 
-                log.debug(
-                    '{0}: tier {1} \'{2}\' doesn\'t have any vowel markup: {3}'.format(
-                    row_str, tier_number, tier_name, transcription_list))
+                        result_list.append((group_list, filtered_result_list))
+                        result_group_set.update(group_list)
 
-            def no_vowel_selected_f(tier_number, tier_name, transcription_list, selected_list):
+                        task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
+                            'Analyzing sound and markup')
 
-                log.debug(
-                    '{0}: tier {1} \'{2}\' intervals to be processed don\'t have any vowel markup: '
-                    'markup {3}, selected {4}'.format(
-                    row_str, tier_number, tier_name, transcription_list, selected_list))
+                        if (limit_result and len(result_list) >= limit_result or
+                            limit and index + 1 >= limit):
+                            break
 
-            tier_data_list, vowel_flag = process_textgrid(
-                textgrid, unusual_f, no_vowel_f, no_vowel_selected_f)
+                        continue
 
-            # If there are no tiers with vowel markup, we skip this sound-markup pair altogether.
+                    # If we have an exception while processing cache results, we stop and terminate with
+                    # error.
 
-            if not vowel_flag:
+                    except:
+                        task_status.set(4, 100,
+                            'Finished (ERROR), cache processing error')
 
-                caching.CACHE.set(cache_key, 'no_vowel')
-                no_vowel_counter += 1
+                        return {
+                            'error': 'cache processing error',
+                            'exception_counter': exception_counter,
+                            'no_vowel_counter': no_vowel_counter,
+                            'result_counter': len(result_list)}
 
-                task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                    'Analyzing sound and markup')
+                # Getting analysis results of a sound/markup pair without cached results.
 
-                if (limit_no_vowel and no_vowel_counter >= limit_no_vowel or
-                    limit and index + 1 >= limit):
-                    break
+                outcome = cache_result.result()
+                markup_url, sound_url = outcome[1:3]
 
-                continue
+                # If there are no tiers with vowel markup, we skip this sound-markup pair altogether.
 
-            # Otherwise we retrieve the sound file and analyze each vowel-containing markup.
-            # Partially inspired by source code at scripts/convert_five_tiers.py:307.
+                if outcome[0] == 'no_vowel':
 
-            sound = None
-            with tempfile.NamedTemporaryFile() as temp_file:
+                    caching.CACHE.set(cache_key, 'no_vowel')
+                    no_vowel_counter += 1
 
-                with urllib.request.urlopen(urllib.parse.quote(sound_url, safe = '/:')) as sound_stream:
-                    temp_file.write(sound_stream.read())
-                    temp_file.flush()
+                    task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
+                        'Analyzing sound and markup')
 
-                sound = AudioPraatLike(pydub.AudioSegment.from_wav(temp_file.name))
+                    if (limit_no_vowel and no_vowel_counter >= limit_no_vowel or
+                        limit and index + 1 >= limit):
+                        break
 
-            textgrid_result_list = process_sound(tier_data_list, sound,
-                row[3][:1] if only_first_translation else row[3])
+                # Saving analysis results.
 
-            # Saving analysis results.
+                elif outcome[0] == 'result':
 
-            filtered_result_list = result_filter(textgrid_result_list)
+                    textgrid_result_list = outcome[3]
+                    filtered_result_list = result_filter(textgrid_result_list)
 
-            result_list.append((group_list, filtered_result_list))
-            result_group_set.update(group_list)
+                    result_list.append((group_list, filtered_result_list))
+                    result_group_set.update(group_list)
 
-            caching.CACHE.set(cache_key, textgrid_result_list)
+                    caching.CACHE.set(cache_key, textgrid_result_list)
 
-            # Showing results for this sound/markup pair, stopping earlier, if required.
+                    # Showing results for this sound/markup pair, stopping earlier, if required.
 
-            log.debug(
-                '{0}:\n{1}\n{2}\n{3}'.format(
-                row_str, markup_url, sound_url,
-                format_textgrid_result(group_list, textgrid_result_list)))
+                    log.debug(
+                        '{0}:\n{1}\n{2}\n{3}'.format(
+                        row_str, markup_url, sound_url,
+                        format_textgrid_result(group_list, textgrid_result_list)))
 
-            if maybe_tier_set:
+                    if maybe_tier_set:
 
-                log.debug('filtered result:\n{0}'.format(
-                    format_textgrid_result(group_list, filtered_result_list)))
+                        log.debug('filtered result:\n{0}'.format(
+                            format_textgrid_result(group_list, filtered_result_list)))
 
-            task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                'Analyzing sound and markup')
+                    task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
+                        'Analyzing sound and markup')
 
-            if (limit_result and len(result_list) >= limit_result or
-                limit and index + 1 >= limit):
-                break
+                    if (limit_result and len(result_list) >= limit_result or
+                        limit and index + 1 >= limit):
+                        break
 
-        except Exception as exception:
+                # If we encountered an exception, we show its info and remember not to try offending
+                # sound/markup pair again.
 
-            #
-            # NOTE
-            #
-            # Exceptional situations encountered so far:
-            #
-            #   1. TextGrid file actually contains sound, and wav file actually contains textgrid
-            #     markup.
-            #
-            #     Perspective 330/4, LexicalEntry 330/7, sound-Entity 330/2328, markup-Entity 330/6934
-            #
-            #   2. Markup for one of the intervals contains a newline "\n", and pympi fails to parse it.
-            #     Praat parses such files without problems.
-            #
-            #     Perspective 330/4, LexicalEntry 330/20, sound-Entity 330/6297, markup-Entity 330/6967
-            #
+                else:
 
-            log.debug(
-                '{0}: exception\n{1}\n{2}'.format(
-                row_str, markup_url, sound_url))
+                    exception, traceback_string = outcome[3:5]
 
-            # if we encountered an exception, we show its info and remember not to try offending
-            # sound/markup pair again.
+                    log.debug(
+                        '{0}: exception\n{1}\n{2}'.format(
+                        row_str, markup_url, sound_url))
 
-            traceback_string = ''.join(traceback.format_exception(
-                exception, exception, exception.__traceback__))[:-1]
+                    log.debug(traceback_string)
 
-            log.debug(traceback_string)
+                    caching.CACHE.set(cache_key, ('exception', exception,
+                        traceback_string.replace('Traceback', 'CACHEd traceback')))
 
-            caching.CACHE.set(cache_key, ('exception', exception,
-                traceback_string.replace('Traceback', 'CACHEd traceback')))
+                    exception_counter += 1
 
-            exception_counter += 1
+                    task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
+                        'Analyzing sound and markup')
 
-            task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                'Analyzing sound and markup')
+                    if (limit_exception and exception_counter >= limit_exception or
+                        limit and index + 1 >= limit):
+                        break
 
-            if (limit_exception and exception_counter >= limit_exception or
-                limit and index + 1 >= limit):
-                break
+        # If we are stopping early, we do not wait for analysis of sound/markup pairs we won't need.
+
+        finally:
+
+            for item in pending_deque:
+                if isinstance(item[-1], concurrent.futures.Future):
+                    item[-1].cancel()
 
     log.debug('phonology {0}/{1}: {2} result{3}, {4} no vowels, {5} exceptions'.format(
         perspective_cid, perspective_oid,
@@ -2596,13 +3278,31 @@ def perform_phonology(
     # Otherwise we create an Excel file with results.
 
     task_status.set(3, 99, 'Compiling results')
-    workbook_stream = io.BytesIO()
+
+    # Name(s) of the resulting file(s) includes dictionary name, perspective name and current date.
+
+    current_datetime = datetime.datetime.now(datetime.timezone.utc)
+
+    result_filename = '{0} - {1} - {2:04d}.{3:02d}.{4:02d}'.format(
+        dictionary_name[:64], perspective_name[:64],
+        current_datetime.year,
+        current_datetime.month,
+        current_datetime.day)
+
+    table_filename = sanitize_filename(result_filename + '.xlsx')
+
+    cur_time = time()
+    storage_dir = path.join(storage["path"], "phonology", str(cur_time))
+    makedirs(storage_dir, exist_ok = True)
+
+    # Workbook is compiled directly into a temporary file in the storage directory, with worksheet data
+    # streamed to disk instead of being accumulated in memory.
+
+    workbook_path = path.join(storage_dir, 'workbook.xlsx.tmp')
 
     try:
         entry_count_dict, sound_count_dict, chart_stream_list = compile_workbook(
-            vowel_selection, result_list, result_group_set, workbook_stream)
-
-        workbook_stream.seek(0)
+            vowel_selection, result_list, result_group_set, workbook_path)
 
     except Exception as exception:
 
@@ -2612,6 +3312,9 @@ def perform_phonology(
         log.debug('compile_workbook: exception')
         log.debug(traceback_string)
 
+        if path.exists(workbook_path):
+            remove(workbook_path)
+
         # If we failed to create an Excel file, we terminate with error.
 
         task_status.set(4, 100,
@@ -2623,41 +3326,16 @@ def perform_phonology(
             'no_vowel_counter': no_vowel_counter,
             'result_counter': len(result_list)}
 
-    # Name(s) of the resulting file(s) includes dictionary name, perspective name and current date.
-
-    current_datetime = datetime.datetime.now(datetime.timezone.utc)
-
-    result_filename = '{0} - {1} - {2:04d}.{3:02d}.{4:02d}'.format(
-        dictionary_name[:64], perspective_name[:64],
-        current_datetime.year,
-        current_datetime.month,
-        current_datetime.day)
-
-    table_filename = sanitize_filename(result_filename + '.xlsx')
-
-    cur_time = time()
-    storage_dir = path.join(storage["path"], "phonology", str(cur_time))
-    makedirs(storage_dir, exist_ok = True)
+    finally:
+        result_list.close()
 
-    # Storing file with the results.
+    # Storing file with the results, if the name of the result file is too long, we try again with a
+    # shorter name.
 
     storage_path = path.join(storage_dir, table_filename)
-    directory = path.dirname(storage_path)
 
     try:
-        makedirs(directory)
-
-    except OSError as exception:
-        if exception.errno != EEXIST:
-            raise
-
-    workbook_stream.seek(0)
-
-    # If the name of the result file is too long, we try again with a shorter name.
-
-    try:
-        with open(storage_path, 'wb+') as workbook_file:
-            copyfileobj(workbook_stream, workbook_file)
+        rename(workbook_path, storage_path)
 
     except OSError as os_error:
 
@@ -2673,8 +3351,7 @@ def perform_phonology(
         table_filename = sanitize_filename(result_filename + '.xlsx')
         storage_path = path.join(storage_dir, table_filename)
 
-        with open(storage_path, 'wb+') as workbook_file:
-            copyfileobj(workbook_stream, workbook_file)
+        rename(workbook_path, storage_path)
 
     # Storing 3d F1/F2/F3 scatter charts, if we have any.
 
@@ -2721,6 +3398,9 @@ def phonology_tier_list(request):
         log.debug('phonology_tier_list {0}/{1}'.format(
             perspective_cid, perspective_oid))
 
+        storage = request.registry.settings['storage']
+        store = phonology_store(storage)
+
         # We are going to look through all perspective's accessible markup/sound pairs.
 
         Markup = aliased(Entity, name = 'Markup')
@@ -2782,36 +3462,16 @@ def phonology_tier_list(request):
                 log.debug('{0} [CACHE {1}]: {2}'.format(row_str, cache_key, list(sorted(cache_result))))
                 continue
 
-            # Trying to download and parse markup and get its tiers.
+            # Trying to get markup tiers from the markup index, parsing markup only if it is not indexed
+            # yet.
 
             try:
-                with urllib.request.urlopen(urllib.parse.quote(markup_url, safe = '/:')) as markup_stream:
-                    markup_bytes = markup_stream.read()
-
-                try:
-                    textgrid = pympi.Praat.TextGrid(xmax = 0)
-
-                    textgrid.from_file(
-                        io.BytesIO(markup_bytes),
-                        codec = chardet.detect(markup_bytes)['encoding'])
-
-                except:
-                    # If we failed to parse TextGrid markup, we assume that sound and markup files were
-                    # accidentally swapped and try again.
-
-                    markup_url = row.Sound.content
-
-                    with urllib.request.urlopen(urllib.parse.quote(markup_url, safe = '/:')) as markup_stream:
-                        markup_bytes = markup_stream.read()
-
-                    textgrid = pympi.Praat.TextGrid(xmax = 0)
-
-                    textgrid.from_file(
-                        io.BytesIO(markup_bytes),
-                        codec = chardet.detect(markup_bytes)['encoding'])
+                tier_list, swapped, markup_hash, sound_hash = markup_tier_list(
+                    store, storage, markup_url, row.Sound.content,
+                    entity_hash(row.Markup), entity_hash(row.Sound))
 
                 markup_tier_set = set(tier_name
-                    for tier_number, tier_name in textgrid.get_tier_name_num())
+                    for tier_number, tier_name, interval_list in tier_list)
 
                 caching.CACHE.set(cache_key, markup_tier_set)
 
@@ -3146,6 +3806,8 @@ def perform_sound_and_markup(
 
     archive_path = path.join(storage_dir, archive_name)
 
+    store = phonology_store(storage)
+
     def entity_filename_date(entity, translation):
         """
         Produces archive filename and archive timestamp for a sound or markup file from its entity.
@@ -3163,309 +3825,320 @@ def perform_sound_and_markup(
         date = datetime.datetime.utcfromtimestamp(entity.created_at)
         return name, (date.year, date.month, date.day, date.hour, date.minute, date.second)
 
-    def get_sound_markup_bytes(sound_url, markup_url):
+    def file_hash(url):
         """
-        Tries to get sound and markup file data, checks if sound and markup files were swapped.
+        Computes content hash of a file, reading it in chunks.
         """
 
-        with storage_file(storage, sound_url) as sound_stream:
-            sound_bytes = sound_stream.read()
+        hasher = sha224()
 
-        with storage_file(storage, markup_url) as markup_stream:
-            markup_bytes = markup_stream.read()
+        with storage_file(storage, url) as stream:
+            for chunk in iter(lambda: stream.read(archive_chunk_size), b''):
+                hasher.update(chunk)
 
-        # Checking if we have a valid TextGrid markup.
+        return hasher.hexdigest()
 
-        try:
-
-            textgrid = pympi.Praat.TextGrid(xmax = 0)
-
-            textgrid.from_file(
-                io.BytesIO(markup_bytes),
-                codec = chardet.detect(markup_bytes)['encoding'])
-
-            return sound_bytes, markup_bytes
-
-        except:
-
-            # If we failed to parse TextGrid markup, we assume that sound and markup files were
-            # accidentally swapped and try again.
-
-            textgrid = pympi.Praat.TextGrid(xmax = 0)
-
-            textgrid.from_file(
-                io.BytesIO(sound_bytes),
-                codec = chardet.detect(sound_bytes)['encoding'])
-
-            return markup_bytes, sound_bytes
-
-    if not path.exists(archive_path):
+    def check_swapped(sound_url, markup_url, sound_hash, markup_hash):
+        """
+        Checks if sound and markup files were swapped, using the markup index if we don't already know it
+        from the phonology store.
+        """
 
-        # Ok, we are to simply generate new archive.
+        store_key = phonology_store_key(sound_hash, markup_hash)
+        store_entry = store.get(store_key) or {}
 
-        total_count = data_query.count()
-        task_status.set(2, 1, 'Processing sound and markup files')
+        if 'swapped' in store_entry:
+            return store_entry['swapped']
 
-        sound_name_set = set()
+        # Checking if we have a valid TextGrid markup through the markup index.
 
-        with zipfile.ZipFile(archive_path, 'w') as archive_file:
-            for index, row in enumerate(data_query.yield_per(100)):
+        store_entry['swapped'] = markup_tier_list(
+            store, storage, markup_url, sound_url, markup_hash, sound_hash)[1]
 
-                sound_url = row.Sound.content
-                markup_url = row.Markup.content
-                translation = row[3][0] if field and len(row[3]) > 0 else None
+        store.set(store_key, store_entry)
+        return store_entry['swapped']
 
-                row_str = '{0} (LexicalEntry {1}/{2}, sound-Entity {3}/{4}, markup-Entity {5}/{6})'.format(
-                    index,
-                    row.LexicalEntry.client_id, row.LexicalEntry.object_id,
-                    row.Sound.client_id, row.Sound.object_id,
-                    row.Markup.client_id, row.Markup.object_id)
+    def resolve_pair(pair_info):
+        """
+        Gets content hashes of sound and markup files of a pair and checks if they were swapped, reusing
+        manifest info if sound and markup files of the pair didn't change.
+        """
 
-                log.debug('{0}: \'{1}\'\n{2}\n{3}'.format(
-                    row_str, translation, sound_url, markup_url))
+        pair_key = pair_info['key']
+        manifest_pair = manifest_pair_dict.get(pair_key)
 
-                # Getting sound and markup data.
+        if (manifest_pair is not None and
+            manifest_pair['sound_url'] == pair_info['sound_url'] and
+            manifest_pair['markup_url'] == pair_info['markup_url'] and
+            pair_info['sound_hash'] in (None, manifest_pair['sound_hash']) and
+            pair_info['markup_hash'] in (None, manifest_pair['markup_hash'])):
 
-                try:
-                    sound_bytes, markup_bytes = get_sound_markup_bytes(sound_url, markup_url)
+            return manifest_pair
 
-                # If we failed to get sound/markup data, we report why and go on to the next
-                # sound/markup pair.
+        sound_hash = pair_info['sound_hash'] or file_hash(pair_info['sound_url'])
+        markup_hash = pair_info['markup_hash'] or file_hash(pair_info['markup_url'])
 
-                except Exception as exception:
+        return {
+            'sound_url': pair_info['sound_url'],
+            'markup_url': pair_info['markup_url'],
+            'sound_hash': sound_hash,
+            'markup_hash': markup_hash,
+            'swapped': check_swapped(
+                pair_info['sound_url'], pair_info['markup_url'], sound_hash, markup_hash)}
+
+    def write_member(archive_file, name, member):
+        """
+        Writes a file into the archive, compressing sound files only if they are WAV files.
 
-                    log.debug(
-                        '{0}: exception\n{1}\n{2}'.format(
-                        row_str, markup_url, sound_url))
+        The file is streamed in chunks if ZipFile.open() supports writing, and is read into memory
+        otherwise.
+        """
 
-                    traceback_string = ''.join(traceback.format_exception(
-                        exception, exception, exception.__traceback__))[:-1]
+        zip_info = zipfile.ZipInfo(name, tuple(member['date']))
+        zip_info.compress_type = zipfile.ZIP_DEFLATED
 
-                    log.debug(traceback_string)
+        with storage_file(storage, member['url']) as stream:
 
-                    task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                        'Archiving sound and markup')
+            header = b''
 
-                    continue
+            if member['sound']:
 
-                # Archiving sound data, unless we already processed this sound entity, which can happen if
-                # it has multiple markup entities.
+                header = stream.read(archive_chunk_size)
 
-                sound_name, sound_date = entity_filename_date(row.Sound, translation)
+                if not sndhdr.test_wav(header, io.BytesIO(header)):
+                    zip_info.compress_type = zipfile.ZIP_STORED
 
-                if sound_name not in sound_name_set:
-                    sound_name_set.add(sound_name)
+            if not archive_stream_flag:
 
-                    zip_info = zipfile.ZipInfo(sound_name, sound_date)
-                    if sndhdr.test_wav(sound_bytes, io.BytesIO(sound_bytes)):
-                        zip_info.compress_type = zipfile.ZIP_DEFLATED
+                archive_file.writestr(zip_info, header + stream.read())
+                return
 
-                    archive_file.writestr(zip_info, sound_bytes)
+            with archive_file.open(zip_info, 'w') as member_stream:
 
-                # Archiving markup data.
+                member_stream.write(header)
+                copyfileobj(stream, member_stream, archive_chunk_size)
 
-                markup_name, markup_date = entity_filename_date(row.Markup, translation)
+    def copy_member(source_file, archive_file, zip_info):
+        """
+        Copies an unchanged file from the previous version of the archive, in chunks if ZipFile.open()
+        supports writing.
+        """
 
-                markup_name = '{0}_{1}_{2}'.format(
-                    row.Sound.client_id, row.Sound.object_id, markup_name)
+        copy_info = zipfile.ZipInfo(zip_info.filename, zip_info.date_time)
+        copy_info.compress_type = zip_info.compress_type
 
-                archive_file.writestr(zipfile.ZipInfo(markup_name, markup_date), markup_bytes,
-                    zipfile.ZIP_DEFLATED)
+        if not archive_stream_flag:
 
-                # Another sound/markup pair is processed successfully.
+            archive_file.writestr(copy_info, source_file.read(zip_info))
+            return
 
-                task_status.set(2, 1 + int(math.floor((index + 1) * 99 / total_count)),
-                    'Archiving sound and markup')
+        with source_file.open(zip_info) as source_stream, \
+            archive_file.open(copy_info, 'w') as member_stream:
 
-    else:
-        # Updating existing archive, we start with gathering info of sound and markup files which should end
-        # up in the archive.
+            copyfileobj(source_stream, member_stream, archive_chunk_size)
 
-        update_list = []
-        update_set = set()
+    # Loading archive manifest, which records source entities, content hashes and swap status of archived
+    # sound and markup files. Without the manifest we can't trust the contents of the archive, so we
+    # compile it anew.
 
-        for index, row in enumerate(data_query.yield_per(100)):
+    manifest_path = archive_path + '.manifest.json'
 
-            translation = row[3][0] if field and len(row[3]) > 0 else None
+    manifest = {'pairs': {}, 'members': {}}
+    already_set = set()
 
-            sound_name, sound_date = entity_filename_date(row.Sound, translation)
-            markup_name, markup_date = entity_filename_date(row.Markup, translation)
+    if path.exists(archive_path) and path.exists(manifest_path):
 
-            markup_name = '{0}_{1}_{2}'.format(
-                row.Sound.client_id, row.Sound.object_id, markup_name)
+        try:
 
-            # Saving sound/markup data for later use.
+            with open(manifest_path, 'r', encoding = 'utf-8') as manifest_file:
+                manifest = json.load(manifest_file)
 
-            update_list.append((index,
-                row.LexicalEntry.client_id, row.LexicalEntry.object_id,
-                row.Sound.client_id, row.Sound.object_id,
-                row.Markup.client_id, row.Markup.object_id,
-                row.Sound.content, row.Markup.content, translation,
-                sound_name, sound_date, markup_name, markup_date))
+            with zipfile.ZipFile(archive_path, 'r') as archive_file:
+                already_set = set(archive_file.namelist())
 
-            update_set.add(sound_name)
-            update_set.add(markup_name)
+        except:
 
-        # Checking what files are already in the archive, which archive entries should be deleted and which
-        # files should be added to the archive.
+            log.debug('sound_and_markup {0}/{1}: failed to load archive manifest, recompiling'.format(
+                perspective_cid, perspective_oid))
 
-        with zipfile.ZipFile(archive_path, 'r') as archive_file:
-            zip_info_list = archive_file.infolist()
+            manifest = {'pairs': {}, 'members': {}}
+            already_set = set()
 
-        already_set = set(zip_info.filename
-            for zip_info in zip_info_list)
+    manifest_pair_dict = manifest['pairs']
 
-        delete_set = already_set - update_set
-        add_set = update_set - already_set
+    # Gathering info of sound and markup files which should end up in the archive.
 
-        # If none of the files in the archive should be deleted and we have some new files, we just add them
-        # to the archive.
+    total_count = data_query.count()
+    task_status.set(2, 1, 'Processing sound and markup files')
 
-        if len(delete_set) <= 0 and len(add_set) > 0:
-            with zipfile.ZipFile(archive_path, 'a') as archive_file:
+    pair_list = []
 
-                sound_name_set = set()
-                add_count = 0
+    for index, row in enumerate(data_query.yield_per(100)):
 
-                for (index,
-                    lexicalentry_cid, lexicalentry_oid,
-                    sound_cid, sound_oid,
-                    markup_cid, markup_oid,
-                    sound_url, markup_url, translation,
-                    sound_name, sound_date, markup_name, markup_date) in update_list:
+        translation = row[3][0] if field and len(row[3]) > 0 else None
 
-                    # Skipping all already present sound/markup pairs.
+        sound_name, sound_date = entity_filename_date(row.Sound, translation)
+        markup_name, markup_date = entity_filename_date(row.Markup, translation)
 
-                    if sound_name not in add_set and markup_name not in add_set:
-                        continue
+        markup_name = '{0}_{1}_{2}'.format(
+            row.Sound.client_id, row.Sound.object_id, markup_name)
 
-                    row_str = ('{0} (LexicalEntry {1}/{2}, '
-                        'sound-Entity {3}/{4}, markup-Entity {5}/{6})'.format(index,
-                        lexicalentry_cid, lexicalentry_oid, sound_cid, sound_oid, markup_cid, markup_oid))
+        pair_list.append({
+            'key': '{0}/{1}:{2}/{3}'.format(
+                row.Sound.client_id, row.Sound.object_id,
+                row.Markup.client_id, row.Markup.object_id),
+            'row_str': '{0} (LexicalEntry {1}/{2}, sound-Entity {3}/{4}, markup-Entity {5}/{6})'.format(
+                index,
+                row.LexicalEntry.client_id, row.LexicalEntry.object_id,
+                row.Sound.client_id, row.Sound.object_id,
+                row.Markup.client_id, row.Markup.object_id),
+            'translation': translation,
+            'sound_id': [row.Sound.client_id, row.Sound.object_id],
+            'markup_id': [row.Markup.client_id, row.Markup.object_id],
+            'sound_url': row.Sound.content,
+            'markup_url': row.Markup.content,
+            'sound_hash': entity_hash(row.Sound),
+            'markup_hash': entity_hash(row.Markup),
+            'sound_name': sound_name,
+            'sound_date': sound_date,
+            'markup_name': markup_name,
+            'markup_date': markup_date})
+
+    # Getting content hashes and swap status of sound/markup pairs, reading files, if required, in
+    # parallel, and compiling the list of archive files.
+
+    pair_dict = {}
+    member_dict = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers = phonology_worker_count) as executor:
+
+        for index, (pair_info, future) in enumerate(zip(
+            pair_list, [executor.submit(resolve_pair, pair_info) for pair_info in pair_list])):
+
+            log.debug('{0}: \'{1}\'\n{2}\n{3}'.format(
+                pair_info['row_str'], pair_info['translation'],
+                pair_info['sound_url'], pair_info['markup_url']))
 
-                    log.debug('{0}: \'{1}\'\n{2}\n{3}'.format(
-                        row_str, translation, sound_url, markup_url))
+            try:
+                pair = future.result()
 
-                    # Getting sound and markup data.
+            # If we failed to get sound/markup data, we report why and go on to the next sound/markup pair.
 
-                    try:
-                        sound_bytes, markup_bytes = get_sound_markup_bytes(sound_url, markup_url)
+            except Exception as exception:
 
-                    # If we failed to get sound/markup data, we report why and go on to the next
-                    # sound/markup pair.
+                log.debug(
+                    '{0}: exception\n{1}\n{2}'.format(
+                    pair_info['row_str'], pair_info['markup_url'], pair_info['sound_url']))
 
-                    except Exception as exception:
+                traceback_string = ''.join(traceback.format_exception(
+                    exception, exception, exception.__traceback__))[:-1]
 
-                        log.debug(
-                            '{0}: exception\n{1}\n{2}'.format(
-                            row_str, markup_url, sound_url))
+                log.debug(traceback_string)
 
-                        traceback_string = ''.join(traceback.format_exception(
-                            exception, exception, exception.__traceback__))[:-1]
+                continue
 
-                        log.debug(traceback_string)
+            finally:
 
-                        task_status.set(2, 1 + int(math.floor((index + 1) * 99 / len(update_list))),
-                            'Archiving sound and markup')
+                task_status.set(2, 1 + int(math.floor((index + 1) * 49 / total_count)),
+                    'Processing sound and markup files')
 
-                        continue
+            pair_dict[pair_info['key']] = pair
 
-                    # Archiving sound data, unless we already have it in the archive or we already processed
-                    # this sound entity, which can happen if it has multiple markup entities.
+            # Sound file is archived only once, even if it has multiple markup entities.
 
-                    if sound_name in add_set and sound_name not in sound_name_set:
-                        sound_name_set.add(sound_name)
+            swapped = pair['swapped']
 
-                        zip_info = zipfile.ZipInfo(sound_name, sound_date)
-                        if sndhdr.test_wav(sound_bytes, io.BytesIO(sound_bytes)):
-                            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            member_dict.setdefault(pair_info['sound_name'], {
+                'entity_id': pair_info['sound_id'],
+                'url': pair['markup_url' if swapped else 'sound_url'],
+                'hash': pair['markup_hash' if swapped else 'sound_hash'],
+                'date': pair_info['sound_date'],
+                'sound': True})
 
-                        archive_file.writestr(zip_info, sound_bytes)
+            member_dict[pair_info['markup_name']] = {
+                'entity_id': pair_info['markup_id'],
+                'url': pair['sound_url' if swapped else 'markup_url'],
+                'hash': pair['sound_hash' if swapped else 'markup_hash'],
+                'date': pair_info['markup_date'],
+                'sound': False}
 
-                    # Archiving markup data if we don't have it in the archive already.
+    # Checking which archive files are unchanged, which should be replaced or deleted and which should
+    # be added.
 
-                    if markup_name in add_set:
+    manifest_member_dict = manifest['members']
 
-                        archive_file.writestr(zipfile.ZipInfo(markup_name, markup_date), markup_bytes,
-                            zipfile.ZIP_DEFLATED)
+    keep_set = set(
+        name for name, member in member_dict.items()
+        if name in already_set and
+            manifest_member_dict.get(name, {}).get('hash') == member['hash'])
 
-                    # Another sound/markup pair is processed successfully.
+    add_list = sorted(set(member_dict) - keep_set)
+    rebuild_flag = bool(already_set - keep_set)
 
-                    task_status.set(2, 1 + int(math.floor((index + 1) * 99 / len(update_list))),
-                        'Archiving sound and markup')
+    def write_member_list(archive_file):
+        """
+        Writes all new and changed files into the archive.
+        """
 
-        # If we have to delete some files from the archive, we just overwrite it completely.
+        for index, name in enumerate(add_list):
 
-        elif len(delete_set) > 0:
-            with zipfile.ZipFile(archive_path, 'w') as archive_file:
+            member = member_dict[name]
 
-                sound_name_set = set()
+            try:
+                write_member(archive_file, name, member)
 
-                for (index,
-                    lexicalentry_cid, lexicalentry_oid,
-                    sound_cid, sound_oid,
-                    markup_cid, markup_oid,
-                    sound_url, markup_url, translation,
-                    sound_name, sound_date, markup_name, markup_date) in update_list:
+            except Exception as exception:
 
-                    row_str = ('{0} (LexicalEntry {1}/{2}, '
-                        'sound-Entity {3}/{4}, markup-Entity {5}/{6})'.format(index,
-                        lexicalentry_cid, lexicalentry_oid, sound_cid, sound_oid, markup_cid, markup_oid))
+                log.debug('{0}: exception\n{1}'.format(name, member['url']))
 
-                    log.debug('{0}: \'{1}\'\n{2}\n{3}'.format(
-                        row_str, translation, sound_url, markup_url))
+                traceback_string = ''.join(traceback.format_exception(
+                    exception, exception, exception.__traceback__))[:-1]
 
-                    # Getting sound and markup data.
+                log.debug(traceback_string)
 
-                    try:
-                        sound_bytes, markup_bytes = get_sound_markup_bytes(sound_url, markup_url)
+                del member_dict[name]
 
-                    # If we failed to get sound/markup data, we report why and go on to the next
-                    # sound/markup pair.
+            task_status.set(2, 50 + int(math.floor((index + 1) * 49 / len(add_list))),
+                'Archiving sound and markup')
 
-                    except Exception as exception:
+    # If we have to replace or delete some files, or don't have a trusted previous version of the archive,
+    # we compile new version of the archive copying unchanged files from the previous one, and then
+    # substitute it for the previous one.
 
-                        log.debug(
-                            '{0}: exception\n{1}\n{2}'.format(
-                            row_str, markup_url, sound_url))
+    if rebuild_flag or not already_set:
 
-                        traceback_string = ''.join(traceback.format_exception(
-                            exception, exception, exception.__traceback__))[:-1]
+        temporary_path = archive_path + '.tmp'
 
-                        log.debug(traceback_string)
+        with zipfile.ZipFile(temporary_path, 'w') as archive_file:
 
-                        task_status.set(2, 1 + int(math.floor((index + 1) * 99 / len(update_list))),
-                            'Archiving sound and markup')
+            if keep_set:
+                with zipfile.ZipFile(archive_path, 'r') as source_file:
 
-                        continue
+                    for zip_info in source_file.infolist():
+                        if zip_info.filename in keep_set:
+                            copy_member(source_file, archive_file, zip_info)
 
-                    # Archiving sound data, unless we already processed this sound entity, which can happen
-                    # if it has multiple markup entities.
+            write_member_list(archive_file)
 
-                    if sound_name not in sound_name_set:
-                        sound_name_set.add(sound_name)
+        rename(temporary_path, archive_path)
 
-                        zip_info = zipfile.ZipInfo(sound_name, sound_date)
-                        if sndhdr.test_wav(sound_bytes, io.BytesIO(sound_bytes)):
-                            zip_info.compress_type = zipfile.ZIP_DEFLATED
+    # If we only have some new files, we just add them to the archive.
 
-                        archive_file.writestr(zip_info, sound_bytes)
+    elif add_list:
 
-                    # Archiving markup data.
+        with zipfile.ZipFile(archive_path, 'a') as archive_file:
+            write_member_list(archive_file)
 
-                    archive_file.writestr(zipfile.ZipInfo(markup_name, markup_date), markup_bytes,
-                        zipfile.ZIP_DEFLATED)
+    # Saving updated manifest.
 
-                    # Another sound/markup pair is processed successfully.
+    manifest = {'pairs': pair_dict, 'members': member_dict}
 
-                    task_status.set(2, 1 + int(math.floor((index + 1) * 99 / len(update_list))),
-                        'Archiving sound and markup')
+    with open(manifest_path + '.tmp', 'w', encoding = 'utf-8') as manifest_file:
+        json.dump(manifest, manifest_file)
 
-        # We don't have to delete any files, and we don't have to add any files, we leave the archive
-        # unchanged and indicate that it is fully ready.
+    rename(manifest_path + '.tmp', manifest_path)
 
-        else:
-            task_status.set(2, 100, 'Archiving sound and markup')
+    task_status.set(2, 100, 'Archiving sound and markup')
 
     # Successfully compiled sound/markup archive, finishing and returning link to the archive.
 
@@ -3646,7 +4319,7 @@ def test_profile():
                     tier_number, tier_name, transcription_list, selected_list))
 
             tier_data_list, vowel_flag = process_textgrid(
-                textgrid, unusual_f, no_vowel_f, no_vowel_selected_f)
+                textgrid_tier_list(textgrid), unusual_f, no_vowel_f, no_vowel_selected_f)
 
             # If there are no tiers with vowel markup, we skip this sound-markup pair altogether.
 
@@ -8,14 +8,15 @@ from lingvodoc.models import (
     User,
     Entity,
     TranslationAtom,
+    TranslationGist,
     Field,
     PublishingEntity,
-    Dictionary,
-    DictionaryPerspectiveToField
+    Dictionary
 )
 
 from pyramid.httpexceptions import (
     HTTPBadRequest,
+    HTTPNotFound,
     HTTPOk
 )
 from pyramid.view import view_config
@@ -29,6 +30,13 @@ from sqlalchemy import (
 from sqlalchemy.orm import joinedload, subqueryload
 from pyramid.request import Request
 
+from lingvodoc.schema.gql_holders import ResponseError
+from lingvodoc.utils.search import (
+    rank_lexical_entries,
+    ranked_lexical_entries,
+    search_filter
+)
+
 
 @view_config(route_name='basic_search', renderer='json', request_method='GET')
 def basic_search(request):
@@ -39,11 +47,15 @@ def basic_search(request):
     field_client_id = request.params.get('field_client_id')
     field_object_id = request.params.get('field_object_id')
     search_in_published = request.params.get('published') or None
+    first = request.params.get('first')
+    after_client_id = request.params.get('after_client_id')
+    after_object_id = request.params.get('after_object_id')
     if searchstring:
         if len(searchstring) >= 1:
-            field = None
+            field_id = None
             if field_client_id and field_object_id:
-                field = DBSession.query(Field).filter_by(client_id=field_client_id, object_id=field_object_id).first()
+                field_id = (int(field_client_id), int(field_object_id))
+            search_condition = search_filter(searchstring, field_id)
 
             searchstring = request.params.get('searchstring')
             group = DBSession.query(Group).filter(Group.subject_override == True).join(BaseGroup)\
@@ -55,7 +67,7 @@ def basic_search(request):
             #     group = 1
             published_cursor = None
             if group: # todo: change!!!!!
-                results_cursor = DBSession.query(Entity).filter(Entity.content.like('%'+searchstring+'%'), Entity.marked_for_deletion == False)
+                results_cursor = DBSession.query(Entity).filter(search_condition, Entity.marked_for_deletion == False)
                 # results_cursor = list()
                 if perspective_client_id and perspective_object_id:
                     results_cursor = results_cursor.join(LexicalEntry)\
@@ -72,20 +84,8 @@ def basic_search(request):
                 # results_cursor = list()
                 ignore_groups = False
 
-                subreq = Request.blank('/translation_service_search')
-                subreq.method = 'POST'
-                subreq.headers = request.headers
-                subreq.json = {'searchstring': 'Published'}
-                headers = dict()
-                if request.headers.get('Cookie'):
-                    headers = {'Cookie': request.headers['Cookie']}
-                subreq.headers = headers
-                resp = request.invoke_subrequest(subreq)
-
-                if 'error' not in resp.json:
-                    state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json['client_id']
-                else:
-                    raise KeyError("Something wrong with the base", resp.json['error'])
+                state_translation_gist_client_id, state_translation_gist_object_id = \
+                    TranslationGist.get_service_gist_id('Published')
 
                 if perspective_client_id and perspective_object_id:
                     results_cursor = results_cursor.filter(DictionaryPerspective.client_id == perspective_client_id,
@@ -101,9 +101,9 @@ def basic_search(request):
                         .join(BaseGroup)\
                         .join(User, Group.users)\
                         .join(Client)\
-                        .filter(Client.id == request.authenticated_userid, Entity.content.like('%'+searchstring+'%'), Entity.marked_for_deletion == False)
+                        .filter(Client.id == request.authenticated_userid, search_condition, Entity.marked_for_deletion == False)
                 else:
-                    results_cursor = results_cursor.filter(Entity.content.like('%'+searchstring+'%'), Entity.marked_for_deletion == False)
+                    results_cursor = results_cursor.filter(search_condition, Entity.marked_for_deletion == False)
                 if published_cursor:
 
                     published_cursor = published_cursor \
@@ -112,7 +112,7 @@ def basic_search(request):
                         Dictionary.state_translation_gist_client_id == state_translation_gist_client_id,
                         DictionaryPerspective.state_translation_gist_object_id == state_translation_gist_object_id,
                         DictionaryPerspective.state_translation_gist_client_id == state_translation_gist_client_id,
-                     Entity.content.like('%'+searchstring+'%'))
+                     search_condition)
             results = []
             entries = list()
             if can_add_tags:
@@ -133,26 +133,20 @@ def basic_search(request):
                 results_cursor = results_cursor.filter(BaseGroup.subject=='lexical_entries_and_entities', BaseGroup.action=='view')
 
             # print(results_cursor)
-            if field:
-                results_cursor = results_cursor.join(DictionaryPerspective.dictionaryperspectivetofield).filter(
-                    DictionaryPerspectiveToField.field == field)
-                if published_cursor:
-                    published_cursor = published_cursor.join(DictionaryPerspective.dictionaryperspectivetofield).filter(
-                        DictionaryPerspectiveToField.field == field)
-            for item in results_cursor:
-                if item.parent not in entries:
-                    entries.append(item.parent)
+            entity_query_list = [results_cursor]
             if published_cursor:
-                for item in published_cursor:
-                    if item.parent not in entries:
-                        entries.append(item.parent)
+                entity_query_list.append(published_cursor)
+            after = None
+            if after_client_id and after_object_id:
+                after = (int(after_client_id), int(after_object_id))
+            try:
+                entries = ranked_lexical_entries(searchstring, entity_query_list,
+                                                 after=after, first=int(first) if first else None)
+            except ResponseError as error:
+                request.response.status = HTTPNotFound.code
+                return {'error': error.message}
             for entry in entries:
                 if not entry.marked_for_deletion:
-                    # print(entry.__class__)
-                    if (entry.parent_client_id, entry.parent_object_id) in DictionaryPerspective.get_deleted():
-                        continue
-                    if (entry.parent_client_id, entry.parent_object_id) in DictionaryPerspective.get_hidden():
-                        continue
                     # if (entry.parent_client_id, entry.parent_object_id) in DictionaryPerspective.get_etymology():
                     #     continue
                     url = request.route_url('perspective',
@@ -187,32 +181,12 @@ def advanced_search(request):
     if perspectives:
         perspectives = [(o['client_id'], o['object_id']) for o in perspectives]
     else:
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'Published'}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                'client_id']
-            published_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': 'Limited access'}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-        if 'error' not in resp.json:
-            state_translation_gist_object_id, state_translation_gist_client_id = resp.json['object_id'], resp.json[
-                'client_id']
-            limited_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
-        else:
-            raise KeyError("Something wrong with the base", resp.json['error'])
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('Published')
+        published_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
+        state_translation_gist_client_id, state_translation_gist_object_id = \
+            TranslationGist.get_service_gist_id('Limited access')
+        limited_gist = (state_translation_gist_client_id, state_translation_gist_object_id)
 
         perspectives = [(o.client_id, o.object_id) for o in DBSession.query(DictionaryPerspective).filter(
             DictionaryPerspective.marked_for_deletion == False,
@@ -239,11 +213,11 @@ def advanced_search(request):
         if not searchstring['searchstring']:
             raise HTTPBadRequest
         search_parts = searchstring['searchstring'].split()
-        search_expression = Entity.content.like('%' + search_parts[0] + '%')
+        search_expression = search_filter(search_parts[0])
         to_do_or = searchstring.get('search_by_or', True)
 
         for part in search_parts[1:]:
-            search_expression = or_(search_expression, Entity.content.like('%' + part + '%'))
+            search_expression = or_(search_expression, search_filter(part))
         if 'entity_type' in searchstring and searchstring['entity_type']:
             search_expression = and_(search_expression, TranslationAtom.content == searchstring['entity_type'],
                                      TranslationAtom.locale_id==2)
@@ -311,12 +285,20 @@ def advanced_search(request):
     # #     .filter(tuple_(LexicalEntry.client_id, LexicalEntry.object_id).in_(results))
     results = list()
 
+    try:
+        ranked_entries = rank_lexical_entries(
+            pre_results, ' '.join(o['searchstring'] for o in searchstrings),
+            after=req.get('after'), first=req.get('first'))
+    except ResponseError as error:
+        request.response.status = HTTPNotFound.code
+        return {'error': error.message}
+
     lexes_composite_list = [(lex.created_at,
                              lex.client_id, lex.object_id, lex.parent_client_id, lex.parent_object_id,
                              lex.marked_for_deletion, lex.additional_metadata,
                              lex.additional_metadata.get('came_from')
                              if lex.additional_metadata and 'came_from' in lex.additional_metadata else None)
-                            for lex in pre_results]
+                            for lex in ranked_entries]
 
     results = LexicalEntry.track_multiple(lexes_composite_list, int(request.cookies.get('locale_id') or 2), publish=True, accept=True)
 
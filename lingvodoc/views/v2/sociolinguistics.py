@@ -1,5 +1,10 @@
+import os
+import uuid
+
+import transaction
 import xlrd
 
+import lingvodoc.cache.caching as caching
 from lingvodoc.models import (
     DBSession,
     UserBlobs,
@@ -54,49 +59,125 @@ def check_socio(path):
     return True
 
 
-def sociolinguistics():
-    socioblobs = DBSession.query(UserBlobs).filter(UserBlobs.data_type == 'sociolinguistics').all()
-
-    # TODO: need to acknowledge how to make joins like this (the following is *wrong*) :
-    # DBSession.query(UserBlobs, DictionaryPerspective
-    #   ).filter(UserBlobs.data_type == 'sociolinguistics'
-    #   ).join(DictionaryPerspective, DictionaryPerspective.additional_metadata.contains(
-    #    {"info":
-    #       {"content":
-    #           [{"info": {"content": {'object_id': UserBlobs.object_id, 'client_id': UserBlobs.client_id}}}]
-    #       }
-    #    }
-    #   )
-    #   ).all()
+# Parsed survey files are kept by blob id and file modification time, in the process and in the cache,
+# and the list of survey blobs is versioned in the same way as the registry of service translation gists,
+# so that surveys are loaded and parsed again only after sociolinguistics blobs are added or removed.
+
+socio_version_key = 'sociolinguistics_version'
+socio_blob_state = (None, None)
+parsed_socio_dict = {}
+
+
+def get_socio_version():
+    cache = caching.CACHE
+    version = cache.get(socio_version_key) if cache else None
+    if version is None:
+        version = socio_blob_state[0] or str(uuid.uuid4())
+        if cache:
+            cache.set(socio_version_key, version)
+    return version
+
+
+def invalidate_sociolinguistics():
+    """
+    Invalidates list of sociolinguistics blobs, immediately and after the current transaction is committed.
+    """
+    def bump_version(*args):
+        global socio_blob_state
+        socio_blob_state = (None, None)
+        if caching.CACHE:
+            caching.CACHE.set(socio_version_key, str(uuid.uuid4()))
+    bump_version()
+    transaction.get().addAfterCommitHook(bump_version)
+
+
+def socio_blobs():
+    """
+    Gets (client_id, object_id, real_storage_path) of sociolinguistics blobs.
+    """
+    global socio_blob_state
+    version = get_socio_version()
+    # Version and blobs are replaced together, so that concurrent requests never see a partial update.
+    blob_version, blob_list = socio_blob_state
+    if blob_version != version:
+        blob_list = DBSession.query(
+            UserBlobs.client_id, UserBlobs.object_id, UserBlobs.real_storage_path).filter(
+            UserBlobs.data_type == 'sociolinguistics').all()
+        socio_blob_state = (version, blob_list)
+    return blob_list
+
+
+def socio_key(client_id, object_id, path):
+    return 'sociolinguistics:%s:%s:%s' % (client_id, object_id, os.path.getmtime(path))
+
+
+def parsed_socio(key, path):
+    """
+    Gets parsed survey of a sociolinguistics blob by its socio_key, see parse_socio, parsing its file only
+    if it was not parsed since its last modification.
+    """
+    parsed = parsed_socio_dict.get(key)
+    if parsed is None:
+        parsed = caching.CACHE.get(key) if caching.CACHE else None
+        if parsed is None:
+            parsed = parse_socio(path)
+            if caching.CACHE:
+                caching.CACHE.set(key, parsed)
+        parsed_socio_dict[key] = parsed
+    return parsed
+
+
+def dependant_perspectives(blob_id_set):
+    """
+    Gets lists of ids of perspectives referring to blobs in their 'info' metadata by blob ids, with a
+    single query.
+    """
+    perspective_dict = dict()
+    for client_id, object_id, info in DBSession.query(
+            DictionaryPerspective.client_id,
+            DictionaryPerspective.object_id,
+            DictionaryPerspective.additional_metadata['info']).filter(
+            DictionaryPerspective.additional_metadata.has_key('info')):
+        content = info.get('content') if isinstance(info, dict) else None
+        if not isinstance(content, list):
+            continue
+        for item in content:
+            blob_id = item.get('info', {}).get('content') if isinstance(item, dict) else None
+            if not isinstance(blob_id, dict):
+                continue
+            blob_id = (blob_id.get('client_id'), blob_id.get('object_id'))
+            if blob_id in blob_id_set:
+                perspective_dict.setdefault(blob_id, []).append({"client_id": client_id, "object_id": object_id})
+    return perspective_dict
+
 
+def sociolinguistics():
     lst = []
     all_questions = set()
     all_answers = set()
-    for i in socioblobs:
+    blob_list = []
+    current_keys = set()
+    for client_id, object_id, path in socio_blobs():
         try:
-            socio, questions, answers = parse_socio(i.real_storage_path)
+            key = socio_key(client_id, object_id, path)
+            socio, questions, answers = parsed_socio(key, path)
+            current_keys.add(key)
             all_questions.update(questions)
             all_answers.update(answers)
-            dependant_perspectives = DBSession.query(DictionaryPerspective
-                            ).filter(DictionaryPerspective.additional_metadata.contains(
-                                         {"info":
-                                              {"content":
-                                                   [{"info":
-                                                         {"content":
-                                                              {'object_id': i.object_id, 'client_id': i.client_id}
-                                                          }
-                                                     }
-                                                    ]
-                                               }
-                                          }
-                                     )
-                                     ).all()
-            for j in dependant_perspectives:
-                socio['perspectives'].append({"client_id": j.client_id, "object_id": j.object_id})
-            lst.append(socio)
+            blob_list.append(((client_id, object_id), socio))
         except Exception as e:
             log.error(e)
             continue
+
+    # Surveys of removed blobs and old versions of files are not needed anymore.
+    for key in set(parsed_socio_dict) - current_keys:
+        parsed_socio_dict.pop(key, None)
+
+    perspective_dict = dependant_perspectives(set(blob_id for blob_id, socio in blob_list))
+    for blob_id, socio in blob_list:
+        socio = dict(socio)
+        socio['perspectives'] = perspective_dict.get(blob_id, [])
+        lst.append(socio)
     return lst, all_questions, all_answers
 
 
@@ -47,8 +47,12 @@ from pyramid.view import view_config
 
 from sqlalchemy import (
     and_,
+    cast,
+    func,
+    literal_column,
     or_,
-    tuple_
+    tuple_,
+    UnicodeText
 )
 
 import datetime
@@ -56,11 +60,11 @@ import logging
 import json
 import base64
 import os
-from lingvodoc.models import categories
+from lingvodoc.models import categories, invalidate_etymology_groups, invalidate_statistics_rollup
 from lingvodoc.views.v2.utils import add_user_to_group
 import datetime
 import requests
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert
 from lingvodoc.views.v2.delete import (
 real_delete_dictionary,
 real_delete_translation_gist,
@@ -244,6 +248,8 @@ def basic_sync(request):
                 for key, value in list(return_date_time(curr_server[client_id][object_id]).items()):
                     setattr(entry, key, value)
     DBSession.bulk_save_objects(new_entries)
+    invalidate_etymology_groups(DBSession, new_entries)
+    invalidate_statistics_rollup(DBSession, new_entries)
     #todo: delete everything marked_for_deletion? but then next time it will download them again and again and again
     #todo: make request to server with existing objecttocs. server will return objecttocs for deletion
     # client = DBSession.query(Client).filter_by(id=authenticated_userid(request)).first()
@@ -325,21 +331,64 @@ def all_toc(request):
 #     return tmp_resp
 
 
+# ObjectTOC is compared between desktop and server by hashed summaries of ranges of object ids of each
+# client, so that only entries of differing ranges have to be exchanged.
+TOC_RANGE_SIZE = 4096
+TOC_CHUNK_SIZE = 10000
+
+toc_range = (ObjectTOC.object_id / TOC_RANGE_SIZE).label('toc_range')
+
+
+def toc_summaries(query):
+    """
+    Gets [client_id, range, count, hash] summaries of ObjectTOC id ranges selected by a query.
+    """
+    summary_query = query.with_entities(
+        ObjectTOC.client_id,
+        toc_range,
+        func.count(),
+        func.md5(func.string_agg(
+            cast(ObjectTOC.object_id, UnicodeText),
+            aggregate_order_by(literal_column("','"), ObjectTOC.object_id)))) \
+        .group_by(ObjectTOC.client_id, toc_range)
+    return [list(summary) for summary in summary_query]
+
+
+def toc_ids_query(entry_list, *conditions):
+    """
+    Yields ObjectTOC entries with ids of given entries satisfying given conditions, querying by chunks.
+    """
+    for i in range(0, len(entry_list), TOC_CHUNK_SIZE):
+        id_list = [(entry['client_id'], entry['object_id']) for entry in entry_list[i:i + TOC_CHUNK_SIZE]]
+        for entry in DBSession.query(ObjectTOC).filter(
+                tuple_(ObjectTOC.client_id, ObjectTOC.object_id).in_(id_list), *conditions):
+            yield entry
+
+
+@view_config(route_name='diff_summary_server', renderer='json', request_method='POST')
+def diff_summary_server(request):
+    """
+    Compares summaries of desktop ObjectTOC ranges with summaries of the same ranges of not deleted server
+    entries, returning [client_id, range] of ranges which differ, i.e. have objects to upload or delete.
+    """
+    req = request.json_body
+    desk_dict = dict(((client_id, range_id), (count, toc_hash)) for client_id, range_id, count, toc_hash in req)
+    server_dict = dict()
+    range_list = list(desk_dict.keys())
+    for i in range(0, len(range_list), TOC_CHUNK_SIZE):
+        query = DBSession.query(ObjectTOC).filter(
+            tuple_(ObjectTOC.client_id, toc_range).in_(range_list[i:i + TOC_CHUNK_SIZE]),
+            ObjectTOC.marked_for_deletion == False)
+        for client_id, range_id, count, toc_hash in toc_summaries(query):
+            server_dict[(client_id, range_id)] = (count, toc_hash)
+    return [list(key) for key in range_list if desk_dict[key] != server_dict.get(key)]
+
+
 @view_config(route_name='diff_server', renderer='json', request_method='POST')
 def diff_server(request):
-
-    # todo: rework diff
-    tmp_list = DBSession.query(ObjectTOC).yield_per(10000).enable_eagerloads(False)
-    existing = [row2dict(entry) for entry in tmp_list]
     req = request.json_body
-    upload = list()
-    existing = [dict2ids(o) for o in existing]
-    log.error('before looking through giant list')
-    for entry in req:
-        if dict2ids(entry) not in existing:
-            upload.append(entry)
-    log.error('after looking through giant list')
-    return upload
+    existing = set((entry.client_id, entry.object_id) for entry in toc_ids_query(req))
+    return [entry for entry in req if (entry['client_id'], entry['object_id']) not in existing]
 
 
 @view_config(route_name='diff_group_server', renderer='json', request_method='POST')
@@ -358,14 +407,10 @@ def diff_group_server(request):
 
 @view_config(route_name='delete_sync_server', renderer='json', request_method='POST')
 def delete_sync_server(request):
-    non_existing = [row2dict(entry) for entry in DBSession.query(ObjectTOC).filter_by(marked_for_deletion=True)]
     req = request.json_body
-    for_deletion = list()
-    non_existing = [dict2ids(o) for o in non_existing]
-    for entry in req:
-        if dict2ids(entry) in non_existing:
-            for_deletion.append(entry)
-    return for_deletion
+    non_existing = set((entry.client_id, entry.object_id)
+                       for entry in toc_ids_query(req, ObjectTOC.marked_for_deletion == True))
+    return [entry for entry in req if (entry['client_id'], entry['object_id']) in non_existing]
 
 
 def make_request(path, cookies, req_type='get', json_data=None, data=None, files = None):
@@ -397,8 +442,6 @@ def diff_desk(request):
         request.response.status = HTTPNotFound.code
         return {'error': str("Try to login again")}
     settings = request.registry.settings
-    log.error('before getting objecttoc list in diff_desk')
-    existing = [row2dict(entry) for entry in DBSession.query(ObjectTOC)]
     central_server = settings['desktop']['central_server']
     path = central_server + 'sync/difference/server'
     # task_key = None
@@ -406,10 +449,23 @@ def diff_desk(request):
     task_key = req['task_key']
     task_status = TaskStatus.get_from_cache(task_key)
 
-    #todo: make request to server with existing objecttocs. server will return objecttocs for deletion
-    #todo: delete deleted objects
-
     cookies = json.loads(request.cookies.get('server_cookies'))
+
+    # Only entries of ranges differing from the server are compared in full, falling back to all entries
+    # if the server can't compare summaries.
+    log.error('before getting objecttoc list in diff_desk')
+    toc_query = DBSession.query(ObjectTOC)
+    ranges = make_request(central_server + 'sync/difference/server/summary', cookies, 'post',
+                          toc_summaries(toc_query))
+    if ranges.status_code == 200:
+        range_list = [tuple(key) for key in ranges.json()]
+        existing = list()
+        for i in range(0, len(range_list), TOC_CHUNK_SIZE):
+            existing.extend(row2dict(entry) for entry in toc_query.filter(
+                tuple_(ObjectTOC.client_id, toc_range).in_(range_list[i:i + TOC_CHUNK_SIZE])))
+    else:
+        existing = [row2dict(entry) for entry in toc_query]
+
     server = make_request(path, cookies, 'post', existing).json()
     task_status.set(3, 20, "Recieved list of objects for uploading", "")
     for_deletion = make_request(central_server + 'sync/delete/server', cookies, 'post', existing)
@@ -199,6 +199,8 @@ def edit_translationatom(request):
             str(translationatom.locale_id))
         CACHE.rem(key)
         translationatom.content = content
+        if translationatom.parent.type == 'Service':
+            TranslationGist.invalidate_service()
         request.response.status = HTTPOk.code
         return response
     request.response.status = HTTPNotFound.code
@@ -241,6 +243,8 @@ def create_translationatom(request):
                                               content=content)
             DBSession.add(translationatom)
             DBSession.flush()
+            if parent.type == 'Service':
+                TranslationGist.invalidate_service()
             if not object_id:
                 basegroups = []
                 basegroups += [DBSession.query(BaseGroup).filter_by(name="Can edit translationatom").first()]
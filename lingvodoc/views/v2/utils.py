@@ -10,15 +10,18 @@ from lingvodoc.models import (
     LexicalEntry,
     Entity,
     Language,
+    Locale,
     Organization,
+    PublishingEntity,
     User,
     UserBlobs,
     TranslationAtom,
     TranslationGist,
-    categories
+    categories,
+    user_to_organization_association
 )
 
-from sqlalchemy import and_
+from sqlalchemy import and_, tuple_
 
 from pyramid.request import Request
 
@@ -27,17 +30,22 @@ from sqlalchemy.orm import joinedload
 
 #import swiftclient.client as swiftclient
 
-from collections import deque
+from collections import defaultdict
 import base64
+import contextlib
 import datetime
+import itertools
 from hashlib import md5
 import json
+import mmap
 import os
 import os.path
 from pathvalidate import sanitize_filename
 import shutil
 import traceback
 import urllib
+import urllib.parse
+import urllib.request
 
 from pyramid.httpexceptions import (
     HTTPBadRequest,
@@ -169,48 +177,129 @@ def group_by_languages(dicts, request):
     return all_languages_with_dicts(dicts, request) #languages
 
 
+def serialize_dictionary(dictionary, translation):
+    """
+    Serializes dictionary in the same way as the dictionary view does.
+    """
+    result = dict()
+    result['parent_client_id'] = dictionary.parent_client_id
+    result['parent_object_id'] = dictionary.parent_object_id
+    result['translation_gist_client_id'] = dictionary.translation_gist_client_id
+    result['translation_gist_object_id'] = dictionary.translation_gist_object_id
+    result['client_id'] = dictionary.client_id
+    result['object_id'] = dictionary.object_id
+    result['state_translation_gist_client_id'] = dictionary.state_translation_gist_client_id
+    result['state_translation_gist_object_id'] = dictionary.state_translation_gist_object_id
+    result['category'] = categories.get(dictionary.category)
+    result['created_at'] = dictionary.created_at
+    result['domain'] = dictionary.domain
+    result['marked_for_deletion'] = dictionary.marked_for_deletion
+    result['additional_metadata'] = dictionary.additional_metadata
+    result['translation'] = translation
+    return result
+
+
+def dictionaries_info(dictionaries, locale_id):
+    """
+    Serializes a list of dictionaries with translations fetched at once.
+    """
+    translation_dict = TranslationGist.get_translations(
+        [(dictionary.translation_gist_client_id, dictionary.translation_gist_object_id)
+            for dictionary in dictionaries],
+        locale_id)
+    return [
+        serialize_dictionary(dictionary, translation_dict[
+            (dictionary.translation_gist_client_id, dictionary.translation_gist_object_id)])
+        for dictionary in dictionaries]
+
+
+def organization_info(organization, user_id_list):
+    """
+    Serializes organization in the same way as the organization view does.
+    """
+    result = dict()
+    result['name'] = organization.name
+    result['about'] = organization.about
+    result['users'] = user_id_list
+    additional_metadata = organization.additional_metadata
+    if additional_metadata is None:
+        additional_metadata = dict()
+    result['additional_metadata'] = additional_metadata
+    admins = list()
+    if additional_metadata.get('admins'):
+        admins = additional_metadata['admins']
+    result['admin'] = admins
+    return result
+
+
+def participated_users(dictionaries):
+    """
+    Gets ids of users who participated in given dictionaries, i.e. their creators and authors of published
+    lexical entries and entities in their published perspectives, as a dictionary by dictionary ids.
+    """
+    dictionary_id_list = [(dictionary.client_id, dictionary.object_id) for dictionary in dictionaries]
+    if not dictionary_id_list:
+        return {}
+
+    client_dict = defaultdict(set)
+    for dictionary in dictionaries:
+        client_dict[(dictionary.client_id, dictionary.object_id)].add(dictionary.client_id)
+
+    published_client_id, published_object_id = TranslationGist.get_service_gist_id('Published')
+
+    author_query = DBSession.query(
+        DictionaryPerspective.parent_client_id,
+        DictionaryPerspective.parent_object_id,
+        LexicalEntry.client_id,
+        Entity.client_id).join(LexicalEntry, and_(
+            LexicalEntry.parent_client_id == DictionaryPerspective.client_id,
+            LexicalEntry.parent_object_id == DictionaryPerspective.object_id)).join(Entity, and_(
+            Entity.parent_client_id == LexicalEntry.client_id,
+            Entity.parent_object_id == LexicalEntry.object_id)).join(Entity.publishingentity).filter(
+        tuple_(DictionaryPerspective.parent_client_id, DictionaryPerspective.parent_object_id).in_(
+            dictionary_id_list),
+        DictionaryPerspective.marked_for_deletion == False,
+        DictionaryPerspective.state_translation_gist_client_id == published_client_id,
+        DictionaryPerspective.state_translation_gist_object_id == published_object_id,
+        LexicalEntry.marked_for_deletion == False,
+        Entity.marked_for_deletion == False,
+        PublishingEntity.published == True).distinct()
+
+    for dictionary_client_id, dictionary_object_id, entry_client_id, entity_client_id in author_query:
+        client_dict[(dictionary_client_id, dictionary_object_id)].update((entry_client_id, entity_client_id))
+
+    user_id_dict = dict(DBSession.query(Client.id, Client.user_id).filter(
+        Client.id.in_(set.union(*client_dict.values()))).all())
+
+    return {
+        dictionary_id: set(user_id_dict[client_id] for client_id in client_set if client_id in user_id_dict)
+        for dictionary_id, client_set in client_dict.items()}
+
+
 def group_by_organizations(dicts, request):
-        dicts_with_users = []
-        for dct in dicts:
-            users = []
-            for client in participated_clients_list(dct, request):
-                user = DBSession.query(User).join(Client).filter_by(id = client).first()
-                if user not in users:
-                    users += [user]
-            dicts_with_users += [(dct.object_id, dct.client_id, users)]
-        organizations = []
-        for organization in DBSession.query(Organization).filter_by(marked_for_deletion=False).all():
-            dictionaries = []
-            for dct in dicts_with_users:
-                for user in dct[2]:
-                    if user in organization.users:
-                        dictionaries += [dct]
-            path = request.route_url('organization',
-                 organization_id=organization.id)
-            subreq = Request.blank(path)
-            subreq.method = 'GET'
-            subreq.headers = request.headers
-            resp = request.invoke_subrequest(subreq)
-            if 'error' not in resp.json:
-                org = resp.json
-
-                dictstemp = [{'client_id': o[1], 'object_id': o[0]} for o in dictionaries]
-                dictionaries = dicts
-                if dictstemp:
-                    prevdicts = dictionaries\
-                        .filter_by(client_id=dictstemp[0]['client_id'],
-                                   object_id=dictstemp[0]['object_id'])
-                    dictstemp.remove(dictstemp[0])
-                    for dicti in dictstemp:
-                        prevdicts = prevdicts.subquery().select()
-                        prevdicts = dictionaries.filter_by(client_id=dicti['client_id'], object_id=dicti['object_id'])\
-                            .union_all(prevdicts)
-
-                    dictionaries = prevdicts
-
-                org['dicts'] = dictionaries
-                organizations += [org]
-        return organizations
+    """
+    Groups dictionaries by organizations whose users participated in them, dictionaries of each organization
+    are given as a list under its 'dicts' key.
+    """
+    dictionaries = dicts.all()
+    user_dict = participated_users(dictionaries)
+
+    organization_user_dict = defaultdict(list)
+    for user_id, organization_id in DBSession.query(
+            user_to_organization_association.c.user_id,
+            user_to_organization_association.c.organization_id).all():
+        organization_user_dict[organization_id].append(user_id)
+
+    organizations = []
+    for organization in DBSession.query(Organization).filter_by(marked_for_deletion=False).all():
+        user_id_list = organization_user_dict.get(organization.id, [])
+        user_id_set = set(user_id_list)
+        org = organization_info(organization, user_id_list)
+        org['dicts'] = [
+            dictionary for dictionary in dictionaries
+            if user_dict.get((dictionary.client_id, dictionary.object_id), set()) & user_id_set]
+        organizations += [org]
+    return organizations
 
 
 def language_info(lang, request):
@@ -236,18 +325,46 @@ def language_info(lang, request):
     return result
 
 
-def tree_insert(tree, item, lang_to_dict_mapping, request):
+def language_tree(dicts, locale_id):
+    """
+    Builds tree of non-deleted languages with given dictionaries, either a query or a list, omitting languages
+    without dictionaries in their subtrees.
+
+    Languages and dictionaries are loaded in one query each and their translations are fetched together, tree
+    is then assembled by linking each language to its parent.
+    """
     def row2dict(r): return {c.name: getattr(r, c.name) for c in r.__table__.columns}
 
-    def construct_node(i):
+    if isinstance(dicts, list):
+        dictionary_list = dicts
+    else:
+        dictionary_list = dicts.join(Language, and_(
+            Dictionary.parent_client_id == Language.client_id,
+            Dictionary.parent_object_id == Language.object_id)).all()
+
+    language_list = DBSession.query(Language).filter_by(marked_for_deletion=False).all()
+
+    locale_set = set(DBSession.query(Locale.parent_client_id, Locale.parent_object_id).distinct().all())
+
+    translation_dict = TranslationGist.get_translations(
+        [(i.translation_gist_client_id, i.translation_gist_object_id)
+            for i in itertools.chain(dictionary_list, language_list)],
+        locale_id)
+
+    lang_to_dict_mapping = defaultdict(list)
+    for i in dictionary_list:
+        dictionary = row2dict(i)
+        dictionary['translation'] = translation_dict[(i.translation_gist_client_id, i.translation_gist_object_id)]
+        dictionary['category'] = categories[i.category]
+        lang_to_dict_mapping[(i.parent_client_id, i.parent_object_id)].append(dictionary)
+
+    node_dict = dict()
+    for i in language_list:
         node = row2dict(i)
-        if lang_to_dict_mapping.get(i.client_id) and lang_to_dict_mapping[i.client_id].get(i.object_id):
-            node['dicts'] = lang_to_dict_mapping[i.client_id][i.object_id]
-        else:
-            node['dicts'] = []
+        node['dicts'] = lang_to_dict_mapping.get((i.client_id, i.object_id), [])
         node['contains'] = []
-        node['translation'] = i.get_translation(request.cookies.get('locale_id', 1))
-        node['locale_exist'] = True if i.locale else False
+        node['translation'] = translation_dict[(i.translation_gist_client_id, i.translation_gist_object_id)]
+        node['locale_exist'] = (i.client_id, i.object_id) in locale_set
         node['level'] = 'language'
         del node['additional_metadata']
         del node['marked_for_deletion']
@@ -255,86 +372,32 @@ def tree_insert(tree, item, lang_to_dict_mapping, request):
             del node['parent_client_id']
         if not node['parent_object_id']:
             del node['parent_object_id']
-        return node
+        node_dict[(i.client_id, i.object_id)] = node
 
-    if not tree:
-        tree = construct_node(item)
+    # Linking languages to their parents, languages under deleted ones are left out.
 
-    if tree['client_id'] == item.parent_client_id and tree['object_id'] == item.parent_object_id:
-        tree['contains'].append(construct_node(item))
-        return tree
-
-    for i in tree['contains']:
-        if i['client_id'] == item.parent_client_id and i['object_id'] == item.parent_object_id:
-            i['contains'].append(construct_node(item))
-        else:
-            i = tree_insert(i, item, lang_to_dict_mapping, request)
-    return tree
+    root_list = []
+    for i in language_list:
+        node = node_dict[(i.client_id, i.object_id)]
+        if i.parent_client_id is None and i.parent_object_id is None:
+            root_list.append(node)
+        elif (i.parent_client_id, i.parent_object_id) in node_dict:
+            node_dict[(i.parent_client_id, i.parent_object_id)]['contains'].append(node)
 
+    # Removing languages without dictionaries, children are processed before their parents.
 
-def tree_in_breadth(node, lang_to_dict_mapping, request):
-    result = dict()
+    node_list = list(root_list)
+    for node in node_list:
+        node_list.extend(node['contains'])
 
-    stack = deque()
-    stack.append(node)
-
-    while stack:
-        current_node = stack.pop()
-        result = tree_insert(result, current_node, lang_to_dict_mapping, request)
-        for i in current_node.language:
-            stack.appendleft(i)
-
-    def cleanup_empty_langs(obj):
-        if isinstance(obj, dict):
-            if obj.get('level') == 'language':
-                if obj.get('dicts') or obj.get('contains'):
-                    obj = {key: cleanup_empty_langs(value) for key, value in obj.items()}
-                # don't know how to double check efficiently
-                if obj.get('dicts') or obj.get('contains'):
-                    return obj
-                else:
-                    del obj
-                    return None
-            else:
-                return obj
-        elif isinstance(obj, list):
-            res = []
-            for item in obj:
-                t = cleanup_empty_langs(item)
-                if t:
-                    res.append(t)
-            return res
-        return obj
+    for node in reversed(node_list):
+        node['contains'] = [child for child in node['contains'] if child['dicts'] or child['contains']]
 
-    return cleanup_empty_langs(result)
+    return [node for node in root_list if node['dicts'] or node['contains']]
 
 
 def all_languages_with_dicts(dicts, request):
-    def row2dict(r): return {c.name: getattr(r, c.name) for c in r.__table__.columns}
-    result = list()
-    lang_to_dict_mapping = dict()
-    ds = dicts.join(Language, and_(Dictionary.parent_client_id == Language.client_id, Dictionary.parent_object_id == Language.object_id)).all()
-    for i in ds:
-        if i.parent_client_id not in lang_to_dict_mapping:
-            lang_to_dict_mapping[i.parent_client_id] = dict()
-        if i.parent_object_id not in lang_to_dict_mapping[i.parent_client_id]:
-            lang_to_dict_mapping[i.parent_client_id][i.parent_object_id] = list()
-        dictionary = row2dict(i)
-        dictionary['translation'] = i.get_translation(request.cookies.get('locale_id', 1))
-        dictionary['category'] = categories[i.category]
-        # del dictionary['created_at']
-        # del dictionary['domain']
-        # del dictionary['marked_for_deletion']
-        lang_to_dict_mapping[i.parent_client_id][i.parent_object_id].append(dictionary)
-
-    top_level_langs = DBSession.query(Language).filter_by(marked_for_deletion=False, parent=None).all()
-
-    for lang in top_level_langs:
-        l = tree_in_breadth(lang, lang_to_dict_mapping, request)
-        if l:
-            result.append(l)
-
-    return result
+    return language_tree(dicts, request.cookies.get('locale_id', 1))
 
 
 def language_with_dicts(lang, dicts, request):
@@ -411,38 +474,6 @@ def openstack_upload(settings, file, file_name, content_type,  container_name):
     return str(obje)
 
 
-def participated_clients_list(dictionary, request):
-    clients = [dictionary.client_id]
-    for persp in dictionary.dictionaryperspective:
-        if persp.state.lowercase() == 'published':
-            path = request.route_url('lexical_entries_published',
-                                     dictionary_client_id = dictionary.client_id,
-                                     dictionary_object_id = dictionary.object_id,
-                                     perspective_client_id = persp.client_id,
-                                     perspective_object_id = persp.object_id)
-            subreq = Request.blank(path)
-            subreq.method = 'GET'
-            subreq.headers = request.headers
-            resp = request.invoke_subrequest(subreq)
-            if not 'error' in resp.json:
-                for entry in resp.json['lexical_entries']:
-                    clients += participated_clients_rec(entry)
-    return clients
-
-
-def participated_clients_rec(entry):
-    clients = []
-    if entry:
-        if 'level' in entry:
-            if 'publish' not in entry['level']:
-                clients += [entry['client_id']]
-                if 'contains' in entry:
-                    if entry['contains']:
-                        for ent in entry['contains']:
-                            clients += participated_clients_rec(ent)
-    return clients
-
-
 def remove_deleted(lst):
     entries = []
     if lst:
@@ -702,23 +733,74 @@ def anonymous_userid(request):
     unique_string = "unauthenticated_%s_%s" % (ip, useragent)
     return base64.b64encode(md5(unique_string.encode('utf-8')).digest())[:7]
 
+def storage_path(storage_config, url):
+    """
+    Gets path of a file from storage by its URL if the file is in the local disk storage, or None
+    otherwise.
+    """
+
+    if storage_config.get('type', 'disk') != 'disk':
+        return None
+
+    storage_url_prefix = storage_config['prefix'] + storage_config['static_route']
+
+    if not url.startswith(storage_url_prefix):
+        return None
+
+    base_path = os.path.normpath(storage_config['path'])
+    relative_path = url[len(storage_url_prefix):]
+
+    # Stored URLs are usually not quoted, but we also accept quoted ones, while not allowing paths
+    # outside of the storage.
+
+    for candidate_path in (relative_path, urllib.parse.unquote(relative_path)):
+
+        file_path = os.path.normpath(os.path.join(base_path, *candidate_path.split('/')))
+
+        if file_path.startswith(base_path + os.sep) and os.path.isfile(file_path):
+            return file_path
+
+    return None
+
+
 def storage_file(storage_config, url):
     """
     Given a URL of a file from storage, first tries to open it as a file from local storage, and
     then as a download stream.
     """
 
-    storage_url_prefix = 'http://lingvodoc.ispras.ru/objects/'
+    file_path = storage_path(storage_config, url)
 
-    if url.startswith(storage_url_prefix):
+    if file_path:
+        return open(file_path, 'rb')
 
-        storage_file_path = os.path.join('/root/lingvodoc-extra/backend_storage',
-            url[len(storage_url_prefix):])
+    return urllib.request.urlopen(urllib.parse.quote(url, safe = '/:'))
 
-        if os.path.exists(storage_file_path):
-            return open(storage_file_path, 'rb')
 
-    return urllib.request.urlopen(urllib.parse.quote(url, safe = '/:'))
+@contextlib.contextmanager
+def storage_buffer(storage_config, url):
+    """
+    Given a URL of a file from storage, provides its contents as a read-only bytes-like buffer, memory
+    mapped if the file is in the local storage and downloaded otherwise.
+    """
+
+    file_path = storage_path(storage_config, url)
+
+    if file_path is None or os.path.getsize(file_path) <= 0:
+
+        with storage_file(storage_config, url) as stream:
+            yield stream.read()
+
+        return
+
+    with open(file_path, 'rb') as storage_stream:
+        buffer = mmap.mmap(storage_stream.fileno(), 0, access = mmap.ACCESS_READ)
+
+    try:
+        yield buffer
+
+    finally:
+        buffer.close()
 
 
 def update_metadata(dbobject, new_metadata=None):
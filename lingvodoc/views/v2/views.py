@@ -234,14 +234,12 @@ def fix_groups(request):
     return {}
 
 def translation_service_search(searchstring):
-    translationatom = DBSession.query(TranslationAtom)\
-        .join(TranslationGist).\
-        filter(TranslationAtom.content == searchstring,
-               TranslationAtom.locale_id == 2,
-               TranslationGist.type == 'Service')\
-        .order_by(TranslationAtom.client_id)\
-        .first()
-    response = translationgist_contents(translationatom.parent)
+    try:
+        client_id, object_id = TranslationGist.get_service_gist_id(searchstring)
+    except KeyError:
+        return {'error': str("No result")}
+    translationgist = DBSession.query(TranslationGist).filter_by(client_id=client_id, object_id=object_id).first()
+    response = translationgist_contents(translationgist)
     return response
 
 def add_role(name, subject, action, admin, perspective_default=False, dictionary_default=False):
@@ -283,19 +281,9 @@ def main_get(request):
 
 @view_config(route_name='all_statuses', renderer='json', request_method='GET')
 def all_statuses(request):
-    from pyramid.request import Request
-    import json
-
     response = list()
     for status in ['WiP', 'Published', 'Limited access', 'Hidden']:
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': status}
-        headers = {'Cookie': request.headers['Cookie']}
-        subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-        response.append(resp.json)
+        response.append(translation_service_search(status))
     request.response.status = HTTPOk.code
     return response
 
@@ -486,19 +474,9 @@ def corpora_fields(request):
 
 @view_config(route_name='all_data_types', renderer='json', request_method='GET')
 def all_data_types(request):
-    from pyramid.request import Request
-    import json
-
     response = list()
     for data_type in ['Text', 'Image', 'Sound', 'Markup', 'Link', 'Grouping Tag']:
-        subreq = Request.blank('/translation_service_search')
-        subreq.method = 'POST'
-        subreq.headers = request.headers
-        subreq.json = {'searchstring': data_type}
-        # headers = {'Cookie': request.headers['Cookie']}
-        # subreq.headers = headers
-        resp = request.invoke_subrequest(subreq)
-        response.append(resp.json)
+        response.append(translation_service_search(data_type))
     request.response.status = HTTPOk.code
     return response
 
@@ -36,5 +36,6 @@ setup(name='lingvodoc',
       main = lingvodoc:main
       [console_scripts]
       initialize_lingvodoc_db = lingvodoc.scripts.initializedb:main
+      backfill_statistics_rollup = lingvodoc.scripts.statistics_rollup:main
       """,
       )
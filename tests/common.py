@@ -34,3 +34,104 @@ class initValuesFactory:
                  "Can view unpublished lexical entries": users,
                  "Can view published lexical entries": users}
         }
+
+
+def find_gist_id(content):
+    """
+    Gets id of a translation gist by its English content, e.g. 'WiP' or 'Grouping Tag'.
+    """
+    from lingvodoc.models import DBSession, TranslationAtom
+
+    atom = DBSession.query(TranslationAtom).filter_by(content=content, locale_id=2).first()
+    return atom.parent_client_id, atom.parent_object_id
+
+
+def create_perspective_data(client_id, field_list):
+    """
+    Creates a dictionary with a perspective having fields specified by (name, data type) pairs of English
+    contents of translation gists, returns ids of the perspective and of its fields.
+
+    Should be called inside a transaction.
+    """
+    from lingvodoc.models import (
+        DBSession,
+        Dictionary,
+        DictionaryPerspective,
+        DictionaryPerspectiveToField,
+        Field,
+        Language
+    )
+
+    state_id = find_gist_id('WiP')
+    name_id = find_gist_id('Word')
+    language = DBSession.query(Language).first()
+
+    dictionary = Dictionary(client_id=client_id,
+                            translation_gist_client_id=name_id[0],
+                            translation_gist_object_id=name_id[1],
+                            parent_client_id=language.client_id,
+                            parent_object_id=language.object_id,
+                            state_translation_gist_client_id=state_id[0],
+                            state_translation_gist_object_id=state_id[1])
+    DBSession.add(dictionary)
+    DBSession.flush()
+
+    perspective = DictionaryPerspective(client_id=client_id,
+                                        translation_gist_client_id=name_id[0],
+                                        translation_gist_object_id=name_id[1],
+                                        parent_client_id=dictionary.client_id,
+                                        parent_object_id=dictionary.object_id,
+                                        state_translation_gist_client_id=state_id[0],
+                                        state_translation_gist_object_id=state_id[1])
+    DBSession.add(perspective)
+    DBSession.flush()
+
+    field_id_list = list()
+    for position, (name, data_type) in enumerate(field_list, 1):
+        field_name_id = find_gist_id(name)
+        data_type_id = find_gist_id(data_type)
+        field = Field(client_id=client_id,
+                      translation_gist_client_id=field_name_id[0],
+                      translation_gist_object_id=field_name_id[1],
+                      data_type_translation_gist_client_id=data_type_id[0],
+                      data_type_translation_gist_object_id=data_type_id[1])
+        DBSession.add(field)
+        DBSession.add(DictionaryPerspectiveToField(client_id=client_id,
+                                                   parent=perspective,
+                                                   field=field,
+                                                   position=position))
+        DBSession.flush()
+        field_id_list.append((field.client_id, field.object_id))
+
+    return (perspective.client_id, perspective.object_id), field_id_list
+
+
+def create_entry_data(client_id, perspective_id, entity_list):
+    """
+    Creates a lexical entry with entities specified by (field id, content) pairs or by (field id, content,
+    creation time) triples, returns id of the lexical entry.
+
+    Should be called inside a transaction.
+    """
+    from lingvodoc.models import DBSession, Entity, LexicalEntry
+
+    entry = LexicalEntry(client_id=client_id,
+                         parent_client_id=perspective_id[0],
+                         parent_object_id=perspective_id[1])
+    DBSession.add(entry)
+    DBSession.flush()
+
+    for entity_info in entity_list:
+        field_id, content = entity_info[:2]
+        kwargs = {'created_at': entity_info[2]} if len(entity_info) > 2 else {}
+        entity = Entity(client_id=client_id,
+                        parent_client_id=entry.client_id,
+                        parent_object_id=entry.object_id,
+                        field_client_id=field_id[0],
+                        field_object_id=field_id[1],
+                        content=content,
+                        **kwargs)
+        DBSession.add(entity)
+    DBSession.flush()
+
+    return entry.client_id, entry.object_id
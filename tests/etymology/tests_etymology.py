@@ -0,0 +1,178 @@
+# 
+# NOTE
+#
+# See information on how tests are organized and how they should work in the tests' package __init__.py file
+# (currently lingvodoc/tests/__init__.py).
+#
+
+
+import transaction
+
+from lingvodoc.models import (
+    Client,
+    DBSession,
+    Entity,
+    EtymologyGroup,
+    invalidate_etymology_groups,
+    LexicalEntry
+)
+from lingvodoc.utils.etymology import (
+    find_all_tags,
+    find_group_entries,
+    materialize_group
+)
+
+from tests.tests import MyTestCase
+from tests.common import create_entry_data, create_perspective_data
+
+
+class EtymologyTestCase(MyTestCase):
+    """
+    Common parent class for etymology test cases, creates a perspective with lexical entries connected by
+    grouping tags.
+    """
+
+    def setUp(self):
+        super(EtymologyTestCase, self).setUp()
+
+        with transaction.manager:
+            client_id = DBSession.query(Client.id).order_by(Client.id).first()[0]
+
+            self.perspective_id, (self.field_id,) = create_perspective_data(
+                client_id, [('Etymology', 'Grouping Tag')])
+
+            # Entries 1, 2 and 3 are connected through tags 'a' and 'b', entry 4 is separate.
+
+            self.entry_id_list = [
+                create_entry_data(client_id, self.perspective_id, entity_list)
+                for entity_list in [
+                    [(self.field_id, 'a')],
+                    [(self.field_id, 'a'), (self.field_id, 'b')],
+                    [(self.field_id, 'b')],
+                    [(self.field_id, 'c')]]]
+
+    def get_entry(self, index):
+        return DBSession.query(LexicalEntry).filter_by(
+            client_id=self.entry_id_list[index][0],
+            object_id=self.entry_id_list[index][1]).one()
+
+
+class TagClosureTest(EtymologyTestCase):
+    """
+    Tests resolution of etymology groups by transitive closure of grouping tags, see
+    lingvodoc.utils.etymology.tag_closure.
+    """
+
+    def find_tags(self, index, accepted=False):
+        return find_all_tags(self.get_entry(index), self.field_id[0], self.field_id[1], accepted)
+
+    def test_closure(self):
+        with transaction.manager:
+            self.assertEqual(self.find_tags(0), {'a', 'b'})
+            self.assertEqual(self.find_tags(2), {'a', 'b'})
+            self.assertEqual(self.find_tags(3), {'c'})
+
+    def test_closure_deleted(self):
+        with transaction.manager:
+            tag = DBSession.query(Entity).filter_by(
+                parent_client_id=self.entry_id_list[1][0],
+                parent_object_id=self.entry_id_list[1][1],
+                content='b').one()
+            tag.marked_for_deletion = True
+
+        with transaction.manager:
+            self.assertEqual(self.find_tags(0), {'a'})
+            self.assertEqual(self.find_tags(2), {'b'})
+
+    def test_closure_accepted(self):
+        with transaction.manager:
+            for entity in DBSession.query(Entity).filter_by(
+                    field_client_id=self.field_id[0], field_object_id=self.field_id[1]):
+                entity.publishingentity.accepted = entity.content != 'b' or (
+                    entity.parent_client_id, entity.parent_object_id) != self.entry_id_list[1]
+
+        with transaction.manager:
+            self.assertEqual(self.find_tags(0, True), {'a'})
+            self.assertEqual(self.find_tags(2, True), {'b'})
+            self.assertEqual(self.find_tags(0, False), {'a', 'b'})
+
+
+class EtymologyGroupTest(EtymologyTestCase):
+    """
+    Tests materialization of etymology groups and their invalidation on changes of grouping tags, see
+    lingvodoc.models.EtymologyGroup.
+    """
+
+    def find_group(self, index):
+        return set(
+            (entry.client_id, entry.object_id)
+            for entry in find_group_entries(self.get_entry(index), self.field_id[0], self.field_id[1]))
+
+    def group_row_list(self):
+        return sorted(tuple(row) for row in DBSession.query(
+            EtymologyGroup.entry_client_id, EtymologyGroup.entry_object_id,
+            EtymologyGroup.group_client_id, EtymologyGroup.group_object_id).filter_by(
+            field_client_id=self.field_id[0], field_object_id=self.field_id[1]))
+
+    def test_materialize(self):
+        with transaction.manager:
+            self.assertEqual(self.find_group(1), set(self.entry_id_list[:3]))
+
+            # Only the looked up group is materialized, as a whole, identified by its least lexical entry.
+
+            row_list = self.group_row_list()
+            self.assertEqual(len(row_list), 3)
+            self.assertEqual(set(tuple(row[:2]) for row in row_list), set(self.entry_id_list[:3]))
+            self.assertEqual(set(tuple(row[2:]) for row in row_list), {min(self.entry_id_list[:3])})
+
+            # Materializing the same group again, e.g. by a concurrent lookup, keeps the same rows.
+
+            group_id = materialize_group(self.entry_id_list[2], self.field_id[0], self.field_id[1])
+            self.assertEqual(group_id, min(self.entry_id_list[:3]))
+            self.assertEqual(self.group_row_list(), row_list)
+
+            self.assertEqual(self.find_group(3), {self.entry_id_list[3]})
+            self.assertEqual(len(self.group_row_list()), 4)
+
+    def test_invalidate_flushed(self):
+        with transaction.manager:
+            self.find_group(0)
+            self.find_group(3)
+
+        # Connecting the separate lexical entry, materialized groups of both sides become out of date.
+
+        with transaction.manager:
+            DBSession.add(Entity(client_id=self.entry_id_list[2][0],
+                                 parent_client_id=self.entry_id_list[2][0],
+                                 parent_object_id=self.entry_id_list[2][1],
+                                 field_client_id=self.field_id[0],
+                                 field_object_id=self.field_id[1],
+                                 content='c'))
+            DBSession.flush()
+            self.assertEqual(self.group_row_list(), [])
+
+        with transaction.manager:
+            self.assertEqual(self.find_group(0), set(self.entry_id_list))
+            self.assertEqual(self.find_group(3), set(self.entry_id_list))
+
+    def test_invalidate_explicit(self):
+        with transaction.manager:
+            self.find_group(0)
+
+        # Changes bypassing flush are not noticed automatically and require explicit invalidation.
+
+        with transaction.manager:
+            tag = DBSession.query(Entity).filter_by(
+                parent_client_id=self.entry_id_list[1][0],
+                parent_object_id=self.entry_id_list[1][1],
+                content='b').one()
+            DBSession.query(Entity).filter_by(client_id=tag.client_id, object_id=tag.object_id).update(
+                {'marked_for_deletion': True}, synchronize_session=False)
+            self.assertEqual(len(self.group_row_list()), 3)
+
+            invalidate_etymology_groups(DBSession, [tag])
+            self.assertEqual(self.group_row_list(), [])
+
+        with transaction.manager:
+            self.assertEqual(self.find_group(0), set(self.entry_id_list[:2]))
+            self.assertEqual(self.find_group(2), {self.entry_id_list[2]})
@@ -0,0 +1,143 @@
+#
+# NOTE
+#
+# These tests check numerical computations of phonology analysis on a synthetic sound and do not require a
+# database, so they are based on unittest.TestCase and not on tests.tests.MyTestCase.
+#
+
+
+import array
+import math
+import unittest
+
+import numpy
+import pydub
+
+from lingvodoc.views.v2.phonology import (
+    AudioPraatLike,
+    burg,
+    burg_batch,
+    get_kaiser_window
+)
+
+
+def synthetic_sound(channel_count = 1, frame_rate = 22050, duration = 0.5):
+    """
+    Generates a vowel-like sound: an impulse train with pitch of 120 Hz passed through resonators at
+    formant frequencies of 700, 1220 and 2600 Hz, with a bit of noise so that there are no silent frames.
+    """
+
+    frame_count = int(frame_rate * duration)
+    signal = numpy.zeros(frame_count)
+    signal[::frame_rate // 120] = 1.0
+
+    for frequency, bandwidth in [(700, 130), (1220, 70), (2600, 160)]:
+
+        r = math.exp(-math.pi * bandwidth / frame_rate)
+        a1 = 2 * r * math.cos(2 * math.pi * frequency / frame_rate)
+        a2 = -r ** 2
+
+        filtered = numpy.zeros(frame_count)
+
+        for i in range(frame_count):
+            filtered[i] = (
+                signal[i] +
+                (a1 * filtered[i - 1] if i >= 1 else 0.0) +
+                (a2 * filtered[i - 2] if i >= 2 else 0.0))
+
+        signal = filtered
+
+    signal += numpy.random.RandomState(0).normal(0.0, 1e-3 * numpy.abs(signal).max(), frame_count)
+    signal = numpy.round(signal / numpy.abs(signal).max() * 16000).astype(numpy.int16)
+
+    # Channels of a multichannel sound differ in amplitude.
+
+    sample_array = numpy.stack([signal // (j + 1) for j in range(channel_count)], axis = 1)
+
+    return pydub.AudioSegment(
+        data = array.array('h', sample_array.ravel().tolist()).tobytes(),
+        sample_width = 2, frame_rate = frame_rate, channels = channel_count)
+
+
+def reference_intensity(sound, step_index):
+    """
+    Computes intensity at a time step one sample at a time, as it was computed before vectorization.
+    """
+
+    window_list, window_sum = get_kaiser_window(sound.intensity_half_window_size)
+
+    sample_array = sound.intensity_sound.get_array_of_samples()
+    sample_sum = 0.0
+
+    channel_count = sound.intensity_sound.channels
+    amplitude_limit = sound.intensity_sound.max_possible_amplitude
+
+    sample_from = (step_index - 4) * sound.intensity_step_size * channel_count
+
+    for i in range(sound.intensity_window_size):
+        for j in range(channel_count):
+            sample = sample_array[sample_from + i * channel_count + j] / amplitude_limit
+            sample_sum += sample ** 2 * window_list[i]
+
+    intensity_ratio = sample_sum / (channel_count * window_sum) * 2.5e9
+    return -300 if intensity_ratio < 1e-30 else 10 * math.log10(intensity_ratio)
+
+
+class IntensityTest(unittest.TestCase):
+    """
+    Tests that intensity computed for all time steps at once is the same as intensity computed one time
+    step at a time.
+    """
+
+    def check_intensity(self, channel_count):
+        sound = AudioPraatLike(synthetic_sound(channel_count))
+        sound.init_intensity()
+
+        step_list = range(4, sound.intensity_step_count - 4)
+
+        numpy.testing.assert_allclose(
+            sound.intensity_array[4 : sound.intensity_step_count - 4],
+            [reference_intensity(sound, step_index) for step_index in step_list],
+            rtol = 1e-9)
+
+        self.assertTrue(numpy.isnan(sound.intensity_array[:4]).all())
+        self.assertTrue(numpy.isnan(sound.intensity_array[sound.intensity_step_count - 4:]).all())
+
+    def test_mono(self):
+        self.check_intensity(1)
+
+    def test_stereo(self):
+        self.check_intensity(2)
+
+
+class FormantTest(unittest.TestCase):
+    """
+    Tests that Linear Prediction coefficients and formants computed for many frames at once are the same as
+    those computed one frame at a time.
+    """
+
+    def test_burg(self):
+        sample_array = numpy.random.RandomState(0).normal(size = (8, 221))
+        a0_array, coefficient_array = burg_batch(sample_array, 10)
+
+        for samples, a0, coefficients in zip(sample_array, a0_array, coefficient_array):
+            reference_a0, reference_coefficients = burg(samples.tolist(), 10)
+
+            self.assertAlmostEqual(a0, reference_a0, delta = 1e-9 * abs(reference_a0))
+            numpy.testing.assert_allclose(coefficients, reference_coefficients, rtol = 1e-7, atol = 1e-12)
+
+    def test_formants(self):
+        sound = AudioPraatLike(synthetic_sound())
+        sound.init_formant_f()
+
+        begin_step, end_step = 4, sound.formant_step_count - 4
+        formant_array = sound.get_formants_batch(begin_step, end_step)
+
+        reference_sound = AudioPraatLike(synthetic_sound())
+
+        for step_index, formants in zip(range(begin_step, end_step), formant_array):
+            numpy.testing.assert_allclose(formants, reference_sound.get_formants(step_index), rtol = 1e-6)
+
+        # First formant is found close to the frequency of the first resonator.
+
+        self.assertTrue(numpy.abs(numpy.median(formant_array[:, 0]) - 700) < 100)
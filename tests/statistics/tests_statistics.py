@@ -0,0 +1,96 @@
+# 
+# NOTE
+#
+# See information on how tests are organized and how they should work in the tests' package __init__.py file
+# (currently lingvodoc/tests/__init__.py).
+#
+
+
+import datetime
+import time
+
+import transaction
+
+from lingvodoc.models import (
+    Client,
+    DBSession
+)
+from lingvodoc.utils.statistics import ROLLUP_DAY, stat_perspective
+
+from tests.tests import MyTestCase
+from tests.common import create_entry_data, create_perspective_data
+
+
+class StatisticsRollupTest(MyTestCase):
+    """
+    Tests that perspective statistics of day-aligned time intervals, which are gathered from the statistics
+    rollup, are the same as statistics gathered directly.
+    """
+
+    def setUp(self):
+        super(StatisticsRollupTest, self).setUp()
+
+        now = datetime.datetime.utcnow()
+        before = now - datetime.timedelta(days=3)
+
+        self.today = int(time.time() // ROLLUP_DAY * ROLLUP_DAY)
+
+        with transaction.manager:
+            client = DBSession.query(Client).order_by(Client.id).first()
+            self.client_id, self.user_id = client.id, client.user_id
+
+            self.perspective_id, (self.word_id, self.etymology_id) = create_perspective_data(
+                self.client_id, [('Word', 'Text'), ('Etymology', 'Grouping Tag')])
+
+            # Lexical entry with grouping tags both before and in the current day is counted in grouping
+            # tag statistics of either day.
+
+            create_entry_data(self.client_id, self.perspective_id, [
+                (self.word_id, 'word', now),
+                (self.etymology_id, 'a', before),
+                (self.etymology_id, 'b', now)])
+
+            create_entry_data(self.client_id, self.perspective_id, [
+                (self.word_id, 'word', before),
+                (self.etymology_id, 'a', now)])
+
+    def assertStatEqual(self, time_begin, time_end):
+        """
+        Checks that rollup statistics of a day-aligned time interval are the same as direct statistics of
+        the interval without its last second, which has no objects.
+        """
+        with transaction.manager:
+            rollup_stat = stat_perspective(self.perspective_id, time_begin, time_end)
+            direct_stat = stat_perspective(self.perspective_id, time_begin, time_end - 1)
+
+        self.assertNotIn('error', rollup_stat)
+        self.assertNotIn('error', direct_stat)
+        self.assertEqual(rollup_stat, direct_stat)
+
+        return rollup_stat
+
+    def test_rollup(self):
+        stat = self.assertStatEqual(self.today, self.today + 2 * ROLLUP_DAY)
+        self.assertEqual(stat[self.user_id]['entities']['total']['Etymology']['total'], 2)
+        self.assertEqual(stat[self.user_id]['entities']['total']['Word']['total'], 1)
+
+        stat = self.assertStatEqual(self.today - 5 * ROLLUP_DAY, self.today)
+        self.assertEqual(stat[self.user_id]['entities']['total']['Etymology']['total'], 1)
+        self.assertEqual(stat[self.user_id]['entities']['total']['Word']['total'], 1)
+
+        self.assertStatEqual(self.today - 5 * ROLLUP_DAY, self.today + 2 * ROLLUP_DAY)
+
+    def test_rollup_update(self):
+        self.assertStatEqual(self.today, self.today + 2 * ROLLUP_DAY)
+
+        # New objects make the rollup of the perspective out of date.
+
+        with transaction.manager:
+            create_entry_data(self.client_id, self.perspective_id, [
+                (self.word_id, 'word'),
+                (self.etymology_id, 'c')])
+
+        stat = self.assertStatEqual(self.today, self.today + 2 * ROLLUP_DAY)
+        self.assertEqual(stat[self.user_id]['lexical entries']['total'], 3)
+        self.assertEqual(stat[self.user_id]['entities']['total']['Etymology']['total'], 3)
+        self.assertEqual(stat[self.user_id]['entities']['total']['Word']['total'], 2)